@@ -0,0 +1,147 @@
+"""Runtime throughput benchmark.
+
+Drives the bot's own Bot API path with Telegram stubbed out: getUpdates
+responses are decoded by TracedRequest and turned into Update objects
+(Update.de_json), each update is dispatched as a task on the event loop,
+and answered with a sendMessage carrying an inline keyboard, whose
+parameters TracedRequest encodes and whose response it decodes. The HTTP
+layer is an in-process httpx.MockTransport with pre-encoded responses,
+so only our side of each call is measured. Each mode runs in its own
+process so the event loop policy and JSON codec are chosen at startup
+exactly as they are for the bot:
+
+    python bench.py                 # stdlib and fast runtime, side by side
+    python bench.py --updates 50000 --batch 100
+
+Updates per CPU-second is throughput per core; wall-clock rate is shown
+alongside for reference.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+TOKEN = '123456:BENCH'
+
+KEYBOARD = [
+    [('💬 Start Anonymous Chat', 'start_chat')],
+    [('❌ End Match', 'end_match')],
+    [('🔄 Restart Search', 'new_search')],
+]
+
+
+def _sample_update(update_id):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(4000000000 + update_id),
+            'from': {'id': 100000 + update_id % 5000, 'is_bot': False, 'first_name': 'Shopper',
+                     'language_code': 'en'},
+            'message': {
+                'message_id': update_id % 100000,
+                'date': 1700000000 + update_id,
+                'chat': {'id': 100000 + update_id % 5000, 'type': 'private', 'first_name': 'Shopper'},
+                'text': '🔍 Still searching for matches...\n\n📍 Search radius: 2 km',
+                'reply_markup': {'inline_keyboard': [[{'text': '🛑 Stop Searching', 'callback_data': 'stop_search'}]]},
+            },
+            'chat_instance': '-123456789',
+            'data': 'stop_search',
+        },
+    }
+
+
+def _sent_message(chat_id):
+    return {'message_id': 1, 'date': 1700000000, 'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 123456, 'is_bot': True, 'first_name': 'DeliveryShare'},
+            'text': 'Match Found!', 'reply_markup': {'inline_keyboard': [
+                [{'text': text, 'callback_data': data} for text, data in row] for row in KEYBOARD]}}
+
+
+def _telegram(payloads):
+    """An httpx transport answering getUpdates from `payloads` and every send with a canned message."""
+    import httpx
+
+    batches = iter(payloads)
+    sent = json.dumps({'ok': True, 'result': _sent_message(100000)}, ensure_ascii=False).encode()
+    empty = b'{"ok":true,"result":[]}'
+
+    def handle(request):
+        if request.url.path.endswith('/getUpdates'):
+            return httpx.Response(200, content=next(batches, empty))
+        return httpx.Response(200, content=sent)
+    return httpx.MockTransport(handle)
+
+
+async def _run(payloads):
+    from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+    from transport import TracedRequest
+
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data) for text, data in row]
+                                   for row in KEYBOARD])
+    transport = _telegram(payloads)
+    bot = Bot(TOKEN, request=TracedRequest(connection_pool_size=128, httpx_kwargs={'transport': transport}),
+              get_updates_request=TracedRequest(connection_pool_size=2, traced=False,
+                                                httpx_kwargs={'transport': transport}))
+    sent = 0
+
+    async def handle(update):
+        nonlocal sent
+        await asyncio.sleep(0)
+        await bot.send_message(
+            chat_id=update.effective_chat.id,
+            text='🎉 *Match Found!* \n\n📱 *App*: Zepto\n💰 *Your amount*: ₹180.00\n💰 *Their amount*: ₹240.00',
+            parse_mode='Markdown',
+            reply_markup=markup,
+        )
+        sent += 1
+
+    offset = 0
+    for _ in payloads:
+        # Bot.get_updates builds each Update with Update.de_json
+        updates = await bot.get_updates(offset=offset, timeout=0)
+        offset = updates[-1].update_id + 1
+        await asyncio.gather(*(handle(update) for update in updates))
+    return sent
+
+
+def run_mode(n_updates, batch_size):
+    """Run the workload in this process and return a result dict."""
+    import speedups
+
+    payloads = [
+        json.dumps({'ok': True, 'result': [_sample_update(i) for i in range(start, min(start + batch_size, n_updates))]},
+                   ensure_ascii=False).encode()
+        for start in range(0, n_updates, batch_size)
+    ]
+    wall, cpu = time.perf_counter(), time.process_time()
+    sent = speedups.run(_run(payloads))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {**speedups.describe(), 'updates': sent, 'wall_s': round(wall, 3), 'cpu_s': round(cpu, 3),
+            'updates_per_s': round(sent / wall), 'updates_per_cpu_s': round(sent / cpu) if cpu else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=100, help='updates per getUpdates response')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_mode(args.updates, args.batch)))
+        return
+
+    for fast in ('0', '1'):
+        env = {**os.environ, 'FAST_RUNTIME': fast}
+        out = subprocess.run([sys.executable, __file__, '--child', '--updates', str(args.updates),
+                              '--batch', str(args.batch)], env=env, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout)
+        print(f"{result['event_loop']:>8} + {result['json']:<7} "
+              f"{result['updates_per_cpu_s']:>8} updates/cpu-s  {result['updates_per_s']:>8} updates/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,38 @@ import traceback
 import sys
 import subprocess
 import time
-from math import radians, sin, cos, sqrt, asin
+import signal
+import json
+import collections
+import datetime
+import gc
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, TypeHandler, ApplicationHandlerStop
 from dotenv import load_dotenv
 import random
 import string
+import geocells
+import order_windows
+from search_policy import SearchPolicy, find_best_match, parse_schedule
+import fairness
+import fingerprint
+from update_processor import PriorityUpdateProcessor
+import snapshot
+from events import EventLog
+import ratelimit
+from notifier import StatusWheel
+from demand import DemandStats
+from cart_links import CartIngestor, FixtureCartParser, find_cart_url, load_parser
+from ops_http import OpsServer
+from handoff import InstanceLease
+import tracing
+from profiler import SamplingProfiler
+from shared_pool import MatcherPool
+import road_graph
+import transport
+import speedups
+from edits import EditCoalescer, is_not_modified
+import chat_buffer as chat_buffers
 
 # Check for apscheduler
 try:
@@ -25,34 +51,310 @@ load_dotenv()
 
 # Get the bot token from environment variable
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-if not TOKEN:
-    print("Error: TELEGRAM_BOT_TOKEN environment variable not set!")
-    print("Please create a .env file with TELEGRAM_BOT_TOKEN=your_token_here")
-    exit(1)
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[logging.StreamHandler(), logging.FileHandler('bot.log', encoding='utf-8')]
-)
+
+# Importing this module has no process-wide side effects (log files, exits, loading
+# the road graph): spawned matcher workers re-import it as __mp_main__. Those happen
+# under `if __name__ == '__main__'` and in main_async.
 logger = logging.getLogger(__name__)
 
+def configure_logging() -> None:
+    """Log to stderr and bot.log."""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        handlers=[logging.StreamHandler(), logging.FileHandler('bot.log', encoding='utf-8')]
+    )
+
 # Global variables
 users = {}  # {'user_id': {'step': str, 'pseudonym': str, 'app': str, 'location': tuple, 'cart_total': float, 'items': str, 'min_for_free': float, 'matched_with': str, 'chat_active': bool, 'chat_requested': bool, 'chat_id': str}}
-carts = []  # {'cart_id': str, 'user_id': str, 'pseudonym': str, 'app': str, 'location': tuple, 'cart_total': float, 'items': str, 'min_for_free': float}
+carts = {}  # {'user_id': {'cart_id': str, 'user_id': str, 'pseudonym': str, 'app': str, 'location': tuple, 'cell': int, 'cart_total': float, 'items': str, 'min_for_free': float}}
+cart_cells = geocells.CellIndex()  # {cell_id: {user_id, ...}} spatial index over carts
+demand = DemandStats()  # per-cell, per-app open cart counters
+cart_buckets = fingerprint.LSHIndex()  # item/store LSH buckets over carts
 active_chats = {}  # {'user_id': 'partner_id'} for active anonymous chats
+users_by_step = {}  # {step: {user_id: None}} secondary index; insertion order = time entered
+_indexed_step = {}  # {user_id: step} as currently recorded in users_by_step
+
+# Expanding-radius schedule, e.g. SEARCH_SCHEDULE="0:1,120:2,600:5:0.1" (seconds:km[:tolerance])
+search_policy = SearchPolicy(parse_schedule(os.environ['SEARCH_SCHEDULE'])) if os.getenv('SEARCH_SCHEDULE') else SearchPolicy()
+SEARCH_INTERVAL = 10.0
+
+# Radius of the nearby-demand preview shown when a location is shared
+DEMAND_PREVIEW_KM = 2.0
+
+# Optional matcher worker processes scanning a shared-memory copy of the pool's hot columns
+MATCHER_WORKERS = int(os.getenv('MATCHER_WORKERS', '0'))
+MATCHER_CAPACITY = int(os.getenv('MATCHER_CAPACITY', '200000'))
+matcher_pool = None  # MatcherPool, created in main_async so spawned workers don't start their own
+
+# Optional road-network distances for candidates that pass the straight-line check;
+# loaded from ROAD_GRAPH_PATH in main_async
+road_distance = None
+
+def load_road_graph() -> None:
+    global road_distance
+    if not os.getenv('ROAD_GRAPH_PATH'):
+        return
+    try:
+        road_distance = road_graph.RoadDistance(road_graph.RoadGraph.load(os.environ['ROAD_GRAPH_PATH']))
+    except (OSError, road_graph.RoadGraphError) as e:
+        logger.error(f"Road graph unavailable, using straight-line distance: {e}")
+
+# Searchers in order of effective start time; the oldest compatible one gets first claim on a cart
+waiting = fairness.IndexedHeap()
+time_to_match = fairness.TimeToMatch()
+
+# Carts ordering later stay dormant here until their order window opens
+ORDER_TZ = datetime.timezone(datetime.timedelta(minutes=int(os.getenv('ORDER_TZ_OFFSET_MINUTES', '330'))))
+SCHEDULE_TICK = 30.0
+scheduled_carts = {}  # same shape as carts; not in the live pool or its indexes
+scheduled_index = order_windows.WindowIndex()
+
+# "Still searching" statuses are edited in place, one wheel slot per tick
+STATUS_TICK = 10.0
+status_wheel = StatusWheel(slots=12)  # each searcher refreshed every 12 ticks
+
+# Searches restored from a snapshot share one tick job instead of a job each; one slot per second
+SEARCH_TICK = 1.0
+search_wheel = StatusWheel(slots=int(SEARCH_INTERVAL / SEARCH_TICK))
+
+# Repeated or rapid edits of the same message are skipped or collapsed into one
+edit_coalescer = EditCoalescer(debounce=float(os.getenv('EDIT_DEBOUNCE', '0.4')))
+
+# State is dumped here on shutdown (SIGTERM) and reloaded on the next boot
+STATE_DIR = os.getenv('STATE_DIR', '.')
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(STATE_DIR, 'state.snapshot'))
+
+# Only the lease holder polls Telegram; a new deploy waits for the old instance to hand over
+instance_lease = InstanceLease(os.path.join(STATE_DIR, 'instance.lease'))
+HANDOFF_TIMEOUT = float(os.getenv('HANDOFF_TIMEOUT', '120'))
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '20'))
+draining = False  # set on SIGTERM: no new sessions, in-flight work finishes
+state_persisted = False  # set once the snapshot is written: every update is turned away
+
+ops_server = OpsServer(port=int(os.getenv('PORT', '8080')))
+
+# Operators: Telegram user IDs allowed to use admin commands, and the token for the ops HTTP API
+ADMIN_IDS = {uid.strip() for uid in os.getenv('ADMIN_IDS', '').split(',') if uid.strip()}
+OPS_TOKEN = os.getenv('OPS_TOKEN')
+
+# Started on demand from /admin profile or GET /profile; writes collapsed stacks to PROFILE_DIR
+profiler = SamplingProfiler(
+    interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000,
+    lag_threshold=float(os.getenv('LOOP_LAG_MS', '100')) / 1000,
+    out_dir=os.getenv('PROFILE_DIR', STATE_DIR),
+    handlers=('start', 'button_callback', 'handle_message', 'handle_location', 'search_for_matches',
+              'search_for_matches_callback', 'search_tick', 'refresh_search_status', 'activate_scheduled',
+              'deliver_buffered', 'admin_query')
+)
+
+# Structured demand events; aggregate offline with `python events.py`
+event_log = EventLog(os.getenv('EVENTS_PATH', 'events.ndjson'))
+
+# Relayed messages that fail to send are queued per partner and retried; spilled to disk on shutdown
+chat_buffer = chat_buffers.ChatBuffer(
+    max_per_chat=int(os.getenv('CHAT_BUFFER_SIZE', '50')),
+    ttl=float(os.getenv('CHAT_BUFFER_TTL', '3600'))
+)
+CHAT_SPILL_PATH = os.getenv('CHAT_SPILL_PATH', os.path.join(STATE_DIR, 'chat_buffer.spill'))
+CHAT_RETRY_TICK = 2.0
+
+# Cart link parsing: CART_PARSER=module:Class plugs in a parser, CART_FIXTURES points the stub
+# parser at a local {url: cart} JSON file. With neither, users are never asked for a link.
+cart_ingestor = None
+try:
+    if os.getenv('CART_PARSER'):
+        cart_ingestor = CartIngestor(load_parser(os.environ['CART_PARSER']))
+    elif os.getenv('CART_FIXTURES'):
+        cart_ingestor = CartIngestor(FixtureCartParser(os.environ['CART_FIXTURES']))
+except Exception as e:
+    logger.error(f"Cart link parser unavailable, amounts must be typed: {e}")
+
+# Per-user flood control applied before any handler runs
+SLOW_DOWN_TEXT = "🐢 Slow down a little - try again in a few seconds."
+rate_limiter = ratelimit.TokenBuckets(
+    capacity=float(os.getenv('RATE_LIMIT_CAPACITY', '10')),
+    refill_per_second=float(os.getenv('RATE_LIMIT_REFILL', '0.5'))
+)
+
+def set_step(user_id, step):
+    """Set a user's step and keep the by-step index in sync.
+
+    Re-entering a step moves the user to the back, so the first entries of
+    users_by_step['searching'] are always the longest-waiting searchers.
+    """
+    old = _indexed_step.pop(user_id, None)
+    if old is not None:
+        users_by_step.get(old, {}).pop(user_id, None)
+    users[user_id]['step'] = step
+    if step is not None:
+        users_by_step.setdefault(step, {})[user_id] = None
+        _indexed_step[user_id] = step
+    if step == 'searching':
+        user = users[user_id]
+        waiting.push(user_id, user.get('search_start_time', 0) - user.get('wait_credit', 0))
+    else:
+        waiting.remove(user_id)
+    tracing.event('step', user=user_id, step=step)
+
+def add_cart(cart):
+    """Insert or replace a user's cart and index it by geocell and items."""
+    if cart['user_id'] in carts or cart['user_id'] in scheduled_carts:
+        remove_cart(cart['user_id'])
+    if cart.get('fingerprint') is None and cart.get('items'):
+        cart['fingerprint'] = fingerprint.minhash(cart['items'])
+    carts[cart['user_id']] = cart
+    if matcher_pool is not None:
+        matcher_pool.put(cart)
+    if cart.get('cell') is not None:
+        cart_cells.add(cart['cell'], cart['user_id'])
+        demand.add(cart['cell'], cart.get('app'), cart.get('cart_total', 0))
+        cart_buckets.add(cart['user_id'], cart.get('fingerprint'), cart.get('store_id'))
+
+def record_event(event, user_id, context, **fields):
+    """Emit a demand event for a user's current cart and search."""
+    user = users.get(user_id, {})
+    wait = None
+    if 'search_start_time' in user:
+        wait = context.bot_data.get('current_time', 0) - user['search_start_time']
+    event_log.emit(event, cell=user.get('cell'), app=user.get('app'), wait=wait, **fields)
+    tracing.event(event, user=user_id, wait=wait, **fields)
+    if event == 'matched' and user.get('cell') is not None:
+        demand.record_match(user['cell'], user.get('app'), wait)
+
+def remove_cart(user_id):
+    """Remove a user's cart from the pool (live or scheduled) and its indexes."""
+    scheduled_index.discard(user_id)
+    cart = scheduled_carts.pop(user_id, None)
+    if cart is not None:
+        return cart
+    cart = carts.pop(user_id, None)
+    if matcher_pool is not None:
+        matcher_pool.remove(user_id)
+    if cart and cart.get('cell') is not None:
+        cart_cells.discard(cart['cell'], user_id)
+        demand.remove(cart['cell'], cart.get('app'), cart.get('cart_total', 0))
+        cart_buckets.discard(user_id, cart.get('fingerprint'), cart.get('store_id'))
+    return cart
+
+def schedule_cart(cart, window):
+    """Park a cart until its order window opens, replacing any live cart."""
+    remove_cart(cart['user_id'])
+    if cart.get('fingerprint') is None and cart.get('items'):
+        cart['fingerprint'] = fingerprint.minhash(cart['items'])
+    cart['window'] = window
+    scheduled_carts[cart['user_id']] = cart
+    scheduled_index.add(cart['user_id'], cart['cell'], window)
+
+def build_cart(user_id):
+    """Build a pool cart from a user's collected order details."""
+    user_data = users[user_id]
+    return {
+        'cart_id': ''.join(random.choices(string.ascii_letters + string.digits, k=8)),
+        'user_id': user_id,
+        'pseudonym': user_data['pseudonym'],
+        'app': user_data['app'],
+        'location': user_data['location'],
+        'cell': user_data['cell'],
+        'cart_total': user_data['cart_total'],
+        'items': user_data.get('items', []),
+        'store_id': user_data.get('store_id'),
+        'min_for_free': user_data['min_for_free']
+    }
+
+def update_cart(user_id, **fields):
+    """Change a pooled cart's amounts in place.
+
+    Cell, items and window are unchanged, so the geocell, LSH and window
+    indexes keep their entries; only the demand totals and the shared
+    columns are rewritten. Step, search start and wait credit are left
+    alone, so the user keeps their place in the fairness queue.
+    """
+    user = users[user_id]
+    user.update(fields)
+    # Candidates ranked against the old amounts may no longer fit
+    user.pop('last_candidates', None)
+    cart = scheduled_carts.get(user_id)
+    if cart is not None:
+        cart.update(fields)
+        return cart
+    cart = carts.get(user_id)
+    if cart is None:
+        return None
+    if cart.get('cell') is not None:
+        demand.remove(cart['cell'], cart.get('app'), cart.get('cart_total', 0))
+        demand.add(cart['cell'], cart.get('app'), fields.get('cart_total', cart.get('cart_total', 0)))
+    cart.update(fields)
+    if matcher_pool is not None:
+        matcher_pool.put(cart)
+    return cart
+
+def cart_options_keyboard():
+    """How to enter a cart; the link option only shows when a parser is configured."""
+    rows = [
+        [InlineKeyboardButton("✏️ Enter Amount Manually", callback_data="enter_amount")],
+        [InlineKeyboardButton("❌ Cancel", callback_data="end_session")]
+    ]
+    if cart_ingestor is not None:
+        rows.insert(0, [InlineKeyboardButton("📱 Share Zepto Cart", callback_data="share_cart")])
+    return InlineKeyboardMarkup(rows)
 
 def generate_pseudonym():
     """Generate a random pseudonym for anonymous chat."""
     return f"Shopper_{''.join(random.choices(string.ascii_letters + string.digits, k=6))}"
 
+async def reject_while_draining(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Turn away new sessions while this instance drains, and every update once its snapshot is written."""
+    if not draining:
+        return
+    query = update.callback_query
+    message = update.message
+    new_session = (
+        (query and (query.data in ['open_app', 'new_search', 'resume_search'] or (query.data or '').startswith('app_')))
+        or (message and (message.location or (message.text or '').startswith('/start')))
+    )
+    if not new_session and not state_persisted:
+        return
+    notice = '🔄 DeliveryShare is restarting. Please try again in a minute.'
+    try:
+        if query:
+            await query.answer(notice, show_alert=True)
+        elif message:
+            await message.reply_text(notice)
+    except Exception as e:
+        logger.error(f"Error sending restart notice: {e}")
+    raise ApplicationHandlerStop
+
+async def throttle_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop updates from users who have run out of rate-limit tokens."""
+    if not update.effective_user:
+        return
+    action = ratelimit.classify(update, lambda uid: uid in active_chats)
+    if not rate_limiter.consume(update.effective_user.id, ratelimit.ACTION_COSTS[action]):
+        logger.warning(f"Throttled {action} from user {update.effective_user.id}")
+        try:
+            if update.callback_query:
+                # Always answered, or the client's spinner keeps going
+                await update.callback_query.answer(SLOW_DOWN_TEXT, show_alert=True)
+            elif action == 'relay' and rate_limiter.warn(update.effective_user.id):
+                await update.message.reply_text(
+                    "🐢 You're sending messages too fast - that one wasn't delivered. "
+                    "Wait a few seconds and send it again."
+                )
+        except Exception as e:
+            logger.error(f"Error sending throttle notice: {e}")
+        raise ApplicationHandlerStop
+
 # Command handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     user_id = str(update.effective_user.id)
     pseudonym = generate_pseudonym()
-    users[user_id] = {'step': 'started', 'pseudonym': pseudonym, 'chat_id': str(update.effective_chat.id)}
+    previous_partner = users.get(user_id, {}).get('matched_with')
+    if previous_partner:
+        chat_buffer.discard(user_id, previous_partner)
+    users[user_id] = {'pseudonym': pseudonym, 'chat_id': str(update.effective_chat.id)}
+    set_step(user_id, 'started')
     
     keyboard = [
         [
@@ -76,6 +378,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         '🤖 *DeliveryShare Bot Help*\n\n'
         '*/start* - Start the bot\n'
         '*/help* - Show this help message\n'
+        '*/edit* - Change your cart amounts while searching\n'
         '*/end* - End the current session\n\n'
         'Simply follow the prompts to find someone to share delivery costs with!'
     )
@@ -85,25 +388,24 @@ async def end_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     """End the current session."""
     user_id = str(update.effective_user.id)
     
+    if user_id in users and users[user_id].get('step') in ['searching', 'matched']:
+        record_event('cancelled', user_id, context, stage=users[user_id]['step'])
+    
     if user_id in active_chats:
         other_user_id = active_chats[user_id]
         
         active_chats.pop(user_id, None)
         active_chats.pop(other_user_id, None)
         
-        carts[:] = [cart for cart in carts if cart['user_id'] not in [user_id, other_user_id]]
+        remove_cart(user_id)
+        remove_cart(other_user_id)
         
+        drop_partner(user_id, other_user_id)
         if user_id in users:
-            users[user_id].pop('matched_with', None)
-            users[user_id].pop('chat_active', None)
-            users[user_id].pop('chat_requested', None)
-            users[user_id]['step'] = 'idle'
-            
+            users[user_id].pop('last_cart', None)
+            set_step(user_id, 'idle')
         if other_user_id in users:
-            users[other_user_id].pop('matched_with', None)
-            users[other_user_id].pop('chat_active', None)
-            users[other_user_id].pop('chat_requested', None)
-            users[other_user_id]['step'] = 'idle'
+            set_step(other_user_id, 'idle')
         
         await update.message.reply_text(
             '✅ Session ended. Thank you for using DeliveryShare!\n\n'
@@ -112,16 +414,20 @@ async def end_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         
         if other_user_id in users:
+            can_resume = bool(users[other_user_id].get('last_cart'))
             await context.bot.send_message(
                 chat_id=other_user_id,
-                text='❌ The other user has ended the session.\n\n'
-                     'Start a new session with /start if you want to find another match.',
-                reply_markup=ReplyKeyboardRemove()
+                text='❌ The other user has ended the session.\n\n' + (
+                    'Resume searching with the same cart, or start over with /start.' if can_resume
+                    else 'Start a new session with /start if you want to find another match.'),
+                reply_markup=InlineKeyboardMarkup([[RESUME_BUTTON]]) if can_resume else ReplyKeyboardRemove()
             )
     else:
-        carts[:] = [cart for cart in carts if cart['user_id'] != user_id]
+        remove_cart(user_id)
         if user_id in users:
-            users[user_id]['step'] = 'idle'
+            set_step(user_id, 'idle')
+            if users[user_id].get('matched_with'):
+                chat_buffer.discard(user_id, users[user_id]['matched_with'])
             users[user_id].pop('matched_with', None)
             users[user_id].pop('chat_active', None)
             users[user_id].pop('chat_requested', None)
@@ -134,6 +440,29 @@ async def end_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await end_session(update, context)
 
+def cart_editor(user_id):
+    """Text and buttons for picking which cart amount to change."""
+    user = users[user_id]
+    text = (
+        '✏️ *Edit your cart*\n\n'
+        f'💰 Cart total: ₹{user.get("cart_total", 0):.2f}\n'
+        f'🚚 Free delivery at: ₹{user.get("min_for_free", 0):.2f}\n\n'
+        'You keep your place in the search queue.'
+    )
+    return text, InlineKeyboardMarkup([[
+        InlineKeyboardButton("💰 Cart Total", callback_data="edit_cart_total"),
+        InlineKeyboardButton("🚚 Free Delivery Minimum", callback_data="edit_min_for_free")
+    ]])
+
+async def edit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Change the amounts on a searching or scheduled cart."""
+    user_id = str(update.effective_user.id)
+    if users.get(user_id, {}).get('step') not in EDITABLE_STEPS:
+        await update.message.reply_text("There's no search to edit. Start one with /start")
+        return
+    text, reply_markup = cart_editor(user_id)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle incoming messages."""
     user_id = str(update.effective_user.id)
@@ -148,10 +477,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if user_data.get('chat_active') and user_data.get('matched_with'):
         partner_id = user_data['matched_with']
         if partner_id in users and users[partner_id].get('chat_active'):
+            relayed = f"💬 {user_data['pseudonym']}: {text}"
+            if chat_buffer.pending(partner_id, user_id):
+                # Earlier messages are still waiting; queue behind them to keep the order
+                chat_buffer.enqueue(partner_id, user_id, relayed, time.time())
+                await update.message.reply_text("⏳ Queued - I'll deliver it after your earlier messages.")
+                return
             try:
                 await context.bot.send_message(
                     chat_id=partner_id,
-                    text=f"💬 {user_data['pseudonym']}: {text}",
+                    text=relayed,
                     reply_markup=ReplyKeyboardRemove()
                 )
                 await update.message.reply_text(
@@ -162,10 +497,49 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 return
             except Exception as e:
                 logger.error(f"Error forwarding message: {e}")
-                await update.message.reply_text("❌ Failed to send message. Please try again.")
+                if chat_buffers.is_permanent(e) or not chat_buffer.enqueue(partner_id, user_id, relayed, time.time()):
+                    await update.message.reply_text("❌ Failed to send message. Please try again.")
+                    return
+                await update.message.reply_text(
+                    "⏳ Your partner can't be reached right now. I'll keep trying to deliver your message."
+                )
                 return
     
+    if user_data.get('editing') and user_data.get('step') not in EDITABLE_STEPS:
+        user_data.pop('editing')  # the search ended while an edit was pending
+    if user_data.get('editing'):
+        try:
+            amount = float(''.join(c for c in text.strip() if c.isdigit() or c == '.'))
+        except ValueError:
+            await update.message.reply_text('Please enter a valid number (e.g., 250.50).')
+            return
+        if amount <= 0:
+            await update.message.reply_text("Please enter a valid amount greater than 0.")
+            return
+        update_cart(user_id, **{user_data.pop('editing'): amount})
+        record_event('cart_edited', user_id, context, total=user_data['cart_total'], min=user_data['min_for_free'])
+        logger.info(f"Cart edited in place for user {user_id}")
+        # Re-check just this cart now rather than waiting for its next search tick
+        if await search_for_matches(context, user_id):
+            return
+        await update.message.reply_text(
+            f'✅ Cart updated: ₹{user_data["cart_total"]:.2f}, free delivery at ₹{user_data["min_for_free"]:.2f}.\n\n'
+            'Still searching - your place in line is kept.'
+        )
+        return
+    
     if user_data.get('step') == 'cart_amount':
+        link = find_cart_url(text)
+        if link:
+            if cart_ingestor is None:
+                await update.message.reply_text(
+                    "🔗 Reading cart links isn't available right now. Please enter the total amount of your order:"
+                )
+                return
+            # Parse off the handler so the reply goes out immediately
+            await update.message.reply_text('🔗 Reading your cart...')
+            context.application.create_task(ingest_cart_link(context, user_id, *link), update=update)
+            return
         try:
             amount_text = text.strip()
             amount = float(''.join(c for c in amount_text if c.isdigit() or c == '.'))
@@ -173,7 +547,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await update.message.reply_text("Please enter a valid amount greater than 0.")
                 return
             user_data['cart_total'] = amount
-            user_data['step'] = 'min_for_free'
+            set_step(user_id, 'min_for_free')
             await update.message.reply_text(
                 '💰 *What\'s the minimum order amount for free delivery?*\n\n'
                 'Enter the amount (e.g., 500) or just type "300" if you\'re not sure:',
@@ -192,7 +566,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 return
                 
             user_data['min_for_free'] = min_free
-            user_data['step'] = 'location'
+            set_step(user_id, 'location')
             
             # Add user's cart to the global carts list
             cart_id = f"cart_{user_id}_{int(time.time())}"
@@ -202,16 +576,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 'pseudonym': user_data.get('pseudonym', 'User'),
                 'app': user_data.get('app', 'Unknown'),
                 'location': user_data.get('location'),
+                'cell': user_data.get('cell'),
                 'cart_total': user_data['cart_total'],
+                'items': user_data.get('items', []),
                 'min_for_free': min_free,
                 'timestamp': time.time()
             }
             
-            # Remove any existing cart for this user
-            carts[:] = [c for c in carts if c['user_id'] != user_id]
-            carts.append(cart)
+            # Replaces any existing cart for this user
+            add_cart(cart)
             
-            logger.info(f"Added cart for user {user_id}: {cart}")
+            logger.info(f"Added cart {cart_id} for user {user_id}")
             
             location_keyboard = ReplyKeyboardMarkup(
                 [[KeyboardButton("📍 Share My Location", request_location=True)]],
@@ -220,7 +595,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             await update.message.reply_text(
                 '📍 *Almost there!* Please share your location so we can find nearby matches.\n\n'
-                'Click the "📍 Share My Location" button below to continue.',
+                'Click the "📍 Share My Location" button below to continue.\n\n'
+                '🕗 Ordering later? Send the time first, e.g. `20:00`, `7:30-8:15 pm` or `in 30 min`.',
                 reply_markup=location_keyboard,
                 parse_mode='Markdown'
             )
@@ -233,6 +609,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             resize_keyboard=True,
             one_time_keyboard=True
         )
+        window = order_windows.parse_window(text, ORDER_TZ)
+        if window:
+            user_data['window'] = window
+            await update.message.reply_text(
+                f'🕗 Ordering {order_windows.format_window(window, ORDER_TZ)}. '
+                'Now share your location and I\'ll look for people ordering around then.',
+                reply_markup=location_keyboard
+            )
+            return
         await update.message.reply_text(
             'Please share your location using the button below to find nearby matches.',
             reply_markup=location_keyboard
@@ -244,6 +629,110 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             'Use /start to begin or /help for assistance.'
         )
 
+def cancel_search(job_queue, user_id):
+    """Stop a user's periodic search, whether it runs as its own job or on the search wheel."""
+    search_wheel.discard(user_id)
+    if job_queue:
+        for job in job_queue.get_jobs_by_name(f'search_{user_id}'):
+            job.schedule_removal()
+
+def schedule_search(job_queue, user_id, chat_id, first=5, replace=True):
+    """Start the repeating match search job for a user."""
+    if replace:
+        cancel_search(job_queue, user_id)
+    return job_queue.run_repeating(
+        search_for_matches_callback,
+        interval=SEARCH_INTERVAL,
+        first=first,
+        data={'user_id': user_id, 'chat_id': str(chat_id)},
+        name=f'search_{user_id}'
+    )
+
+RESUME_BUTTON = InlineKeyboardButton("🔁 Resume Search", callback_data="resume_search")
+EDIT_BUTTON = InlineKeyboardButton("✏️ Edit Cart", callback_data="edit_cart")
+EDITABLE_STEPS = ('searching', 'scheduled')
+
+def drop_partner(user_id, partner_id):
+    """Forget the partner of a broken match and keep them out of the next search."""
+    # Nothing still queued between them may arrive once they have parted
+    chat_buffer.discard(user_id, partner_id)
+    for uid, other in ((user_id, partner_id), (partner_id, user_id)):
+        if uid in users:
+            users[uid]['matched_with'] = None
+            users[uid]['chat_active'] = False
+            users[uid]['chat_requested'] = False
+            users[uid]['excluded'] = [other]
+
+async def resume_search(context: ContextTypes.DEFAULT_TYPE, user_id: str) -> bool:
+    """Put a user's last cart back in the pool after their partner dropped.
+
+    The search clock restarts, but the wait already served is carried as
+    wait credit so the user keeps their place in the fairness queue, and
+    the ranked runners-up from the previous search are tried first, so a
+    replacement is often found on the same tick.
+    """
+    user = users.get(user_id)
+    if not user or not user.get('last_cart'):
+        return False
+    cart = dict(user.pop('last_cart'))
+    cart['cart_id'] = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    user.update({
+        'location': cart['location'],
+        'cell': cart['cell'],
+        'search_start_time': context.bot_data.get('current_time', 0),
+        'wait_credit': user.pop('last_wait', 0),  # keeps their place in line
+        'trace_id': tracing.current()
+    })
+    set_step(user_id, 'searching')
+    add_cart(cart)
+    record_event('resumed', user_id, context)
+    
+    if await search_for_matches(context, user_id):
+        return True
+    schedule_search(context.job_queue, user_id, user.get('chat_id', user_id))
+    status = await context.bot.send_message(
+        chat_id=user.get('chat_id', user_id),
+        text='🔍 Searching again with your previous cart...',
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search"), EDIT_BUTTON]])
+    )
+    user['status_message_id'] = status.message_id
+    status_wheel.add(user_id)
+    return True
+
+async def ingest_cart_link(context: ContextTypes.DEFAULT_TYPE, user_id: str, url: str, app: str) -> None:
+    """Parse a shared cart link in the background and continue the cart flow."""
+    try:
+        parsed = await cart_ingestor.ingest(url, app)
+        user_data = users.get(user_id)
+        if not user_data or user_data.get('step') != 'cart_amount':
+            return
+        chat_id = user_data.get('chat_id', user_id)
+        
+        if not parsed or parsed['cart_total'] <= 0:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="❌ Couldn't read that cart link. Please enter the total amount of your order:"
+            )
+            return
+        
+        user_data.update({
+            'app': parsed['app'],
+            'cart_total': parsed['cart_total'],
+            'items': parsed['items'],
+            'store_id': parsed.get('store_id')
+        })
+        set_step(user_id, 'min_for_free')
+        logger.info(f"Cart link parsed for user {user_id}: {len(parsed['items'])} items")
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f'✅ *{parsed["app"]} cart read*: {len(parsed["items"])} items, ₹{parsed["cart_total"]:.2f}\n\n'
+                 '💰 *What\'s the minimum order amount for free delivery?*\n\n'
+                 'Enter the amount (e.g., 500) or just type "300" if you\'re not sure:',
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.error(f"Error ingesting cart link for user {user_id}: {e}", exc_info=True)
+
 async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle location sharing and start searching for matches."""
     try:
@@ -272,39 +761,44 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             return
             
+        # Quantise on ingestion; the raw coordinates are never stored
         user_data.update({
-            'location': (location.latitude, location.longitude),
-            'step': 'searching',
+            'location': geocells.coarsen(location.latitude, location.longitude),
+            'cell': geocells.encode(location.latitude, location.longitude),
             'search_start_time': context.bot_data.get('current_time', 0),
+            'wait_credit': 0,
+            'trace_id': tracing.current(),
             'chat_id': str(chat_id)
         })
+        set_step(user_id, 'searching')
         
-        logger.info(f"Location saved for user {user_id}: {user_data['location']}")
+        logger.info(f"Location saved for user {user_id}: cell {user_data['cell']}")
         
-        cart_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-        cart = {
-            'cart_id': cart_id,
-            'user_id': user_id,
-            'pseudonym': user_data['pseudonym'],
-            'app': user_data['app'],
-            'location': user_data['location'],
-            'cart_total': user_data['cart_total'],
-            'items': user_data.get('items', 'N/A'),
-            'min_for_free': user_data['min_for_free']
-        }
-        carts.append(cart)
-        logger.info(f"Cart added for user {user_id}: {cart}")
+        cart = build_cart(user_id)
+        window = user_data.pop('window', None)
+        if window and window[0] > time.time():
+            await start_scheduled(update, context, cart, window)
+            return
+        add_cart(cart)
+        logger.info(f"Cart {cart['cart_id']} added for user {user_id} in cell {cart['cell']}")
+        record_event('cart_created', user_id, context, total=cart['cart_total'], min=cart['min_for_free'])
         
+        # Answered from the cell aggregates, not a scan of the pool
+        nearby = demand.open_within(cart['cell'], cart['app'], DEMAND_PREVIEW_KM) - 1
+        median_wait = demand.median_wait_within(cart['cell'], cart['app'], DEMAND_PREVIEW_KM)
+        preview = f'📊 {nearby} {cart["app"]} cart{"s" if nearby != 1 else ""} within {DEMAND_PREVIEW_KM:g} km right now.'
+        if median_wait is not None:
+            preview += f'\n⏱️ Matches nearby usually take about {max(1, round(median_wait / 60))} min.'
         await update.message.reply_text(
-            '✅ Location received! Starting search...',
+            f'✅ Location received! Starting search...\n\n{preview}',
             reply_markup=ReplyKeyboardRemove()
         )
         
         if not hasattr(context, 'job_queue') or context.job_queue is None:
             logger.error(f"Job queue not available for user {user_id}! Ensure python-telegram-bot[job-queue] is installed. "
                         f"Installed version: {__import__('telegram').__version__}. APScheduler available: {APSCHEDULER_AVAILABLE}")
-            user_data['step'] = 'idle'
-            carts[:] = [cart for cart in carts if cart['user_id'] != user_id]
+            set_step(user_id, 'idle')
+            remove_cart(user_id)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text='❌ Error: Unable to start search due to a configuration issue. Please try again with /start.',
@@ -312,23 +806,13 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             return
         
-        current_jobs = context.job_queue.get_jobs_by_name(f'search_{user_id}')
-        for job in current_jobs:
-            job.schedule_removal()
-        
         try:
             logger.info(f"Creating search job for user {user_id}")
-            context.job_queue.run_repeating(
-                search_for_matches_callback,
-                interval=10.0,
-                first=5,
-                data={'user_id': user_id, 'chat_id': str(chat_id)},
-                name=f'search_{user_id}'
-            )
+            schedule_search(context.job_queue, user_id, chat_id)
             logger.info(f"Search job created for user {user_id}")
             
-            keyboard = [[InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search")]]
-            await context.bot.send_message(
+            keyboard = [[InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search"), EDIT_BUTTON]]
+            status = await context.bot.send_message(
                 chat_id=chat_id,
                 text=(
                     '🔍 Searching for potential matches...\n\n'
@@ -336,6 +820,9 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 ),
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            # Later progress updates edit this message instead of posting new ones
+            user_data['status_message_id'] = status.message_id
+            status_wheel.add(user_id)
             
         except Exception as e:
             logger.error(f"Failed to start search job for user {user_id}: {e}", exc_info=True)
@@ -351,8 +838,56 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 "❌ An unexpected error occurred. Please try again or use /start to begin a new session."
             )
 
-async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -> bool:
-    """Search for potential matches for a user."""
+async def start_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE, cart, window) -> None:
+    """Park a cart for a future order window and look for overlapping scheduled carts."""
+    user_id = cart['user_id']
+    set_step(user_id, 'scheduled')
+    users[user_id]['scheduled_window'] = window
+    schedule_cart(cart, window)
+    logger.info(f"Cart {cart['cart_id']} scheduled for user {user_id} at {window[0]}")
+    record_event('cart_created', user_id, context, total=cart['cart_total'], min=cart['min_for_free'],
+                 window=window[1] - window[0])
+    
+    # Someone nearby may already have planned an order for the same time
+    if await search_for_matches(context, user_id):
+        return
+    await update.message.reply_text(
+        f'🕗 Scheduled for {order_windows.format_window(window, ORDER_TZ)}.\n\n'
+        'I\'ll pair you with anyone nearby ordering in that window, and start a live search when it opens.',
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Cancel", callback_data="stop_search"), EDIT_BUTTON]])
+    )
+
+async def activate_scheduled(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Move carts whose order window has opened into the live pool."""
+    for user_id in scheduled_index.pop_opened(time.time()):
+        cart = scheduled_carts.pop(user_id, None)
+        user = users.get(user_id)
+        if cart is None or not user or user.get('step') != 'scheduled':
+            continue
+        user.pop('scheduled_window', None)
+        user.update({'location': cart['location'], 'cell': cart['cell'],
+                     'search_start_time': context.bot_data.get('current_time', 0)})
+        set_step(user_id, 'searching')
+        add_cart(cart)
+        try:
+            schedule_search(context.job_queue, user_id, user.get('chat_id', user_id), first=1)
+            status = await context.bot.send_message(
+                chat_id=user.get('chat_id', user_id),
+                text='🕗 Your order window is open - searching for matches now...',
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search"), EDIT_BUTTON]])
+            )
+            user['status_message_id'] = status.message_id
+            status_wheel.add(user_id)
+        except Exception as e:
+            logger.error(f"Failed to activate scheduled cart for user {user_id}: {e}")
+
+async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str, claim=None) -> bool:
+    """Search for potential matches for a user.
+
+    `claim` is the user ID of a cart handed to this user because they are
+    the oldest searcher able to take it; it is tried before anything else.
+    Returns True only if `user_id` itself was matched.
+    """
     try:
         logger.info(f"=== Starting search_for_matches for user {user_id} ===")
         
@@ -363,83 +898,74 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
         current_user = users[user_id]
         
         logger.info(f"User {user_id} state: {current_user.get('step')}")
-        logger.info(f"User data: {current_user}")
         
-        if current_user.get('step') != 'searching':
+        if current_user.get('step') not in ('searching', 'scheduled'):
             logger.warning(f"User {user_id} is not in 'searching' state. Current state: {current_user.get('step')}")
             return False
             
-        required_fields = ['app', 'location', 'cart_total', 'min_for_free']
+        required_fields = ['app', 'location', 'cell', 'cart_total', 'min_for_free']
         for field in required_fields:
             if field not in current_user:
                 logger.error(f"Missing required field '{field}' for user {user_id}")
                 return False
         
-        logger.info(f"Searching for matches among {len(carts)} carts...")
+        if current_user['step'] == 'scheduled':
+            # Scheduled carts only pair with scheduled carts whose window overlaps
+            pool = scheduled_carts
+            index = scheduled_index.view(scheduled_carts[user_id]['window'])
+            radius_km, tolerance = search_policy.max_radius_km, 0.0
+        else:
+            pool, index = carts, cart_cells
+            elapsed = context.bot_data.get('current_time', 0) - current_user.get('search_start_time', 0)
+            radius_km, tolerance = search_policy.step(elapsed)
+        logger.info(f"Searching {len(pool)} carts within {radius_km}km (tolerance {tolerance:.0%})...")
         
-        for cart in carts[:]:
+        # The user's own cart carries the item fingerprint and store used for scoring
+        searcher = pool.get(user_id, current_user)
+        warm = [claim] if claim else current_user.pop('last_candidates', [])
+        nearest = None
+        if not warm and matcher_pool is not None and pool is carts:
+            # A worker scans the shared columns in place of the ring scan; scoring its
+            # hits together with the LSH candidates stays here
+            nearest = await matcher_pool.candidates(user_id, radius_km, tolerance)
+        ranked = []
+        result = find_best_match(searcher, pool, index, radius_km, tolerance,
+                                 exclude={user_id, *current_user.get('excluded', [])}, lsh=cart_buckets,
+                                 warm=warm, ranked=ranked, distance=road_distance, nearest=nearest)
+        if result and pool is carts and claim is None:
+            claimant = fairness.oldest_claimant(result[0], user_id, carts, cart_cells, waiting, search_policy,
+                                                context.bot_data.get('current_time', 0), users,
+                                                distance=road_distance)
+            if claimant != user_id:
+                logger.info(f"Cart of {result[0]['user_id']} goes to older searcher {claimant} instead of {user_id}")
+                if await search_for_matches(context, claimant, claim=result[0]['user_id']):
+                    time_to_match.reassigned += 1
+                    # The claimant was matched, not this user: they keep searching
+                    return False
+        if result:
             try:
-                if cart['user_id'] == user_id:
-                    logger.debug(f"Skipping own cart: {cart.get('cart_id', 'unknown')}")
-                    continue
-                    
-                logger.info(f"Checking cart from user {cart['user_id']}")
-                
-                app1 = str(cart.get('app', '')).lower().strip()
-                app2 = str(current_user.get('app', '')).lower().strip()
-                if app1 != app2:
-                    logger.debug(f"Skipping - different apps: '{app1}' != '{app2}'")
-                    continue
-                
-                loc1 = cart.get('location')
-                loc2 = current_user.get('location')
-                logger.info(f"Comparing locations - User {user_id}: {loc2}, Potential match: {loc1}")
-                
-                # Check if location data is valid
-                if not all([loc1, loc2, len(loc1) == 2, len(loc2) == 2]):
-                    logger.warning(f"Invalid location data - User {user_id}: {loc2}, Potential match: {loc1}")
-                    continue
-                    
-                # Calculate distance in kilometers using Haversine formula
-                lat1, lon1 = loc1
-                lat2, lon2 = loc2
-                
-                # Convert decimal degrees to radians
-                lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-                
-                # Haversine formula
-                dlat = lat2 - lat1
-                dlon = lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2 * asin(sqrt(a))
-                distance_km = 6371 * c  # Radius of Earth in kilometers
-                
-                # Consider it a match if within 5km
-                if distance_km > 5.0:  # 5km radius
-                    logger.debug(f"Skipping - too far: {distance_km:.2f}km")
-                    continue
-                
-                cart_total1 = float(cart.get('cart_total', 0))
-                cart_total2 = float(current_user.get('cart_total', 0))
-                min_req1 = float(cart.get('min_for_free', 0))
-                min_req2 = float(current_user.get('min_for_free', 0))
-                
-                combined_total = cart_total1 + cart_total2
-                min_required = max(min_req1, min_req2)
-                
-                logger.info(f"Checking order values - Combined: {combined_total}, Min required: {min_required}")
-                
-                if combined_total < min_required:
-                    logger.debug(f"Skipping - insufficient combined total: {combined_total} < {min_required}")
-                    continue
-                
-                logger.info(f"MATCH FOUND between {user_id} and {cart['user_id']}")
+                cart, ring, distance_km, match_score = result
+                logger.info(f"MATCH FOUND between {user_id} and {cart['user_id']} "
+                            f"(ring {ring}, {distance_km:.2f}km, score {match_score:.2f})")
                 
                 partner_id = cart['user_id']
+                record_event('matched', user_id, context, ring=ring, km=round(distance_km, 1))
+                now = context.bot_data.get('current_time', 0)
+                for uid in (user_id, partner_id):
+                    if uid in users and 'search_start_time' in users[uid]:
+                        users[uid]['last_wait'] = now - users[uid]['search_start_time'] + users[uid].get('wait_credit', 0)
+                        time_to_match.record(users[uid]['last_wait'])
+                
+                # Kept so either side can resume searching if the other walks away
+                if user_id in pool:
+                    users[user_id]['last_cart'] = dict(pool[user_id])
+                users[user_id]['last_candidates'] = [cid for cid in ranked if cid != partner_id][:10]
+                if partner_id in users:
+                    users[partner_id]['last_cart'] = dict(cart)
                 
                 users[user_id].update({
                     'matched_with': partner_id,
-                    'step': 'matched',
+                    'match_ring': ring,
                     'chat_active': False,
                     'partner_data': {
                         'app': cart.get('app'),
@@ -447,11 +973,12 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
                         'min_for_free': cart.get('min_for_free', 0)
                     }
                 })
+                set_step(user_id, 'matched')
                 
                 if partner_id in users:
                     users[partner_id].update({
                         'matched_with': user_id,
-                        'step': 'matched',
+                        'match_ring': ring,
                         'chat_active': False,
                         'partner_data': {
                             'app': current_user.get('app'),
@@ -459,8 +986,16 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
                             'min_for_free': current_user.get('min_for_free', 0)
                         }
                     })
+                    set_step(partner_id, 'matched')
                 
-                carts[:] = [c for c in carts if c['user_id'] not in [user_id, partner_id]]
+                remove_cart(user_id)
+                remove_cart(partner_id)
+                status_wheel.discard(user_id)
+                status_wheel.discard(partner_id)
+                # Coordinates are no longer needed once the pair is fixed
+                for uid in [user_id, partner_id]:
+                    if uid in users:
+                        users[uid].pop('location', None)
                 
                 keyboard = [
                     [InlineKeyboardButton("💬 Start Anonymous Chat", callback_data="start_chat")],
@@ -503,10 +1038,8 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
                             parse_mode='Markdown'
                         )
                     
-                    if hasattr(context, 'job_queue') and context.job_queue:
-                        for uid in [user_id, partner_id]:
-                            for job in context.job_queue.get_jobs_by_name(f'search_{uid}'):
-                                job.schedule_removal()
+                    for uid in [user_id, partner_id]:
+                        cancel_search(getattr(context, 'job_queue', None), uid)
                     
                     logger.info(f"Match successful between {user_id} and {partner_id}")
                     return True
@@ -516,8 +1049,8 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
                     return False
                 
             except Exception as cart_error:
-                logger.error(f"Error processing cart: {cart_error}", exc_info=True)
-                continue
+                logger.error(f"Error processing match: {cart_error}", exc_info=True)
+                return False
         
         logger.info(f"No matches found for user {user_id} this round")
         return False
@@ -526,22 +1059,24 @@ async def search_for_matches(context: ContextTypes.DEFAULT_TYPE, user_id: str) -
         logger.error(f"Error in search_for_matches: {e}", exc_info=True)
         return False
 
-async def search_for_matches_callback(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Callback function for the job queue to search for matches."""
+async def expire_search(context: ContextTypes.DEFAULT_TYPE, user_id: str, text: str) -> None:
+    """End a user's search as expired and tell them."""
+    user = users[user_id]
+    record_event('expired', user_id, context)
+    set_step(user_id, 'idle')
+    remove_cart(user_id)
+    status_wheel.discard(user_id)
+    cancel_search(context.job_queue, user_id)
+    await context.bot.send_message(
+        chat_id=user.get('chat_id', user_id),
+        text=text,
+        reply_markup=ReplyKeyboardRemove()
+    )
+
+async def search_tick(context: ContextTypes.DEFAULT_TYPE, user_id: str, chat_id) -> bool:
+    """Run one round of a user's periodic search; returns False once it should stop."""
     try:
-        if not hasattr(context, 'job') or not context.job:
-            logger.error("No job data in context")
-            return
-            
-        job_data = getattr(context.job, 'data', {})
-        if not job_data or 'user_id' not in job_data:
-            logger.error("Invalid job data format")
-            return
-            
-        user_id = str(job_data['user_id'])
-        chat_id = job_data.get('chat_id', user_id)
-        
-        logger.info(f"=== Search callback triggered for user {user_id} ===")
+        logger.info(f"=== Search tick for user {user_id} ===")
         
         if user_id not in users:
             logger.warning(f"User {user_id} not found in users dictionary")
@@ -549,16 +1084,16 @@ async def search_for_matches_callback(context: ContextTypes.DEFAULT_TYPE) -> Non
                 chat_id=chat_id,
                 text="❌ Session expired. Please start again with /start"
             )
-            context.job.schedule_removal()
-            return
+            return False
             
         user = users[user_id]
         current_step = user.get('step')
+        # Each tick continues the trace of the update that started the search
+        tracing.resume(user.get('trace_id') or tracing.new_trace())
         
         if current_step != 'searching':
-            logger.info(f"User {user_id} is in state '{current_step}', not 'searching'. Stopping job.")
-            context.job.schedule_removal()
-            return
+            logger.info(f"User {user_id} is in state '{current_step}', not 'searching'. Stopping search.")
+            return False
             
         required_fields = ['location', 'app', 'cart_total', 'min_for_free']
         missing_fields = [field for field in required_fields if field not in user or not user[field]]
@@ -569,56 +1104,133 @@ async def search_for_matches_callback(context: ContextTypes.DEFAULT_TYPE) -> Non
                 chat_id=chat_id,
                 text="❌ Missing required information. Please start again with /start"
             )
-            context.job.schedule_removal()
-            return
+            return False
             
         search_duration = context.bot_data.get('current_time', 0) - user.get('search_start_time', 0)
         if search_duration > 1800:
             logger.info(f"Search timeout for user {user_id} after {search_duration} seconds")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="⏱️ Search timed out after 30 minutes. Use /start to try again.",
-                reply_markup=ReplyKeyboardRemove()
-            )
-            context.job.schedule_removal()
-            return
+            await expire_search(context, user_id, "⏱️ Search timed out after 30 minutes. Use /start to try again.")
+            return False
             
         logger.info(f"Searching for matches for user {user_id} (searching for {search_duration//60}m {search_duration%60}s)")
         
-        found = await search_for_matches(context, user_id)
+        with tracing.span('search', user=user_id, elapsed=search_duration):
+            found = await search_for_matches(context, user_id)
         
         if found:
-            logger.info(f"Match found for user {user_id}, removing job")
-            context.job.schedule_removal()
-        else:
-            logger.info(f"No matches found this round for user {user_id}")
-            if search_duration > 0 and search_duration % 120 < 10:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"🔍 Still searching for matches... ({search_duration//60}m {search_duration%60}s elapsed)",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search")]
-                    ])
-                )
+            logger.info(f"Match found for user {user_id}, stopping search")
+            return False
+        logger.info(f"No matches found this round for user {user_id}")
+        return True
                 
     except Exception as e:
-        logger.error(f"Error in search_for_matches_callback: {e}", exc_info=True)
-        if 'chat_id' in locals():
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ An unexpected error occurred. Please try again or use /start to begin a new session.",
-                reply_markup=ReplyKeyboardRemove()
-            )
+        logger.error(f"Error in search tick for user {user_id}: {e}", exc_info=True)
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="❌ An unexpected error occurred. Please try again or use /start to begin a new session.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return False
+
+async def search_for_matches_callback(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Callback function for the job queue to search for matches."""
+    if not hasattr(context, 'job') or not context.job:
+        logger.error("No job data in context")
+        return
+        
+    job_data = getattr(context.job, 'data', {})
+    if not job_data or 'user_id' not in job_data:
+        logger.error("Invalid job data format")
+        return
+        
+    user_id = str(job_data['user_id'])
+    if not await search_tick(context, user_id, job_data.get('chat_id', user_id)):
         context.job.schedule_removal()
 
+async def advance_search_wheel(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Run the searches due in the next slot of the shared search wheel."""
+    for user_id in search_wheel.advance():
+        chat_id = users.get(user_id, {}).get('chat_id', user_id)
+        if not await search_tick(context, user_id, chat_id):
+            search_wheel.discard(user_id)
+
+def count_nearby_carts(user_id, radius_km):
+    """Count other carts for the same app within `radius_km` of a user."""
+    user = users[user_id]
+    count = demand.open_within(user['cell'], user.get('app'), radius_km)
+    return max(0, count - 1) if user_id in carts else count
+
+def render_search_status(user_id, elapsed):
+    """Build the in-place status text for a searching user."""
+    radius_km, _ = search_policy.step(elapsed)
+    return (
+        '🔍 Still searching for matches...\n\n'
+        f'📍 Search radius: {radius_km:g} km\n'
+        f'🛒 {users[user_id].get("app")} carts nearby: {count_nearby_carts(user_id, radius_km)}\n\n'
+        'I\'ll keep searching until I find someone or you stop the search.'
+    )
+
+async def edit_query(query, text, **kwargs):
+    """Edit the message a button was pressed on, through the edit coalescer."""
+    return await edit_coalescer.edit(query.get_bot(), query.message.chat_id, query.message.message_id,
+                                     text, **kwargs)
+
+async def refresh_search_status(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Advance the status wheel and edit the due searchers' status messages."""
+    now = context.bot_data.get('current_time', 0)
+    for user_id in status_wheel.advance():
+        user = users.get(user_id)
+        if not user or user.get('step') != 'searching' or not user.get('status_message_id'):
+            status_wheel.discard(user_id)
+            continue
+        text = render_search_status(user_id, now - user.get('search_start_time', 0))
+        if not status_wheel.changed(user_id, text):
+            continue
+        try:
+            await edit_coalescer.edit(
+                context.bot,
+                user.get('chat_id', user_id),
+                user['status_message_id'],
+                text,
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🛑 Stop Searching", callback_data="stop_search"), EDIT_BUTTON]
+                ])
+            )
+        except Exception as e:
+            logger.warning(f"Could not update search status for user {user_id}: {e}")
+            status_wheel.discard(user_id)
+
+async def flush_chat(bot, channel, now) -> None:
+    """Retry the messages buffered on a (sender, recipient) channel and tell the sender how it went."""
+    sender, recipient = channel
+    outcome, count = await chat_buffer.flush(
+        channel, lambda text: bot.send_message(chat_id=recipient, text=text), now
+    )
+    if outcome == chat_buffers.RETRY or not count:
+        return
+    notice = ("✅ Your queued messages were delivered." if outcome == chat_buffers.DELIVERED
+              else "❌ Your partner can't receive messages anymore; your queued messages were dropped.")
+    try:
+        await bot.send_message(chat_id=sender, text=notice)
+    except Exception as e:
+        logger.warning(f"Could not tell {sender} about buffered delivery: {e}")
+
+async def deliver_buffered(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Expire stale buffered messages and retry the partners that are due."""
+    now = time.time()
+    chat_buffer.expire(now)
+    for channel in chat_buffer.due(now):
+        await flush_chat(context.bot, channel, now)
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button presses."""
     query = update.callback_query
-    await query.answer()
+    # Stop the client's spinner straight away; the edit below doesn't wait on it
+    context.application.create_task(query.answer(), update=update)
     user_id = str(update.effective_user.id)
     
     if query.data == 'open_app':
-        await query.edit_message_text(
+        await edit_query(query,
             '📱 *App Selection*\n\n'
             'Which delivery app are you using?',
             reply_markup=InlineKeyboardMarkup([
@@ -640,15 +1252,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     if user_id not in users:
-        await query.edit_message_text("Please start a new session with /start")
+        await edit_query(query, "Please start a new session with /start")
         return
     
     if query.data.startswith('app_'):
         app_name = query.data[4:].capitalize()
         users[user_id]['app'] = app_name
-        users[user_id]['step'] = 'cart_amount'
+        set_step(user_id, 'cart_amount')
         
-        await query.edit_message_text(
+        await edit_query(query,
             f"Selected {app_name}. Now, please enter the total amount of your order:",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("🔙 Back", callback_data="open_app")]
@@ -658,42 +1270,38 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     if query.data == 'share_cart':
-        await query.edit_message_text(
-            "Please enter the total amount of your order or share a Zepto cart URL:",
+        await edit_query(query,
+            "Please enter the total amount of your order or share a Zepto cart URL:" if cart_ingestor
+            else "💵 Please enter the total amount of your order:",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("🔙 Back", callback_data="back_to_options")]
             ])
         )
-        users[user_id]['step'] = 'cart_amount'
+        set_step(user_id, 'cart_amount')
         return
     
     if query.data == 'enter_amount':
-        users[user_id]['step'] = 'cart_amount'
-        await query.edit_message_text(
+        set_step(user_id, 'cart_amount')
+        await edit_query(query,
             "💵 Please enter the total amount of your order:"
         )
         return
         
     if query.data == 'back_to_options':
-        users[user_id]['step'] = 'idle'
-        await query.edit_message_text(
+        set_step(user_id, 'idle')
+        await edit_query(query,
             "What would you like to do?",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📱 Share Zepto Cart", callback_data="share_cart")],
-                [InlineKeyboardButton("✏️ Enter Amount Manually", callback_data="enter_amount")],
-                [InlineKeyboardButton("❌ Cancel", callback_data="end_session")]
-            ])
+            reply_markup=cart_options_keyboard()
         )
         return
         
     if query.data == 'stop_search':
-        if hasattr(context, 'job_queue') and context.job_queue:
-            for job in context.job_queue.get_jobs_by_name(f'search_{user_id}'):
-                job.schedule_removal()
-        if user_id in users and users[user_id].get('step') == 'searching':
-            users[user_id]['step'] = 'idle'
-            carts[:] = [cart for cart in carts if cart['user_id'] != user_id]
-            await query.edit_message_text(
+        cancel_search(getattr(context, 'job_queue', None), user_id)
+        if user_id in users and users[user_id].get('step') in ('searching', 'scheduled'):
+            record_event('cancelled', user_id, context, stage=users[user_id]['step'])
+            set_step(user_id, 'idle')
+            remove_cart(user_id)
+            await edit_query(query,
                 '🛑 Search stopped. You can start a new search anytime!',
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("🔄 Start New Search", callback_data="new_search")]
@@ -703,12 +1311,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     if query.data == 'new_search':
         if user_id in users:
+            if users[user_id].get('matched_with'):
+                chat_buffer.discard(user_id, users[user_id]['matched_with'])
             users[user_id]['matched_with'] = None
             users[user_id]['chat_active'] = False
             users[user_id]['chat_requested'] = False
-            users[user_id]['step'] = 'started'
-            carts[:] = [cart for cart in carts if cart['user_id'] != user_id]
-            await query.edit_message_text(
+            set_step(user_id, 'started')
+            remove_cart(user_id)
+            await edit_query(query,
                 '🔄 Starting a new search! Please select an app:',
                 reply_markup=InlineKeyboardMarkup([
                     [
@@ -728,7 +1338,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             partner_id = users[user_id]['matched_with']
             users[user_id]['chat_requested'] = True
             
-            await query.edit_message_text(
+            await edit_query(query,
                 "💬 Chat request sent!\n\n"
                 "⏳ Waiting for your partner to accept...",
                 reply_markup=InlineKeyboardMarkup([
@@ -780,7 +1390,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     reply_markup=ReplyKeyboardRemove()
                 )
                 
-                await query.edit_message_text(
+                await edit_query(query,
                     "💬 Anonymous chat started!\n\n"
                     "📝 Send any message and it will be forwarded to your partner anonymously.\n"
                     "🔒 Your identity is protected.\n\n"
@@ -802,7 +1412,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if query.data == 'decline_chat':
         if user_id in users and users[user_id].get('matched_with'):
             partner_id = users[user_id]['matched_with']
-            await query.edit_message_text(
+            await edit_query(query,
                 "❌ Chat request declined.\n\n"
                 "You can still coordinate using other means.",
                 reply_markup=InlineKeyboardMarkup([
@@ -831,7 +1441,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if query.data == 'cancel_chat_request':
         if user_id in users:
             users[user_id]['chat_requested'] = False
-            await query.edit_message_text(
+            await edit_query(query,
                 "❌ Chat request cancelled.",
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("💬 Start Chat", callback_data="start_chat")],
@@ -850,6 +1460,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 users[partner_id]['chat_active'] = False
                 active_chats.pop(user_id, None)
                 active_chats.pop(partner_id, None)
+                chat_buffer.discard(user_id, partner_id)
                 
                 await context.bot.send_message(
                     chat_id=partner_id,
@@ -864,7 +1475,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     ])
                 )
             
-            await query.edit_message_text(
+            await edit_query(query,
                 "💬 Chat ended.\n\n"
                 "You can restart the chat or end the match.",
                 reply_markup=InlineKeyboardMarkup([
@@ -879,30 +1490,29 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if query.data == 'end_match':
         if user_id in users:
             partner_id = users[user_id].get('matched_with')
+            if partner_id:
+                record_event('cancelled', user_id, context, stage='matched')
             if partner_id and partner_id in users:
-                users[user_id]['matched_with'] = None
-                users[user_id]['chat_active'] = False
-                users[user_id]['chat_requested'] = False
-                users[partner_id]['matched_with'] = None
-                users[partner_id]['chat_active'] = False
-                users[partner_id]['chat_requested'] = False
-                users[partner_id]['step'] = 'idle'
+                drop_partner(user_id, partner_id)
+                set_step(partner_id, 'idle')
                 active_chats.pop(user_id, None)
                 active_chats.pop(partner_id, None)
                 
+                buttons = [[InlineKeyboardButton("🔄 Find New Match", callback_data="new_search")]]
+                if users[partner_id].get('last_cart'):
+                    buttons.insert(0, [RESUME_BUTTON])
                 await context.bot.send_message(
                     chat_id=partner_id,
                     text=f"🔌 Match Disconnected!\n\n"
                          f"❌ {users[user_id]['pseudonym']} has ended the match.\n"
                          "💔 The connection has been terminated.\n\n"
-                         "You can start a new search to find another partner.",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🔄 Find New Match", callback_data="new_search")]
-                    ])
+                         "You can resume with the same cart or start a new search.",
+                    reply_markup=InlineKeyboardMarkup(buttons)
                 )
             
-            users[user_id]['step'] = 'idle'
-            await query.edit_message_text(
+            users[user_id].pop('last_cart', None)
+            set_step(user_id, 'idle')
+            await edit_query(query,
                 "❌ Match ended.\n\n"
                 "Thank you for using DeliveryShare! Use /start to find a new match.",
                 reply_markup=InlineKeyboardMarkup([
@@ -916,9 +1526,37 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await end_session(update, context)
         return
     
+    if query.data == 'resume_search':
+        if user_id in users and users[user_id].get('step') == 'idle' and users[user_id].get('last_cart'):
+            await edit_query(query, '🔁 Resuming your search...')
+            await resume_search(context, user_id)
+        else:
+            await edit_query(query,
+                'This search can no longer be resumed. Use /start to begin a new one.'
+            )
+        return
+    
+    if query.data == 'edit_cart':
+        # Sent as a new message: the one pressed is the status the wheel keeps editing
+        if users.get(user_id, {}).get('step') in EDITABLE_STEPS:
+            text, reply_markup = cart_editor(user_id)
+            await context.bot.send_message(chat_id=query.message.chat_id, text=text,
+                                           reply_markup=reply_markup, parse_mode='Markdown')
+        return
+    
+    if query.data in ['edit_cart_total', 'edit_min_for_free']:
+        if users.get(user_id, {}).get('step') not in EDITABLE_STEPS:
+            await edit_query(query, "This search has ended, so there's nothing to edit.")
+            return
+        field = query.data[len('edit_'):]
+        users[user_id]['editing'] = field
+        label = 'cart total' if field == 'cart_total' else 'minimum order for free delivery'
+        await edit_query(query, f"Send the new {label} (now ₹{users[user_id].get(field, 0):.2f}):")
+        return
+    
     if query.data == 'confirm_cart':
         if user_id in users:
-            users[user_id]['step'] = 'min_for_free'
+            set_step(user_id, 'min_for_free')
             await context.bot.send_message(
                 chat_id=user_id,
                 text=f"✅ Cart confirmed! Total: ₹{users[user_id].get('cart_total', 0):.2f}\n\n"
@@ -927,8 +1565,182 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
         return
 
+def is_admin(update: Update) -> bool:
+    return bool(update.effective_user) and str(update.effective_user.id) in ADMIN_IDS
+
+def ops_authorized(request) -> bool:
+    """Check the ops API token from the X-Ops-Token header or ?token=."""
+    token = request['headers'].get('x-ops-token') or request['query'].get('token')
+    return bool(OPS_TOKEN) and token == OPS_TOKEN
+
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/trace <user_id|trace_id> - show recent spans (admin only)."""
+    if not is_admin(update):
+        return
+    target = context.args[0] if context.args else None
+    if target and '-' in target:
+        rows = tracing.export(trace_id=target, limit=40)
+    else:
+        rows = tracing.export(user_id=target, limit=40)
+    skips = ', '.join(f"{k}={v}" for k, v in sorted(tracing.counters.items())) or 'none'
+    text = f"{tracing.format_spans(rows) or 'No spans recorded.'}\n\nCounters: {skips}"
+    await update.message.reply_text(text[-4000:])
+
+ADMIN_QUERIES = ['stats', 'pool', 'oldest', 'fairness', 'chats', 'jobs', 'latency', 'profile', 'expire', 'rematch']
+ADMIN_OLDEST_MAX = 100  # /admin oldest lists at most this many searchers
+
+async def admin_query(application, name, arg=None):
+    """Answer an operator query from the state indexes; returns a JSON-able dict."""
+    now = application.bot_data.get('current_time', 0)
+    if name == 'pool':
+        by_app = demand.by_app()
+        return {
+            'carts': len(carts),
+            'by_app': by_app,
+            'top_cells': {app: [{'cell': cell, 'center': geocells.center(cell), 'open': n}
+                                for cell, n in demand.top_cells(app, 5)] for app in by_app}
+        }
+    if name == 'oldest':
+        try:
+            limit = int(arg or 10)
+        except ValueError:
+            return {'error': 'oldest takes a number of searchers'}
+        oldest = []
+        for key, user_id in waiting.smallest(max(1, min(limit, ADMIN_OLDEST_MAX))):
+            user = users[user_id]
+            oldest.append({'user': user_id, 'app': user.get('app'), 'cell': user.get('cell'),
+                           'waiting_s': now - user.get('search_start_time', now),
+                           'effective_wait_s': now - key})
+        return {'searching': len(waiting), 'oldest': oldest}
+    if name == 'fairness':
+        return {'searching': len(waiting), 'time_to_match': time_to_match.summary()}
+    if name == 'chats':
+        return {'active_chats': len(active_chats) // 2,
+                'matched_users': len(users_by_step.get('matched', {})),
+                'buffered_messages': len(chat_buffer),
+                'delivery': dict(sum(chat_buffer.sessions.values(), collections.Counter())),
+                # With a user ID: delivery counters for each of that user's sessions
+                'sessions': {'-'.join(key): dict(counts) for key, counts in chat_buffer.sessions.items()
+                             if arg in key} if arg else None}
+    if name == 'jobs':
+        jobs = application.job_queue.jobs()
+        loop_time = datetime.datetime.now(datetime.timezone.utc)
+        by_kind = collections.Counter('search' if (job.name or '').startswith('search_') else job.name
+                                      for job in jobs)
+        # Spread of search jobs over the interval: how many fire in each second slot
+        spread = collections.Counter(
+            int((job.next_t - loop_time).total_seconds()) % int(SEARCH_INTERVAL)
+            for job in jobs if (job.name or '').startswith('search_') and job.next_t
+        )
+        return {'jobs': len(jobs), 'by_kind': dict(by_kind), 'search_spread': dict(sorted(spread.items())),
+                'search_wheel': len(search_wheel)}
+    if name == 'latency':
+        processor = application.update_processor
+        return {
+            'p50_ms': processor.latency_percentile(50),
+            'p99_ms': processor.latency_percentile(99),
+            'pending': processor.pending,
+            'active': processor.active,
+            'shed': processor.shed_count,
+            'throttled': rate_limiter.throttled,
+            'send_pool_wait_p50_ms': application.bot.request.pool_wait_percentile(50),
+            'send_pool_wait_p99_ms': application.bot.request.pool_wait_percentile(99),
+            'sends_in_flight': application.bot.request.in_flight
+        }
+    if name == 'profile':
+        # With a duration: start profiling; without: the last run's report
+        if arg:
+            if profiler.running:
+                return {'error': 'a profile is already running'}
+            try:
+                return {'profiling_s': profiler.start(arg)}
+            except ValueError:
+                return {'error': 'profile duration must be a positive number of seconds'}
+        return {'running': profiler.running, 'report': profiler.report}
+    if name in ['expire', 'rematch']:
+        if not arg or arg not in users:
+            return {'error': f'unknown user {arg}'}
+        if users[arg].get('step') != 'searching':
+            return {'error': f"user {arg} is {users[arg].get('step')}, not searching"}
+        context = application.context_types.context(application)
+        if name == 'expire':
+            await expire_search(context, arg, "⏱️ Your search was ended. Use /start to try again.")
+            return {'expired': arg}
+        return {'user': arg, 'matched': await search_for_matches(context, arg)}
+    # stats: one-line summary of everything cheap
+    return {
+        'users': len(users),
+        'by_step': {step: len(members) for step, members in users_by_step.items()},
+        'carts': len(carts),
+        'scheduled': len(scheduled_carts),
+        'road_cache': {'hits': road_distance.hits, 'misses': road_distance.misses} if road_distance else None,
+        'active_chats': len(active_chats) // 2,
+        'status_wheel': len(status_wheel),
+        'edits_skipped': edit_coalescer.skipped,
+        'edits_coalesced': edit_coalescer.coalesced,
+        'buffered_messages': len(chat_buffer),
+        'draining': draining,
+        **speedups.describe()
+    }
+
+async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/admin <stats|pool|oldest [n]|fairness|chats [user]|jobs|latency|profile [seconds]|expire <user>|rematch <user>> (admin only)."""
+    if not is_admin(update):
+        return
+    name = context.args[0] if context.args else 'stats'
+    if name not in ADMIN_QUERIES:
+        await update.message.reply_text(f"Usage: /admin <{'|'.join(ADMIN_QUERIES)}> [arg]")
+        return
+    result = await admin_query(context.application, name, context.args[1] if len(context.args) > 1 else None)
+    await update.message.reply_text(json.dumps(result, indent=1, default=str)[:4000])
+
+def admin_endpoint(application):
+    """Build the GET /admin?q=<query>&arg=... handler (requires the ops token)."""
+    async def handle(request):
+        if not ops_authorized(request):
+            return 403, 'forbidden'
+        name = request['query'].get('q', 'stats')
+        if name not in ADMIN_QUERIES:
+            return 404, {'error': f'unknown query {name}', 'queries': ADMIN_QUERIES}
+        result = await admin_query(application, name, request['query'].get('arg'))
+        return (400 if 'error' in result else 200), result
+    return handle
+
+async def profile_endpoint(request):
+    """GET /profile?seconds=N - profile the loop and return collapsed stacks (requires the ops token)."""
+    if not ops_authorized(request):
+        return 403, 'forbidden'
+    seconds = request['query'].get('seconds')
+    if seconds:
+        if profiler.running:
+            return 400, 'a profile is already running'
+        try:
+            await profiler.run(seconds)
+        except ValueError:
+            return 400, 'seconds must be a positive number'
+    return 200, profiler.collapsed()
+
+def traces_endpoint(request):
+    """GET /traces?user=...|trace=...&limit=... (requires the ops token)."""
+    if not ops_authorized(request):
+        return 403, 'forbidden'
+    query = request['query']
+    try:
+        limit = int(query.get('limit', '200'))
+    except ValueError:
+        return 400, 'limit must be an integer'
+    # More than the ring buffer holds can't be returned anyway
+    limit = max(1, min(limit, tracing.spans.maxlen))
+    return 200, {
+        'spans': tracing.export(trace_id=query.get('trace'), user_id=query.get('user'), limit=limit),
+        'counters': dict(tracing.counters)
+    }
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log Errors caused by Updates."""
+    if is_not_modified(context.error):
+        logger.debug(f"Ignoring no-op edit: {context.error}")
+        return
     logger.warning('Update "%s" caused error "%s"', update, context.error)
     
     if update and hasattr(update, 'effective_chat') and update.effective_chat:
@@ -940,8 +1752,171 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         except Exception as e:
             logger.error(f"Error sending error message: {e}")
 
+async def drain(application) -> None:
+    """Hand this instance over: stop taking new sessions, finish in-flight work,
+    snapshot, release the lease and only then stop polling.
+
+    Polling keeps running until the snapshot is written so that updates
+    arriving meanwhile still reach reject_while_draining and get a restart
+    notice, instead of sitting unacknowledged at Telegram.
+    """
+    global draining
+    draining = True
+    logger.info("Draining: new sessions are turned away")
+    processor = application.update_processor
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while (processor.pending or processor.active) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if processor.pending or processor.active:
+        logger.warning(f"Drain timed out with {processor.pending} pending and {processor.active} active updates")
+    await edit_coalescer.flush()
+    # One last try at buffered messages, ignoring backoff; whatever is left is spilled with the snapshot
+    for channel in chat_buffer.due(float('inf')):
+        if time.monotonic() >= deadline:
+            break
+        await flush_chat(application.bot, channel, time.time())
+    # Search ticks would otherwise keep matching users after the snapshot is taken
+    scheduler = application.job_queue.scheduler if application.job_queue else None
+    if scheduler is not None and scheduler.running:
+        scheduler.pause()
+    persist_state(application)
+    # The snapshot is on disk; let the next instance take over, then step back from getUpdates
+    instance_lease.release()
+    if application.updater.running:
+        await application.updater.stop()
+    logger.info("Drain complete")
+
+def persist_state(application) -> None:
+    """Write the snapshot, spill undelivered chat messages and flush events.
+
+    Runs once: after it, every update is turned away (see reject_while_draining)
+    because anything it changed would not reach the next instance.
+    """
+    global state_persisted
+    if state_persisted:
+        return
+    state_persisted = True
+    save_state(application)
+    try:
+        spilled = chat_buffer.spill(CHAT_SPILL_PATH)
+        if spilled:
+            logger.info(f"Spilled {spilled} undelivered chat messages to {CHAT_SPILL_PATH}")
+    except Exception as e:
+        logger.error(f"Failed to spill chat buffer: {e}")
+    try:
+        event_log.flush_sync()
+    except Exception as e:
+        logger.error(f"Failed to flush events: {e}")
+
+def save_state(application) -> None:
+    """Dump users, carts and active chats to SNAPSHOT_PATH."""
+    try:
+        start = time.perf_counter()
+        size = snapshot.save(SNAPSHOT_PATH, users, carts, active_chats,
+                             clock=application.bot_data.get('current_time', 0))
+        logger.info(f"Saved snapshot of {len(users)} users and {len(carts)} carts "
+                    f"({size} bytes) in {time.perf_counter() - start:.3f}s")
+    except Exception as e:
+        logger.error(f"Failed to save snapshot: {e}", exc_info=True)
+
+def restore_state(application) -> None:
+    """Reload the snapshot left by the previous instance and re-arm its searches.
+
+    Restored searches go on the shared search wheel rather than getting one
+    scheduler job each, so re-arming is a set insert per searcher.
+    """
+    if not os.path.exists(SNAPSHOT_PATH):
+        return
+    # Every restored object survives, so cyclic GC passes over them are pure overhead
+    # (they doubled the restore time); collection resumes once the state is rebuilt
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _restore_snapshot(application)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _restore_snapshot(application) -> None:
+    try:
+        start = time.perf_counter()
+        restored_users, restored_carts, restored_chats, clock = snapshot.load(SNAPSHOT_PATH)
+    except (OSError, ValueError, snapshot.SnapshotError) as e:
+        logger.error(f"Failed to load snapshot {SNAPSHOT_PATH}: {e}")
+        return
+    
+    # Bulk equivalent of set_step() and add_cart() on a fresh instance: the
+    # indexes start empty, so nothing needs removing and the waiting heap
+    # is built with one heapify. Search start times are rebased onto this
+    # instance's clock on the way through.
+    shift = application.bot_data.get('current_time', 0) - clock
+    users.update(restored_users)
+    queued, searching, scheduled = [], [], []
+    for user_id, user in sorted(restored_users.items(), key=lambda item: item[1].get('search_start_time', 0)):
+        if 'search_start_time' in user:
+            user['search_start_time'] += shift
+        step = user.get('step')
+        if step is None:
+            continue
+        users_by_step.setdefault(step, {})[user_id] = None
+        _indexed_step[user_id] = step
+        if step == 'searching':
+            queued.append((user_id, user.get('search_start_time', 0) - user.get('wait_credit', 0)))
+            searching.append(user_id)
+        elif step == 'scheduled' and user.get('scheduled_window'):
+            scheduled.append(user_id)
+    waiting.extend(queued)
+    active_chats.update(restored_chats)
+    for user_id, cart in restored_carts.items():
+        carts[user_id] = cart
+        if matcher_pool is not None:
+            matcher_pool.put(cart)
+        if cart.get('cell') is not None:
+            cart_cells.add(cart['cell'], user_id)
+            demand.add(cart['cell'], cart.get('app'), cart.get('cart_total', 0))
+            cart_buckets.add(user_id, cart.get('fingerprint'), cart.get('store_id'))
+    # Dormant carts aren't in the snapshot's cart columns; rebuild them from the user
+    for user_id in scheduled:
+        schedule_cart(build_cart(user_id), tuple(users[user_id]['scheduled_window']))
+    
+    # Re-armed in bulk: one shared tick job walks the search wheel, with the
+    # restored searches dealt evenly over its slots
+    search_wheel.spread(searching)
+    status_wheel.spread(user_id for user_id in searching if restored_users[user_id].get('status_message_id'))
+    
+    # A snapshot is only valid once; don't resurrect it after a crash
+    os.remove(SNAPSHOT_PATH)
+    logger.info(f"Restored {len(restored_users)} users, {len(restored_carts)} carts and "
+                f"{len(searching)} searches in {time.perf_counter() - start:.3f}s")
+
+async def shutdown(application) -> None:
+    """Stop the application, persist state and release the instance lease."""
+    started = application.running
+    if application.updater.running:
+        await application.updater.stop()
+    # Deferred edits still need the bot, which application.stop() shuts down
+    await edit_coalescer.flush()
+    if profiler.running:
+        # Cut a profile short rather than lose it: its report is written on the way out
+        profiler.stop()
+        await profiler.wait()
+    if application.running:
+        await application.stop()
+    if application.post_stop is not None:
+        await application.post_stop(application)
+    if not started:
+        # Never took over (e.g. stopped while waiting for a handoff): the
+        # snapshot on disk still belongs to the previous instance
+        instance_lease.release()
+        return
+    # Already done by drain() after a SIGTERM; this covers Ctrl+C and crashes
+    persist_state(application)
+    instance_lease.release()
+
 async def main_async() -> None:
     """Async entry point for the bot."""
+    global matcher_pool
+    application = None
     try:
         if not TOKEN:
             error_msg = "❌ Error: No TOKEN provided. Set the TELEGRAM_BOT_TOKEN environment variable."
@@ -972,10 +1947,20 @@ async def main_async() -> None:
             logger.error(error_msg)
             return
 
+        # Bounded worker pool: callbacks and chat relay first, new sessions last
+        update_processor = PriorityUpdateProcessor(
+            workers=int(os.getenv('UPDATE_WORKERS', '16')),
+            max_pending=int(os.getenv('UPDATE_MAX_PENDING', '256')),
+            is_chatting=lambda uid: uid in active_chats
+        )
+        # Long polling gets its own small pool so sends never queue behind getUpdates
+        outbound_request, updates_request = transport.build_requests()
         application = (
             Application.builder()
             .token(TOKEN)
-            .concurrent_updates(True)
+            .concurrent_updates(update_processor)
+            .request(outbound_request)
+            .get_updates_request(updates_request)
             .build()
         )
         print("✅ Application created successfully")
@@ -993,6 +1978,21 @@ async def main_async() -> None:
             logger.error(error_msg)
             return
 
+        # Health endpoints come up first so the platform sees this instance as live
+        # while it waits for the previous one to hand over
+        ops_server.route('/healthz', lambda request: (200, 'ok'))
+        ops_server.route('/ready', lambda request: (503, 'draining') if draining or not application.updater.running
+                         else (200, 'ready'))
+        ops_server.route('/traces', traces_endpoint)
+        ops_server.route('/profile', profile_endpoint)
+        ops_server.route('/admin', admin_endpoint(application))
+        await ops_server.start()
+        
+        if 'STATE_DIR' not in os.environ:
+            logger.warning("STATE_DIR is not set: the snapshot and handoff lease are in the working directory "
+                           "and only reach an instance that shares it")
+        handed_off = await instance_lease.acquire(timeout=HANDOFF_TIMEOUT)
+        
         application.bot_data['current_time'] = 0
         
         async def update_time(context: ContextTypes.DEFAULT_TYPE):
@@ -1004,11 +2004,72 @@ async def main_async() -> None:
             first=1,
             name='update_time'
         )
+        
+        application.job_queue.run_repeating(
+            activate_scheduled,
+            interval=SCHEDULE_TICK,
+            first=SCHEDULE_TICK,
+            name='activate_scheduled'
+        )
+        
+        application.job_queue.run_repeating(
+            advance_search_wheel,
+            interval=SEARCH_TICK,
+            first=SEARCH_TICK,
+            name='wheel_search'
+        )
+        
+        application.job_queue.run_repeating(
+            refresh_search_status,
+            interval=STATUS_TICK,
+            first=STATUS_TICK,
+            name='search_status'
+        )
+        
+        application.job_queue.run_repeating(
+            deliver_buffered,
+            interval=CHAT_RETRY_TICK,
+            first=CHAT_RETRY_TICK,
+            name='deliver_buffered'
+        )
+        
+        async def heartbeat_lease(context: ContextTypes.DEFAULT_TYPE):
+            instance_lease.heartbeat()
+        
+        application.job_queue.run_repeating(
+            heartbeat_lease,
+            interval=5.0,
+            first=5,
+            name='heartbeat_lease'
+        )
+        
+        async def flush_events(context: ContextTypes.DEFAULT_TYPE):
+            await event_log.flush()
+        
+        application.job_queue.run_repeating(
+            flush_events,
+            interval=5.0,
+            first=5,
+            name='flush_events'
+        )
 
+        load_road_graph()
+        if MATCHER_WORKERS > 0:
+            matcher_pool = MatcherPool(capacity=MATCHER_CAPACITY, workers=MATCHER_WORKERS)
+        restore_state(application)
+        loaded = chat_buffer.load(CHAT_SPILL_PATH, time.time())
+        if loaded:
+            logger.info(f"Loaded {loaded} undelivered chat messages from {CHAT_SPILL_PATH}")
+
+        application.add_handler(TypeHandler(Update, reject_while_draining), group=-2)
+        application.add_handler(TypeHandler(Update, throttle_updates), group=-1)
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("end", end_session))
         application.add_handler(CommandHandler("stop", stop))
+        application.add_handler(CommandHandler("edit", edit_command))
+        application.add_handler(CommandHandler("trace", trace_command))
+        application.add_handler(CommandHandler("admin", admin_command))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         application.add_handler(MessageHandler(filters.LOCATION, handle_location))
         application.add_handler(CallbackQueryHandler(button_callback))
@@ -1027,18 +2088,27 @@ async def main_async() -> None:
             logger.error(f"Failed to get bot info: {e}", exc_info=True)
 
         print("🚀 Starting bot...")
-        await application.bot.delete_webhook(drop_pending_updates=True)
+        # After a handoff, updates queued at Telegram during the switch belong to restored sessions
+        await application.bot.delete_webhook(drop_pending_updates=not handed_off)
         await application.initialize()
         await application.start()
         await application.updater.start_polling(
             allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
+            drop_pending_updates=not handed_off
         )
         
         print("✅ Bot is now running. Press Ctrl+C to stop.")
         
-        while True:
-            await asyncio.sleep(3600)
+        # Render stops instances with SIGTERM: drain, then the finally block snapshots state
+        stop_requested = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_requested.set)
+        except NotImplementedError:
+            pass
+        
+        await stop_requested.wait()
+        print("\n🛑 SIGTERM received, draining...")
+        await drain(application)
             
     except asyncio.CancelledError:
         print("\n🛑 Shutdown signal received...")
@@ -1050,20 +2120,24 @@ async def main_async() -> None:
         
     finally:
         print("\n🛑 Stopping bot...")
-        if application.updater.running:
-            await application.updater.stop()
-        if application.running:
-            await application.stop()
-        if application.post_stop is not None:
-            await application.post_stop(application)
+        if application is not None:
+            await shutdown(application)
+        await ops_server.stop()
+        if matcher_pool is not None:
+            matcher_pool.close()
         print("✅ Bot has been stopped.")
 
-
 if __name__ == '__main__':
+    if not TOKEN:
+        print("Error: TELEGRAM_BOT_TOKEN environment variable not set!")
+        print("Please create a .env file with TELEGRAM_BOT_TOKEN=your_token_here")
+        sys.exit(1)
+    configure_logging()
     print("=== Starting DeliveryShare Bot ===")
     print(f"Python version: {sys.version}")
     print(f"python-telegram-bot version: {__import__('telegram').__version__}")
     print(f"APScheduler available: {APSCHEDULER_AVAILABLE}")
+    print(f"Runtime: {speedups.describe()}")
     print(f"Using token: {TOKEN[:5] if TOKEN else 'None'}...{TOKEN[-5:] if TOKEN else 'None'}")
     
     # Configure logging
@@ -1071,7 +2145,7 @@ if __name__ == '__main__':
     
     # Run the main function
     try:
-        asyncio.run(main_async())
+        speedups.run(main_async())
     except KeyboardInterrupt:
         print("\n👋 Bot stopped by user")
     except Exception as e:
@@ -0,0 +1,161 @@
+"""Cart link ingestion.
+
+Recognises Zepto/Swiggy/Zomato cart links in a message and turns them
+into a parsed cart dict:
+
+    {'app': 'Zepto', 'items': ['amul taaza milk 1l', ...],
+     'cart_total': 412.0, 'store_id': 'BLR-KOR-04'}
+
+Parsing goes through a pluggable CartParser. The bundled
+FixtureCartParser answers from a local JSON file of {url: cart} and is
+what tests and local runs use. A production parser only has to implement
+`parse()` and is plugged in by name with load_parser("module:Class").
+Results (including failures) are kept in an LRU+TTL cache
+keyed by URL, so sharing the same link again does no work.
+"""
+import abc
+import asyncio
+import importlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+APP_HOSTS = {
+    'Zepto': ('zeptonow.com', 'zepto.co', 'zepto.com'),
+    'Swiggy': ('swiggy.com', 'swiggy.in', 'swig.gy'),
+    'Zomato': ('zomato.com', 'zoma.to'),
+}
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"]+', re.IGNORECASE)
+
+
+def normalise_item(name):
+    """Lower-case an item name and collapse whitespace and punctuation."""
+    return ' '.join(re.sub(r'[^\w.]+', ' ', str(name).lower()).split())
+
+
+def detect_app(url):
+    """Return the app a URL belongs to, or None."""
+    host = (urlsplit(url).hostname or '').lower()
+    for app, hosts in APP_HOSTS.items():
+        if any(host == h or host.endswith('.' + h) for h in hosts):
+            return app
+    return None
+
+
+def find_cart_url(text):
+    """Return (url, app) for the first recognised cart link in `text`."""
+    for match in URL_PATTERN.finditer(text or ''):
+        url = match.group(0).rstrip('.,)')
+        app = detect_app(url)
+        if app:
+            return url, app
+    return None
+
+
+class CartParser(abc.ABC):
+    """Turns a cart URL into a parsed cart dict (see module docstring)."""
+
+    @abc.abstractmethod
+    async def parse(self, url, app):
+        """Return the parsed cart for `url`, or None if it isn't a readable cart."""
+
+
+class FixtureCartParser(CartParser):
+    """Answers from a local JSON file mapping URLs to carts."""
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            self._carts = json.load(f)
+
+    async def parse(self, url, app):
+        cart = self._carts.get(url)
+        if cart is None:
+            return None
+        return {
+            'app': cart.get('app', app),
+            'items': [normalise_item(item) for item in cart.get('items', [])],
+            'cart_total': float(cart['cart_total']),
+            'store_id': cart.get('store_id'),
+        }
+
+
+def load_parser(spec):
+    """Instantiate a CartParser given as module:Class."""
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError(f"Expected module:Class, got {spec!r}")
+    parser = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(parser, CartParser):
+        raise TypeError(f"{spec} is not a CartParser")
+    return parser
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size=1024, ttl=600.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # {key: (expires_at, value)}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] < self._clock():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._entries[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+_MISS = object()
+
+
+class CartIngestor:
+    """Parses cart links through a CartParser with caching and a timeout."""
+
+    def __init__(self, parser, cache=None, timeout=10.0, failure_ttl=60.0):
+        self.parser = parser
+        self.cache = cache if cache is not None else TTLCache()
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self._inflight = {}  # {url: Future} so concurrent shares parse once
+
+    async def ingest(self, url, app):
+        """Return the parsed cart for `url`, or None if it can't be read."""
+        cached = self.cache.get(url, _MISS)
+        if cached is not _MISS:
+            return cached
+        future = self._inflight.get(url)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        result = None
+        try:
+            result = await asyncio.wait_for(self.parser.parse(url, app), self.timeout)
+        except Exception as e:
+            logger.warning(f"Failed to parse {app} cart link: {e}")
+        finally:
+            del self._inflight[url]
+            future.set_result(result)
+        self.cache.set(url, result, ttl=None if result else self.failure_ttl)
+        return result
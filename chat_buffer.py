@@ -0,0 +1,200 @@
+"""Store-and-forward buffer for relayed chat messages.
+
+When a relay to a partner fails (timeout, flood control, network), the
+message is queued instead of lost. Messages are queued per channel - one
+(sender, recipient) pair - so order is kept within a conversation and
+the messages of one match can be dropped without touching any other.
+A periodic job retries due channels with exponential backoff, or with
+the server's retry_after when rate-limited. Queues are capped in length
+and entries expire after a TTL, so a partner who never comes back costs
+a bounded amount of memory. A partner who blocked the bot is a permanent
+failure: the channel is dropped and the sender is told.
+
+Ending a chat or match must call discard(), so nothing queued for it is
+delivered after the two users have parted. A channel is flushed by one
+caller at a time; a retry tick that finds it already being flushed
+(e.g. by the shutdown drain) leaves it alone.
+
+Delivery counters are kept per session (the unordered pair of users),
+for the most recent sessions only. On shutdown, undelivered messages
+can be spilled to disk and are loaded again by the next instance.
+"""
+import logging
+import marshal
+import os
+import random
+from collections import Counter, OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+DELIVERED, RETRY, BLOCKED = 'delivered', 'retry', 'blocked'
+
+PERMANENT_ERRORS = ('bot was blocked', 'user is deactivated', 'chat not found', 'forbidden')
+
+
+def session_key(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def is_permanent(error):
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in PERMANENT_ERRORS)
+
+
+class ChatBuffer:
+    """Bounded per-channel outbound queues with TTL and retry backoff."""
+
+    def __init__(self, max_per_chat=50, ttl=3600.0, base_delay=2.0, max_delay=300.0, max_chats=10000,
+                 max_sessions=10000):
+        self.max_per_chat = max_per_chat
+        self.ttl = ttl
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_chats = max_chats
+        self.max_sessions = max_sessions
+        self._queues = {}  # {(sender, recipient): deque of [text, queued_at]}
+        self._retry = {}  # {(sender, recipient): (attempts, next attempt at)}
+        self._flushing = set()  # channels with a flush in progress
+        # {session_key: Counter(queued, delivered, dropped, expired)}, least recently used first
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def pending(self, recipient, sender):
+        return len(self._queues.get((sender, recipient), ()))
+
+    def _count(self, sender, recipient, field, n=1):
+        key = session_key(sender, recipient)
+        counts = self.sessions.get(key)
+        if counts is None:
+            counts = self.sessions[key] = Counter()
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(key)
+        counts[field] += n
+
+    def enqueue(self, recipient, sender, text, now):
+        """Queue a message; returns False if it had to be refused."""
+        channel = (sender, recipient)
+        queue = self._queues.get(channel)
+        if queue is None:
+            if len(self._queues) >= self.max_chats:
+                self._count(sender, recipient, 'dropped')
+                return False
+            queue = self._queues[channel] = deque()
+            self._retry[channel] = (0, now)
+        if len(queue) >= self.max_per_chat:
+            queue.popleft()
+            self._count(sender, recipient, 'dropped')
+        queue.append([text, now])
+        self._count(sender, recipient, 'queued')
+        return True
+
+    def due(self, now):
+        """(sender, recipient) channels whose next retry is due."""
+        return [channel for channel, (_, next_at) in self._retry.items() if next_at <= now]
+
+    def expire(self, now):
+        """Drop entries older than the TTL."""
+        for channel in list(self._queues):
+            queue = self._queues[channel]
+            while queue and now - queue[0][1] > self.ttl:
+                queue.popleft()
+                self._count(*channel, 'expired')
+            if not queue:
+                self._forget(channel)
+
+    def discard(self, a, b):
+        """Drop everything queued between users `a` and `b`, in both directions."""
+        for channel in ((a, b), (b, a)):
+            queue = self._queues.get(channel)
+            if queue:
+                self._count(*channel, 'dropped', len(queue))
+            self._forget(channel)
+
+    def _forget(self, channel):
+        self._queues.pop(channel, None)
+        self._retry.pop(channel, None)
+
+    async def flush(self, channel, send, now):
+        """Send a (sender, recipient) channel's queue in order with `await send(text)`.
+
+        Returns (outcome, n): DELIVERED when the queue is empty, RETRY
+        when a send failed and the channel was rescheduled (or another
+        flush of it is already running), BLOCKED when the recipient can't
+        be reached at all and the queue was dropped. `n` is how many
+        messages were delivered, or dropped when BLOCKED.
+        """
+        if channel in self._flushing:
+            return RETRY, 0
+        self._flushing.add(channel)
+        try:
+            return await self._flush(channel, send, now)
+        finally:
+            self._flushing.discard(channel)
+
+    async def _flush(self, channel, send, now):
+        queue = self._queues.get(channel)
+        delivered = 0
+        # Stop as soon as the channel is discarded (the chat ended) while a send is awaited
+        while queue and self._queues.get(channel) is queue:
+            entry = queue[0]
+            try:
+                await send(entry[0])
+            except Exception as e:
+                if self._queues.get(channel) is not queue:
+                    break
+                if is_permanent(e):
+                    dropped = len(queue)
+                    self._count(*channel, 'dropped', dropped)
+                    self._forget(channel)
+                    logger.info(f"Dropping buffered messages to unreachable {channel[1]}: {e}")
+                    return BLOCKED, dropped
+                attempts = self._retry.get(channel, (0, now))[0] + 1
+                # Flood control says exactly how long to wait (seconds or a timedelta)
+                delay = getattr(e, 'retry_after', None)
+                if hasattr(delay, 'total_seconds'):
+                    delay = delay.total_seconds()
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempts) * random.uniform(0.8, 1.2)
+                self._retry[channel] = (attempts, now + delay)
+                logger.debug(f"Relay to {channel[1]} failed ({e}); attempt {attempts}, retry in {delay:.1f}s")
+                return RETRY, delivered
+            if queue and queue[0] is entry:  # not already pushed out by a full queue
+                queue.popleft()
+            delivered += 1
+            self._count(*channel, 'delivered')
+        if self._queues.get(channel) is queue:
+            self._forget(channel)
+        return DELIVERED, delivered
+
+    def spill(self, path):
+        """Write undelivered messages to `path`; returns the number written."""
+        count = len(self)
+        if not count:
+            return 0
+        data = {channel: [list(entry) for entry in queue] for channel, queue in self._queues.items()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(data, f)
+        os.replace(tmp_path, path)
+        return count
+
+    def load(self, path, now):
+        """Queue messages spilled by a previous instance and remove the file."""
+        try:
+            with open(path, 'rb') as f:
+                data = marshal.load(f)
+        except (OSError, ValueError, EOFError) as e:
+            if os.path.exists(path):
+                logger.error(f"Failed to load chat buffer spill {path}: {e}")
+            return 0
+        loaded = 0
+        for (sender, recipient), entries in data.items():
+            for text, queued_at in entries:
+                if now - queued_at <= self.ttl and self.enqueue(recipient, sender, text, queued_at):
+                    loaded += 1
+        os.remove(path)
+        return loaded
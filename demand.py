@@ -0,0 +1,110 @@
+"""Per-geocell, per-app demand aggregates.
+
+Counters are updated incrementally as carts enter and leave the pool, so
+"how many Zepto carts are within 2 km" is answered by reading the cells
+in the radius rather than scanning carts. For each (cell, app) we keep:
+
+* the number of open carts
+* a histogram of cart totals in TOTAL_BUCKET-rupee buckets
+* the most recent time-to-match samples, for a median wait
+"""
+import heapq
+from collections import deque
+from statistics import median
+
+import geocells
+
+TOTAL_BUCKET = 100
+TOTAL_BUCKETS = 10  # the last bucket collects everything above 900
+WAIT_SAMPLES = 50
+
+
+def _app_key(app):
+    return str(app or '').lower().strip()
+
+
+def _bucket(total):
+    return min(int(float(total) // TOTAL_BUCKET), TOTAL_BUCKETS - 1)
+
+
+class _CellStats:
+    __slots__ = ('open', 'totals', 'waits')
+
+    def __init__(self):
+        self.open = 0
+        self.totals = [0] * TOTAL_BUCKETS
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+
+class DemandStats:
+    """Incrementally maintained cart counters keyed by app and geocell."""
+
+    def __init__(self):
+        self._apps = {}  # {app: {cell: _CellStats}}
+
+    def _stats(self, cell, app, create=False):
+        cells = self._apps.get(_app_key(app))
+        if cells is None:
+            if not create:
+                return None
+            cells = self._apps[_app_key(app)] = {}
+        stats = cells.get(cell)
+        if stats is None and create:
+            stats = cells[cell] = _CellStats()
+        return stats
+
+    def add(self, cell, app, total):
+        stats = self._stats(cell, app, create=True)
+        stats.open += 1
+        stats.totals[_bucket(total)] += 1
+
+    def remove(self, cell, app, total):
+        stats = self._stats(cell, app)
+        if stats is None or stats.open == 0:
+            return
+        stats.open -= 1
+        bucket = _bucket(total)
+        if stats.totals[bucket]:
+            stats.totals[bucket] -= 1
+        if stats.open == 0 and not stats.waits:
+            del self._apps[_app_key(app)][cell]
+
+    def record_match(self, cell, app, wait):
+        self._stats(cell, app, create=True).waits.append(wait)
+
+    def _within(self, cell, app, radius_km):
+        cells = self._apps.get(_app_key(app))
+        if not cells:
+            return
+        for k in range(geocells.rings_for_radius(cell, radius_km) + 1):
+            for neighbour in geocells.ring(cell, k):
+                stats = cells.get(neighbour)
+                if stats is not None:
+                    yield stats
+
+    def open_within(self, cell, app, radius_km):
+        """Number of open carts for `app` in the cells covering `radius_km`."""
+        return sum(stats.open for stats in self._within(cell, app, radius_km))
+
+    def totals_within(self, cell, app, radius_km):
+        """Histogram of cart totals for `app` in the cells covering `radius_km`."""
+        histogram = [0] * TOTAL_BUCKETS
+        for stats in self._within(cell, app, radius_km):
+            for i, count in enumerate(stats.totals):
+                histogram[i] += count
+        return histogram
+
+    def median_wait_within(self, cell, app, radius_km):
+        """Median recent time-to-match in seconds, or None without samples."""
+        waits = [wait for stats in self._within(cell, app, radius_km) for wait in stats.waits]
+        return median(waits) if waits else None
+
+    def top_cells(self, app, n=10):
+        """The `n` cells with the most open carts for `app`, as (cell, open) pairs."""
+        cells = self._apps.get(_app_key(app), {})
+        return heapq.nlargest(n, ((cell, stats.open) for cell, stats in cells.items() if stats.open),
+                              key=lambda item: item[1])
+
+    def by_app(self):
+        """Open carts per app across all cells."""
+        return {app: sum(stats.open for stats in cells.values()) for app, cells in self._apps.items()}
@@ -0,0 +1,119 @@
+"""Coalesced message edits.
+
+Button presses re-render the message they came from. A double tap or a
+quick "Back" produces edits that either repeat what is already shown -
+which Telegram rejects with "message is not modified" - or are replaced
+by another edit a moment later. EditCoalescer remembers a hash of the
+last text/markup sent to each message and:
+
+* skips an edit whose content is already on screen
+* sends the first edit to a message immediately, then holds further
+  edits arriving within `debounce` seconds and sends only the latest
+* treats "message is not modified" as success
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def is_not_modified(error):
+    return 'message is not modified' in str(error).lower()
+
+
+def _content_hash(text, reply_markup, kwargs):
+    markup = reply_markup.to_json() if hasattr(reply_markup, 'to_json') else repr(reply_markup)
+    return hash((text, markup, tuple(sorted(kwargs.items()))))
+
+
+class EditCoalescer:
+    """Deduplicates and debounces edit_message_text calls per message."""
+
+    def __init__(self, debounce=0.4, max_messages=20000):
+        self.debounce = debounce
+        self.max_messages = max_messages
+        self._shown = OrderedDict()  # {(chat_id, message_id): (content hash, sent at)}
+        self._pending = {}  # {(chat_id, message_id): (hash, bot, text, reply_markup, kwargs)}
+        self._tasks = set()  # deferred sends; the loop only keeps weak references to tasks
+        self.skipped = 0
+        self.coalesced = 0
+
+    def _remember(self, key, content):
+        self._shown[key] = (content, time.monotonic())
+        self._shown.move_to_end(key)
+        while len(self._shown) > self.max_messages:
+            self._shown.popitem(last=False)
+
+    def forget(self, chat_id, message_id):
+        """Drop what is known about a message (e.g. after it was deleted)."""
+        key = (str(chat_id), message_id)
+        self._shown.pop(key, None)
+        self._pending.pop(key, None)
+
+    async def edit(self, bot, chat_id, message_id, text, reply_markup=None, **kwargs):
+        """Edit a message unless it already shows this content.
+
+        Returns True if the edit was sent now, False if it was skipped or
+        deferred. Errors other than "not modified" propagate for edits sent
+        immediately and are logged for deferred ones.
+        """
+        key = (str(chat_id), message_id)
+        content = _content_hash(text, reply_markup, kwargs)
+
+        if key in self._pending:
+            # A deferred edit is already queued; replace its content
+            if self._pending[key][0] != content:
+                self.coalesced += 1
+            self._pending[key] = (content, bot, text, reply_markup, kwargs)
+            return False
+
+        shown = self._shown.get(key)
+        if shown is not None and shown[0] == content:
+            self.skipped += 1
+            tracing.count('edit_skipped')
+            return False
+
+        if shown is not None and time.monotonic() - shown[1] < self.debounce:
+            self._pending[key] = (content, bot, text, reply_markup, kwargs)
+            task = asyncio.get_running_loop().create_task(
+                self._send_later(key, self.debounce - (time.monotonic() - shown[1])))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return False
+
+        await self._send(key, content, bot, text, reply_markup, kwargs)
+        return True
+
+    async def flush(self):
+        """Wait for deferred edits to be sent; call before the bot shuts down."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, key, content, bot, text, reply_markup, kwargs):
+        self._remember(key, content)
+        try:
+            await bot.edit_message_text(chat_id=key[0], message_id=key[1], text=text,
+                                        reply_markup=reply_markup, **kwargs)
+        except Exception as e:
+            if not is_not_modified(e):
+                self._shown.pop(key, None)
+                raise
+
+    async def _send_later(self, key, delay):
+        await asyncio.sleep(max(0.0, delay))
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        content, bot, text, reply_markup, kwargs = entry
+        if self._shown.get(key, (None,))[0] == content:
+            self.skipped += 1
+            tracing.count('edit_skipped')
+            return
+        try:
+            await self._send(key, content, bot, text, reply_markup, kwargs)
+        except Exception as e:
+            logger.warning(f"Deferred edit of message {key[1]} in chat {key[0]} failed: {e}")
@@ -0,0 +1,136 @@
+"""Structured demand events and an offline aggregator.
+
+The bot emits compact events (cart_created, matched, expired, cancelled,
+resumed, cart_edited) into an in-memory buffer. A periodic job flushes
+the buffer in batches to an append-only NDJSON file from a worker
+thread, rotating the file once it grows past a size limit. Events carry
+the geocell, app and a few numbers - never user IDs or coordinates.
+
+Aggregate offline, without touching the running bot:
+
+    python events.py events.ndjson events.ndjson.1 > demand.csv
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from statistics import median
+
+import geocells
+import speedups
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('cart_created', 'matched', 'expired', 'cancelled', 'resumed', 'cart_edited')
+
+
+class EventLog:
+    """Buffered, rotated NDJSON event writer."""
+
+    def __init__(self, path='events.ndjson', max_bytes=10 * 1024 * 1024, backups=5, max_buffer=100000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._lock = threading.Lock()  # a shutdown flush_sync() can overlap a threaded flush()
+        self.dropped = 0
+
+    def emit(self, event, **fields):
+        """Record an event; cheap enough to call from handlers."""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        fields['e'] = event
+        fields['t'] = int(time.time())
+        self._buffer.append(fields)
+
+    async def flush(self):
+        """Write buffered events from a worker thread."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} events: {e}")
+
+    def flush_sync(self):
+        """Write buffered events on the calling thread (used at shutdown)."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def _write(self, batch):
+        data = ''.join(speedups.dumps(event) + '\n' for event in batch)
+        with self._lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+def read_events(paths):
+    """Yield decoded events from NDJSON files, skipping malformed lines."""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def aggregate(events, level=0):
+    """Return per-(cell, app, hour) demand stats.
+
+    `level` coarsens cells by that many steps up the geocell hierarchy.
+    """
+    stats = defaultdict(lambda: {'waits': [], **{event: 0 for event in EVENT_TYPES}})
+    for event in events:
+        kind = event.get('e')
+        if kind not in EVENT_TYPES or event.get('cell') is None:
+            continue
+        cell = geocells.parent(event['cell'], level) if level else event['cell']
+        hour = time.strftime('%Y-%m-%dT%H:00', time.gmtime(event.get('t', 0)))
+        row = stats[(cell, event.get('app', ''), hour)]
+        row[kind] += 1
+        if kind == 'matched' and event.get('wait') is not None:
+            row['waits'].append(event['wait'])
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate DeliveryShare demand events into CSV.")
+    parser.add_argument('paths', nargs='+', help="NDJSON event files")
+    parser.add_argument('--level', type=int, default=0, help="geocell levels to coarsen by")
+    args = parser.parse_args(argv)
+
+    stats = aggregate(read_events(args.paths), args.level)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['cell', 'lat', 'lon', 'app', 'hour', *EVENT_TYPES, 'median_wait_s'])
+    for (cell, app, hour), row in sorted(stats.items(), key=lambda item: (item[0][2], item[0][1], item[0][0])):
+        lat, lon = geocells.center(cell, args.level)
+        wait = median(row['waits']) if row['waits'] else ''
+        writer.writerow([cell, f"{lat:.4f}", f"{lon:.4f}", app, hour, *(row[e] for e in EVENT_TYPES), wait])
+
+
+if __name__ == '__main__':
+    main()
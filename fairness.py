@@ -0,0 +1,184 @@
+"""Wait-time fairness for matching.
+
+Searchers are kept in an indexed min-heap keyed on their effective search
+start: the start time minus any wait credit. Credit is the wait a user
+had already served before a partner dropped out, so a resumed search
+keeps its place in line instead of starting again at the back. That is
+the aging term. Joining, leaving and re-keying are O(log n) through the
+position map.
+
+When a search finds a cart, the matcher asks whether an older searcher
+could also take it under their own current radius and tolerance; if so
+the cart goes to the oldest of them. TimeToMatch keeps the wait
+distribution so the effect can be checked from /admin fairness.
+"""
+import heapq
+from collections import deque
+
+import geocells
+from search_policy import is_compatible
+
+# Upper bounds (seconds) of the time-to-match histogram buckets
+WAIT_BUCKETS = (60, 120, 300, 600, 1200, 1800)
+
+
+class IndexedHeap:
+    """Binary min-heap of (priority, item) with O(log n) update and remove by item."""
+
+    def __init__(self):
+        self._heap = []  # [(priority, item)]
+        self._pos = {}  # {item: index in _heap}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def priority(self, item):
+        pos = self._pos.get(item)
+        return None if pos is None else self._heap[pos][0]
+
+    def peek(self):
+        return self._heap[0] if self._heap else None
+
+    def smallest(self, n):
+        """The `n` lowest (priority, item) pairs, lowest first."""
+        return heapq.nsmallest(n, self._heap)
+
+    def push(self, item, priority):
+        """Insert `item`, or move it if it is already queued."""
+        pos = self._pos.get(item)
+        if pos is None:
+            self._heap.append((priority, item))
+            self._pos[item] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        old = self._heap[pos][0]
+        self._heap[pos] = (priority, item)
+        if priority < old:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def extend(self, pairs):
+        """Insert many (item, priority) pairs with one O(n) heapify instead of a push each."""
+        fresh = []
+        for item, priority in pairs:
+            if item in self._pos:
+                self.push(item, priority)
+            else:
+                fresh.append((priority, item))
+        if not fresh:
+            return
+        self._heap.extend(fresh)
+        heapq.heapify(self._heap)
+        self._pos = {item: i for i, (_, item) in enumerate(self._heap)}
+
+    def remove(self, item):
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            self._heap[pos] = last
+            self._pos[last[1]] = pos
+            self._sift_up(pos)
+            self._sift_down(self._pos[last[1]])
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._pos[self._heap[i][1]] = i
+        self._pos[self._heap[j][1]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._heap[i][0] >= self._heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        n = len(self._heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+
+def oldest_claimant(cart, user_id, carts, index, queue, policy, now, users, distance=None):
+    """The longest-waiting searcher who could take `cart`, defaulting to `user_id`.
+
+    `queue` is the IndexedHeap of searchers and `users` maps their IDs to
+    dicts with 'search_start_time' and optional 'excluded'. Every searcher
+    the spatial `index` has within the widest radius of the cart is a
+    candidate; those older than `user_id` are tried oldest first, each
+    against their own current radius and tolerance under `policy`, so an
+    older searcher only wins carts they could have found themselves.
+    `distance` is the optional provider used for the radius check (e.g.
+    road distance).
+    """
+    best_key = queue.priority(user_id)
+    older = []
+    for _, candidate_id in index.nearby(cart['cell'], policy.max_radius_km):
+        key = queue.priority(candidate_id)
+        if key is None or (best_key is not None and key >= best_key) or candidate_id == cart['user_id']:
+            continue
+        older.append((key, candidate_id))
+    older.sort()
+    for _, candidate_id in older:
+        candidate = users.get(candidate_id)
+        own_cart = carts.get(candidate_id)
+        if candidate is None or own_cart is None or cart['user_id'] in candidate.get('excluded', []):
+            continue
+        radius_km, tolerance = policy.step(now - candidate.get('search_start_time', 0))
+        distance_km = geocells.haversine_km(own_cart['location'], cart['location'])
+        if distance_km > radius_km or is_compatible(own_cart, cart, tolerance) is not None:
+            continue
+        if distance is not None and distance(own_cart, cart, distance_km) > radius_km:
+            continue
+        return candidate_id
+    return user_id
+
+
+class TimeToMatch:
+    """Recent time-to-match samples and a cumulative histogram."""
+
+    def __init__(self, samples=4096):
+        self.waits = deque(maxlen=samples)
+        self.histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self.reassigned = 0  # matches handed to an older searcher than the one whose tick found them
+
+    def record(self, wait):
+        if wait is None:
+            return
+        self.waits.append(wait)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def percentile(self, percentile):
+        if not self.waits:
+            return None
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def summary(self):
+        labels = [f"<={bound}s" for bound in WAIT_BUCKETS] + [f">{WAIT_BUCKETS[-1]}s"]
+        return {
+            'matches': sum(self.histogram),
+            'p50_s': self.percentile(50),
+            'p90_s': self.percentile(90),
+            'p99_s': self.percentile(99),
+            'max_s': max(self.waits) if self.waits else None,
+            'histogram': dict(zip(labels, self.histogram)),
+            'reassigned': self.reassigned,
+        }
@@ -0,0 +1,78 @@
+"""Compact item fingerprints for cart similarity.
+
+Each cart's normalised item names are reduced to a MinHash signature of
+NUM_HASHES small integers; the fraction of equal positions between two
+signatures estimates the Jaccard overlap of the item sets. Signatures are
+split into bands for locality-sensitive hashing: carts that share any
+band bucket (or the same dark store) become candidates without comparing
+against the whole pool.
+
+Hashes are derived from crc32, not hash(), so signatures are stable
+across processes and restarts.
+"""
+import zlib
+
+NUM_HASHES = 16
+BANDS = 4
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+_PRIME = (1 << 31) - 1
+# Fixed (a, b) pairs for the universal hash family h(x) = (a*x + b) mod p
+_COEFFICIENTS = tuple(
+    (1 + (zlib.crc32(f'a{i}'.encode()) % (_PRIME - 1)), zlib.crc32(f'b{i}'.encode()) % _PRIME)
+    for i in range(NUM_HASHES)
+)
+
+
+def minhash(items):
+    """Return the MinHash signature of an iterable of item names, or None if empty."""
+    hashed = {zlib.crc32(item.encode('utf-8')) for item in items if item}
+    if not hashed:
+        return None
+    return tuple(min((a * x + b) % _PRIME for x in hashed) for a, b in _COEFFICIENTS)
+
+
+def similarity(sig1, sig2):
+    """Estimated Jaccard similarity of two signatures (0.0 if either is missing)."""
+    if not sig1 or not sig2:
+        return 0.0
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / NUM_HASHES
+
+
+def bucket_keys(signature, store_id=None):
+    """LSH bucket keys for a cart: one per signature band plus its store."""
+    keys = []
+    if signature:
+        # Keys only live in this process's index, so the band slice itself is the key
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            keys.append((band, signature[start:start + ROWS_PER_BAND]))
+    if store_id:
+        keys.append(('store', store_id))
+    return keys
+
+
+class LSHIndex:
+    """Maps LSH bucket keys to the set of keys (user IDs) in each bucket."""
+
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, key, signature, store_id=None):
+        for bucket in bucket_keys(signature, store_id):
+            self._buckets.setdefault(bucket, set()).add(key)
+
+    def discard(self, key, signature, store_id=None):
+        for bucket in bucket_keys(signature, store_id):
+            members = self._buckets.get(bucket)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._buckets[bucket]
+
+    def candidates(self, signature, store_id=None):
+        """Keys sharing at least one bucket with the given fingerprint."""
+        found = set()
+        for bucket in bucket_keys(signature, store_id):
+            found.update(self._buckets.get(bucket, ()))
+        return found
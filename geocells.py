@@ -0,0 +1,149 @@
+"""Coarse geocells used to index carts by location.
+
+Locations are quantised on ingestion into integer cell IDs on a fixed
+lat/lon grid: 15 bits of latitude and 16 bits of longitude, which gives
+cells of roughly 0.6 x 0.6 km around Indian latitudes. Cell IDs are
+hierarchical - dropping the low bit of each axis yields the parent cell.
+
+Each cell has a precomputed neighbour table (rings of cells at Chebyshev
+distance k), so a radius search is a handful of set lookups instead of a
+scan over every cart.
+"""
+from functools import lru_cache
+from math import radians, sin, cos, sqrt, asin, ceil
+
+LAT_BITS = 15
+LON_BITS = 16
+LAT_ROWS = 1 << LAT_BITS
+LON_COLS = 1 << LON_BITS
+LAT_STEP = 180.0 / LAT_ROWS
+LON_STEP = 360.0 / LON_COLS
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+# Coordinates kept for the fine distance check are snapped to ~110 m
+COARSE_DECIMALS = 3
+
+
+def haversine_km(loc1, loc2):
+    """Great-circle distance between two (lat, lon) tuples in kilometers."""
+    lat1, lon1, lat2, lon2 = map(radians, [loc1[0], loc1[1], loc2[0], loc2[1]])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def coarsen(lat, lon):
+    """Snap a raw location to the precision kept in memory."""
+    return (round(lat, COARSE_DECIMALS), round(lon, COARSE_DECIMALS))
+
+
+def encode(lat, lon):
+    """Return the integer cell ID for a location."""
+    row = min(int((lat + 90.0) / LAT_STEP), LAT_ROWS - 1)
+    col = int((lon + 180.0) / LON_STEP) % LON_COLS
+    return (row << LON_BITS) | col
+
+
+def decode(cell):
+    """Return the (row, col) grid position of a cell."""
+    return cell >> LON_BITS, cell & (LON_COLS - 1)
+
+
+def center(cell, level=0):
+    """Return the (lat, lon) center of a cell, or of a parent cell `level` steps up."""
+    col_bits = LON_BITS - level
+    row, col = cell >> col_bits, cell & ((1 << col_bits) - 1)
+    scale = 1 << level
+    return (-90.0 + (row + 0.5) * LAT_STEP * scale, -180.0 + (col + 0.5) * LON_STEP * scale)
+
+
+def parent(cell, levels=1):
+    """Return the enclosing cell `levels` steps up the hierarchy."""
+    row, col = decode(cell)
+    return ((row >> levels) << (LON_BITS - levels)) | (col >> levels)
+
+
+def cell_size_km(cell):
+    """Return the smaller side of a cell in kilometers."""
+    lat = center(cell)[0]
+    height = LAT_STEP * KM_PER_DEG_LAT
+    width = LON_STEP * KM_PER_DEG_LAT * cos(radians(lat))
+    return min(height, width)
+
+
+def rings_for_radius(cell, radius_km):
+    """Number of rings around `cell` needed to cover `radius_km`."""
+    return max(0, ceil(radius_km / cell_size_km(cell)))
+
+
+def ring_distance(cell1, cell2):
+    """Chebyshev distance between two cells, i.e. the ring one lies in around the other."""
+    row1, col1 = decode(cell1)
+    row2, col2 = decode(cell2)
+    dcol = abs(col1 - col2)
+    return max(abs(row1 - row2), min(dcol, LON_COLS - dcol))
+
+
+@lru_cache(maxsize=64)
+def _ring_offsets(k):
+    """(drow, dcol) offsets of the cells at Chebyshev distance exactly k."""
+    if k == 0:
+        return ((0, 0),)
+    offsets = []
+    for d in range(-k, k + 1):
+        offsets.append((-k, d))
+        offsets.append((k, d))
+    for d in range(-k + 1, k):
+        offsets.append((d, -k))
+        offsets.append((d, k))
+    return tuple(offsets)
+
+
+@lru_cache(maxsize=65536)
+def ring(cell, k):
+    """Cell IDs at Chebyshev distance exactly k from `cell`."""
+    row, col = decode(cell)
+    cells = []
+    for drow, dcol in _ring_offsets(k):
+        r = row + drow
+        if 0 <= r < LAT_ROWS:
+            cells.append((r << LON_BITS) | ((col + dcol) % LON_COLS))
+    return tuple(cells)
+
+
+class CellIndex:
+    """Maps cell IDs to the set of keys (user IDs) located in them."""
+
+    def __init__(self):
+        self._cells = {}
+
+    def add(self, cell, key):
+        self._cells.setdefault(cell, set()).add(key)
+
+    def discard(self, cell, key):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def members(self, cell):
+        return self._cells.get(cell, ())
+
+    def cell_count(self):
+        return len(self._cells)
+
+    def nearby(self, cell, radius_km):
+        """Yield (ring, key) for every key within the rings covering `radius_km`.
+
+        Keys are yielded ring by ring, nearest ring first.
+        """
+        for k in range(rings_for_radius(cell, radius_km) + 1):
+            for neighbour in ring(cell, k):
+                members = self._cells.get(neighbour)
+                if members:
+                    for key in tuple(members):
+                        yield k, key
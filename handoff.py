@@ -0,0 +1,84 @@
+"""Instance lease used to hand polling over between deploys.
+
+Only one instance may long-poll Telegram at a time; two pollers get 409
+Conflict errors and updates are split between them. The polling instance
+holds a lease file (instance ID + heartbeat in the file's mtime) next to
+its snapshot. A new instance waits until the lease is released - after
+the old instance has drained and written its snapshot - or goes stale,
+and only then restores state and starts polling.
+
+The lease lives on the filesystem, so handoff needs the two instances to
+share STATE_DIR: one machine, or a volume both mount. Render does not
+share disks between instances - a service with a disk is stopped before
+its replacement starts - so there the lease only guards against overlap
+and the snapshot on the disk is what carries state over. With STATE_DIR
+on instance-local storage neither the lease nor the snapshot reaches the
+next instance; bot.py warns at startup when STATE_DIR isn't configured.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceLease:
+    """A heartbeat-refreshed lease file owned by one instance."""
+
+    def __init__(self, path, stale_after=30.0):
+        self.path = path
+        self.stale_after = stale_after
+        self.instance_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def holder(self):
+        """Return (instance_id, age_seconds) of the current holder, or None."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                holder = f.read().strip()
+            return holder, time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def held_by_other(self):
+        current = self.holder()
+        return current is not None and current[0] != self.instance_id and current[1] < self.stale_after
+
+    async def acquire(self, timeout=120.0, poll_interval=0.5):
+        """Wait for any other live holder to release, then take the lease.
+
+        Returns True if another instance was waited on (a handoff happened).
+        """
+        waited = False
+        deadline = time.monotonic() + timeout
+        while self.held_by_other():
+            if not waited:
+                logger.info(f"Waiting for instance {self.holder()[0]} to hand over")
+                waited = True
+            if time.monotonic() >= deadline:
+                logger.warning("Handoff timed out; taking over the lease")
+                break
+            await asyncio.sleep(poll_interval)
+        self._write()
+        return waited
+
+    def heartbeat(self):
+        """Refresh the lease; no-op if another instance has taken it over."""
+        current = self.holder()
+        if current is None or current[0] == self.instance_id:
+            self._write()
+
+    def release(self):
+        current = self.holder()
+        if current is not None and current[0] == self.instance_id:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.error(f"Failed to release lease {self.path}: {e}")
+
+    def _write(self):
+        tmp_path = f"{self.path}.{self.instance_id}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.instance_id)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,18 @@
+"""Entry points run inside matcher worker processes.
+
+Kept apart from shared_pool's owner side and free of any bot import: a
+worker only attaches to the shared cart columns and answers scans.
+"""
+import shared_pool
+
+_columns = None
+
+
+def attach(name, capacity):
+    """Process initializer: map the owner's shared block read-only."""
+    global _columns
+    _columns = shared_pool.SharedCartColumns.attach(name, capacity)
+
+
+def find(slot, radius_km, tolerance, limit):
+    return _columns.candidates(slot, radius_km, tolerance, limit)
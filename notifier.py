@@ -0,0 +1,66 @@
+"""Timer wheel for "still searching" status refreshes.
+
+Instead of every searcher's job posting a fresh status message, each
+searcher is placed in one slot of a wheel. A single repeating job
+advances the wheel one slot per tick and refreshes only the searchers in
+that slot, so refreshes are spread evenly over a full revolution. The
+last rendered text per searcher is remembered so unchanged statuses are
+skipped without any outbound call.
+
+The same wheel also spreads periodic searches: one tick job runs the
+searches in the current slot instead of a scheduler job per searcher.
+"""
+
+
+class StatusWheel:
+    """Spreads periodic per-user refreshes across `slots` ticks."""
+
+    def __init__(self, slots=12):
+        self._slots = [set() for _ in range(slots)]
+        self._slot_of = {}  # {user_id: slot index}
+        self._rendered = {}  # {user_id: last text shown}
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, user_id):
+        return user_id in self._slot_of
+
+    @property
+    def slots(self):
+        return len(self._slots)
+
+    def add(self, user_id, ticks=None):
+        """Schedule `user_id` to come due `ticks` ticks from now, by default one full revolution."""
+        self.discard(user_id)
+        slot = (self._cursor + (ticks or len(self._slots)) - 1) % len(self._slots)
+        self._slots[slot].add(user_id)
+        self._slot_of[user_id] = slot
+
+    def spread(self, user_ids):
+        """Add many users at once, dealt round-robin over the slots starting with the next tick."""
+        for i, user_id in enumerate(user_ids):
+            self.discard(user_id)
+            slot = (self._cursor + i) % len(self._slots)
+            self._slots[slot].add(user_id)
+            self._slot_of[user_id] = slot
+
+    def discard(self, user_id):
+        slot = self._slot_of.pop(user_id, None)
+        if slot is not None:
+            self._slots[slot].discard(user_id)
+        self._rendered.pop(user_id, None)
+
+    def advance(self):
+        """Move to the next slot and return the user IDs due for a refresh."""
+        due = tuple(self._slots[self._cursor])
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        return due
+
+    def changed(self, user_id, text):
+        """Record `text` for `user_id`; return False if it was already shown."""
+        if self._rendered.get(user_id) == text:
+            return False
+        self._rendered[user_id] = text
+        return True
@@ -0,0 +1,95 @@
+"""Minimal HTTP server for health checks and operator endpoints.
+
+Render expects web services to listen on $PORT; this serves that port
+with a handful of routes using only asyncio streams. Handlers receive a
+request dict ({'method', 'path', 'query', 'headers'}) and return
+(status, body), where a dict/list body is sent as JSON, str as text and
+bytes as-is. Handlers may be plain functions or coroutines.
+"""
+import asyncio
+import inspect
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+MAX_HEADER_LINES = 100
+
+
+class OpsServer:
+    """Tiny HTTP/1.1 server; one request per connection."""
+
+    def __init__(self, host='0.0.0.0', port=8080):
+        self.host = host
+        self.port = port
+        self._routes = {}
+        self._server = None
+
+    def route(self, path, handler):
+        self._routes[path] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Ops HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            return None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        url = urlsplit(parts[1])
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return {'method': parts[0].upper(), 'path': url.path, 'query': query, 'headers': headers}
+
+    async def _handle(self, reader, writer):
+        status, body = 500, 'error'
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), timeout=10)
+            if request is None:
+                status, body = 400, 'bad request'
+            else:
+                handler = self._routes.get(request['path'])
+                if handler is None:
+                    status, body = 404, 'not found'
+                else:
+                    result = handler(request)
+                    if inspect.isawaitable(result):
+                        result = await result
+                    status, body = result
+        except Exception as e:
+            logger.error(f"Error handling ops request: {e}", exc_info=True)
+        try:
+            if isinstance(body, (dict, list)):
+                payload, content_type = json.dumps(body, default=str).encode(), 'application/json'
+            elif isinstance(body, bytes):
+                payload, content_type = body, 'application/octet-stream'
+            else:
+                payload, content_type = str(body).encode(), 'text/plain; charset=utf-8'
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode('latin-1') + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Error writing ops response: {e}")
+        finally:
+            writer.close()
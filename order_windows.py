@@ -0,0 +1,182 @@
+"""Scheduled orders: order-time windows and an index over them.
+
+A user planning ahead ("ordering around 8 pm") attaches a window
+[start, end) in wall-clock epoch seconds to their cart. Until the window
+opens the cart is dormant: it isn't in the live pool, no search job runs
+for it, and the only work it causes is a heap entry that a single central
+tick pops when the window opens.
+
+Dormant carts are indexed by (time bucket, geocell), so "scheduled carts
+near this cell whose window overlaps mine" reads the buckets the window
+covers in each nearby cell instead of scanning every scheduled cart.
+WindowIndex.view() exposes that query with the same nearby() interface as
+geocells.CellIndex, so the regular matcher can run over it.
+"""
+import heapq
+import re
+import time
+from datetime import datetime, timedelta
+
+import geocells
+
+BUCKET_SECONDS = 15 * 60
+DEFAULT_WINDOW = 45 * 60  # length of a window given as a single time
+MAX_WINDOW = 3 * 3600
+
+_TIME = re.compile(r'^\s*(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?\s*$', re.IGNORECASE)
+_SEPARATOR = re.compile(r'\s*(?:-|–|to)\s*', re.IGNORECASE)
+_RELATIVE = re.compile(r'^\s*in\s+(\d{1,3})\s*(m|mins?|minutes?|h|hrs?|hours?)\s*$', re.IGNORECASE)
+MAX_LEAD = 24 * 3600  # how far ahead "in N hours" may reach
+
+
+def _parse_time(text):
+    """Return (hour, minute, meridiem, explicit); `explicit` is False for a bare hour like "5"."""
+    match = _TIME.match(text)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or '').lower().replace('.', '') or None
+    if minute > 59 or hour > 23 or (meridiem and not 1 <= hour <= 12):
+        return None
+    return hour, minute, meridiem, bool(match.group(2) or meridiem)
+
+
+def _next_occurrence(hour, minute, meridiem, now):
+    """The first datetime at or after `now` matching the time of day."""
+    if meridiem:
+        hours = [hour % 12 + (12 if meridiem == 'pm' else 0)]
+    elif hour < 12:
+        hours = [hour, hour + 12]  # "8" is whichever of 8 am / 8 pm comes next
+    else:
+        hours = [hour]
+    candidates = []
+    for h in hours:
+        at = now.replace(hour=h, minute=minute, second=0, microsecond=0)
+        if at < now - timedelta(minutes=5):
+            at += timedelta(days=1)
+        candidates.append(at)
+    return min(candidates)
+
+
+def parse_window(text, tz, now=None):
+    """Parse "20:00", "8pm", "7:30-8:15 pm", "19:30 to 20:30" or "in 30 min" into (start, end).
+
+    Times are read in `tz` and resolved to their next occurrence. A bare
+    number ("5") is not a time - it is more likely a mistyped amount - so
+    a time needs minutes or am/pm, except that the start of a range may
+    borrow the end's am/pm ("7-8 pm"). Returns epoch seconds, or None if
+    the text isn't a time or the window is longer than MAX_WINDOW.
+    """
+    now = time.time() if now is None else now
+    relative = _RELATIVE.match(text)
+    if relative:
+        amount, unit = int(relative.group(1)), relative.group(2).lower()
+        lead = amount * (3600 if unit.startswith('h') else 60)
+        if lead > MAX_LEAD:
+            return None
+        start = int(now) + lead
+        return start, start + DEFAULT_WINDOW
+    now = datetime.fromtimestamp(now, tz)
+    parts = _SEPARATOR.split(text.strip(), maxsplit=1)
+    times = [_parse_time(part) for part in parts]
+    if not parts or any(t is None for t in times) or not times[-1][3]:
+        return None
+    if len(times) == 2 and times[0][2] is None and times[1][2] is not None:
+        # "7:30-8:15 pm": the first time borrows the second's am/pm
+        times[0] = (times[0][0], times[0][1], times[1][2], True)
+    if not times[0][3]:
+        return None
+    start = _next_occurrence(*times[0][:3], now)
+    if len(times) == 1:
+        end = start + timedelta(seconds=DEFAULT_WINDOW)
+    else:
+        end = _next_occurrence(*times[1][:3], start)
+        if end <= start:
+            end += timedelta(days=1)
+    if (end - start).total_seconds() > MAX_WINDOW:
+        return None
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def format_window(window, tz):
+    start, end = (datetime.fromtimestamp(t, tz) for t in window)
+    return f"{start:%H:%M}–{end:%H:%M}"
+
+
+def overlaps(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+
+class _WindowView:
+    """CellIndex-style nearby() restricted to windows overlapping one window."""
+
+    def __init__(self, index, window):
+        self._index = index
+        self._window = window
+
+    def nearby(self, cell, radius_km):
+        seen = set()
+        buckets = range(self._window[0] // BUCKET_SECONDS, (self._window[1] - 1) // BUCKET_SECONDS + 1)
+        for k in range(geocells.rings_for_radius(cell, radius_km) + 1):
+            for neighbour in geocells.ring(cell, k):
+                for bucket in buckets:
+                    for key in self._index._buckets.get((bucket, neighbour), ()):
+                        if key not in seen and overlaps(self._index._windows[key][1], self._window):
+                            seen.add(key)
+                            yield k, key
+
+
+class WindowIndex:
+    """Dormant scheduled entries indexed by time bucket and geocell."""
+
+    def __init__(self):
+        self._buckets = {}  # {(bucket, cell): set of keys}
+        self._windows = {}  # {key: (cell, (start, end))}
+        self._opening = []  # heap of (start, key); stale entries skipped on pop
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __contains__(self, key):
+        return key in self._windows
+
+    def window(self, key):
+        entry = self._windows.get(key)
+        return entry[1] if entry else None
+
+    def _bucket_keys(self, cell, window):
+        for bucket in range(window[0] // BUCKET_SECONDS, (window[1] - 1) // BUCKET_SECONDS + 1):
+            yield bucket, cell
+
+    def add(self, key, cell, window):
+        self.discard(key)
+        self._windows[key] = (cell, window)
+        for bucket_key in self._bucket_keys(cell, window):
+            self._buckets.setdefault(bucket_key, set()).add(key)
+        heapq.heappush(self._opening, (window[0], key))
+
+    def discard(self, key):
+        entry = self._windows.pop(key, None)
+        if entry is None:
+            return
+        for bucket_key in self._bucket_keys(*entry):
+            members = self._buckets.get(bucket_key)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._buckets[bucket_key]
+
+    def view(self, window):
+        """An index over entries whose window overlaps `window`."""
+        return _WindowView(self, window)
+
+    def pop_opened(self, now):
+        """Remove and return the keys whose window has opened by `now`."""
+        opened = []
+        while self._opening and self._opening[0][0] <= now:
+            start, key = heapq.heappop(self._opening)
+            entry = self._windows.get(key)
+            if entry is not None and entry[1][0] == start:
+                self.discard(key)
+                opened.append(key)
+        return opened
@@ -0,0 +1,190 @@
+"""On-demand sampling profiler for the event-loop thread.
+
+Started for a fixed number of seconds from /admin profile or the
+/profile ops endpoint. While it runs:
+
+* a daemon thread reads the loop thread's current frame from
+  sys._current_frames() every `interval` seconds and counts the stack in
+  collapsed form ("bot.py:button_callback;edits.py:edit 12"), the input
+  format of flamegraph.pl and speedscope;
+* a heartbeat task on the loop stamps the time every few milliseconds.
+  When the sampler sees a stale heartbeat the loop is blocked, and the
+  stall is attributed to the innermost known handler on the stack (e.g.
+  search_for_matches or button_callback);
+* asyncio task counts are sampled, grouped by coroutine name.
+
+Nothing is installed or imported until a profile is requested, so it
+costs nothing when idle.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 64
+MAX_SECONDS = 300
+TASK_SAMPLE_INTERVAL = 0.1
+
+
+def _frame_label(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def collapse(frame):
+    """A frame's stack as 'outer;...;inner' labels."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples the loop thread's stacks and detects loop stalls."""
+
+    def __init__(self, interval=0.005, lag_threshold=0.1, out_dir='.', handlers=()):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.out_dir = out_dir
+        self.handlers = set(handlers)  # function names stalls are attributed to
+        self.report = None  # summary of the last completed run
+        self._running = False
+        self._stop = threading.Event()
+        self._done = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def _attribute(self, frame):
+        innermost = None
+        while frame is not None:
+            name = frame.f_code.co_name
+            if name in self.handlers:
+                return name
+            if innermost is None and 'site-packages' not in frame.f_code.co_filename:
+                innermost = _frame_label(frame)
+            frame = frame.f_back
+        return innermost or 'unknown'
+
+    def start(self, seconds):
+        """Start profiling the calling (event-loop) thread for `seconds`."""
+        if self._running:
+            raise RuntimeError("A profile is already running")
+        seconds = float(seconds)
+        if not seconds > 0:  # also rejects NaN
+            raise ValueError("profile duration must be a positive number of seconds")
+        seconds = min(seconds, MAX_SECONDS)
+        self._running = True
+        self._stop.clear()
+        self._done = asyncio.Event()
+        self._thread_id = threading.get_ident()
+        self._stacks = Counter()
+        self._stalls = Counter()  # {handler: number of stalls}
+        self._stall_ms = {}  # {handler: longest stall in ms}
+        self._tasks = Counter()  # {coroutine name: peak count}
+        self._task_peak = 0
+        self._samples = 0
+        self._beat = time.monotonic()
+        self._started = time.time()
+        self._deadline = time.monotonic() + seconds
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Profiling the event loop for {seconds:g}s")
+        return seconds
+
+    def stop(self):
+        """End a running profile early; the report is still written (await wait())."""
+        self._stop.set()
+
+    async def run(self, seconds):
+        """Profile for `seconds` and return the report."""
+        self.start(seconds)
+        await self._done.wait()
+        return self.report
+
+    async def wait(self):
+        if self._done is not None:
+            await self._done.wait()
+        return self.report
+
+    async def _heartbeat(self):
+        next_task_sample = 0.0
+        try:
+            while not self._stop.is_set() and time.monotonic() < self._deadline:
+                now = time.monotonic()
+                self._beat = now
+                if now >= next_task_sample:
+                    next_task_sample = now + TASK_SAMPLE_INTERVAL
+                    tasks = asyncio.all_tasks()
+                    self._task_peak = max(self._task_peak, len(tasks))
+                    by_name = Counter(getattr(task.get_coro(), '__qualname__', '?') for task in tasks)
+                    for name, count in by_name.items():
+                        self._tasks[name] = max(self._tasks[name], count)
+                await asyncio.sleep(self.interval)
+        finally:
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join)
+            self._finish()
+
+    def _sample(self):
+        stall_beat = None
+        while not self._stop.is_set() and time.monotonic() < self._deadline:
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._samples += 1
+                self._stacks[collapse(frame)] += 1
+                beat = self._beat
+                blocked = time.monotonic() - beat
+                if blocked > self.lag_threshold:
+                    handler = self._attribute(frame)
+                    if beat != stall_beat:
+                        stall_beat = beat
+                        self._stalls[handler] += 1
+                    self._stall_ms[handler] = max(self._stall_ms.get(handler, 0), round(blocked * 1000))
+            del frame
+            time.sleep(self.interval)
+
+    def _finish(self):
+        path = os.path.join(self.out_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(self._started))}.folded")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Failed to write profile {path}: {e}")
+            path = None
+        self.report = {
+            'started': self._started,
+            'seconds': round(time.time() - self._started, 1),
+            'samples': self._samples,
+            'output': path,
+            'top_frames': self._top_frames(10),
+            'stalls': {handler: {'count': n, 'max_ms': self._stall_ms[handler]}
+                       for handler, n in self._stalls.most_common()},
+            'task_peak': self._task_peak,
+            'tasks': dict(self._tasks.most_common(10)),
+        }
+        self._running = False
+        self._done.set()
+        logger.info(f"Profile finished: {self._samples} samples, {sum(self._stalls.values())} loop stalls")
+
+    def _top_frames(self, n):
+        """Innermost frames by sample count ("self time")."""
+        leaves = Counter()
+        for stack, count in self._stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return dict(leaves.most_common(n))
+
+    def collapsed(self):
+        """The last run's collapsed stacks as text."""
+        if not self.report or not self.report['output']:
+            return ''
+        with open(self.report['output'], encoding='utf-8') as f:
+            return f.read()
@@ -0,0 +1,74 @@
+"""Per-user token-bucket flood control.
+
+Every inbound update costs its sender some tokens depending on what it
+does (a /start or a shared location costs more than a button press).
+Buckets refill continuously up to a fixed capacity. Updates that can't
+be paid for are dropped before any handler sees them.
+
+Buckets live in a bounded LRU table of (tokens, last_seen) tuples, so a
+flood of distinct senders can't grow memory without limit - the least
+recently seen users are evicted, which only ever makes them less limited.
+A throttled user is told once per throttled stretch (see warn()), so the
+notices can't become a flood of their own.
+"""
+import time
+from collections import OrderedDict
+
+from update_processor import classify_action
+
+# Token cost per action
+ACTION_COSTS = {
+    'start': 5.0,
+    'location': 3.0,
+    'app_select': 2.0,
+    'callback': 0.5,
+    'relay': 1.0,
+    'message': 1.0,
+}
+
+
+# Actions are named by the same classifier the worker pool uses for priority
+classify = classify_action
+
+
+class TokenBuckets:
+    """Bounded table of per-key token buckets."""
+
+    def __init__(self, capacity=10.0, refill_per_second=0.5, max_keys=100000, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict()  # {key: (tokens, last_refill)}
+        self._warned = set()  # keys already told they are throttled since their last allowed update
+        self.throttled = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, cost=1.0):
+        """Take `cost` tokens from `key`'s bucket; return False if it can't pay."""
+        now = self._clock()
+        entry = self._buckets.pop(key, None)
+        if entry is None:
+            tokens = self.capacity
+        else:
+            tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.refill_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+            self._warned.discard(key)
+        else:
+            self.throttled += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            evicted, _ = self._buckets.popitem(last=False)
+            self._warned.discard(evicted)
+        return allowed
+
+    def warn(self, key):
+        """True the first time `key` is throttled since its last allowed update."""
+        if key in self._warned:
+            return False
+        self._warned.add(key)
+        return True
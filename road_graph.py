@@ -0,0 +1,369 @@
+"""Road-network distances from a local, precomputed graph.
+
+Straight-line distance pairs people across rivers, highways and gated
+areas. This module answers travel distance over a road graph instead,
+for the handful of candidates that already passed the geocell and
+Haversine prefilter.
+
+The graph is built offline into one compact little-endian file that is
+memory-mapped at startup:
+
+    header  <4sHHIIII  magic, version, landmarks, nodes, arcs, cells, 0
+    lat, lon            float32 per node
+    offsets             uint32 per node + 1   (CSR adjacency)
+    targets, weights    uint32 / float32 (metres) per arc
+    landmark distances  float32, landmarks x nodes
+    cell keys           int64 per occupied geocell, ascending
+    cell starts         uint32 per occupied geocell + 1
+
+Nodes are numbered in geocell order, so the nodes of a cell are one
+contiguous run found by bisecting the cell keys; snapping a location to
+the graph needs no in-memory index. (Version 1 files have no cell
+section; their cell index is built on the first lookup.)
+
+Queries run A* with ALT (landmark triangle-inequality) bounds, stopping
+once the search passes the caller's limit. RoadDistance snaps each
+cart's own location to its nearest node and caches road distances per
+node pair.
+
+Build a graph from an OSM XML extract or a CSV edge list
+(lat1,lon1,lat2,lon2[,metres]):
+
+    python road_graph.py city.osm city.graph --landmarks 8
+"""
+import argparse
+import bisect
+import heapq
+import logging
+import math
+import mmap
+import random
+import struct
+import sys
+import xml.etree.ElementTree as ElementTree
+from array import array
+from collections import OrderedDict
+
+import geocells
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DSRG'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIII')
+SNAP_KM = 0.5  # locations further than this from any road node use straight-line distance
+
+ROAD_TYPES = {
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential', 'service',
+    'living_street', 'pedestrian', 'footway', 'path', 'track', 'motorway_link', 'trunk_link',
+    'primary_link', 'secondary_link', 'tertiary_link',
+}
+
+
+class RoadGraphError(Exception):
+    pass
+
+
+def _pad(n):
+    return (n + 7) & ~7
+
+
+class RoadGraph:
+    """Read-only CSR road graph over a memory-mapped file."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        magic, version, self.landmarks, self.nodes, self.arcs, cells, _ = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise RoadGraphError("Not a road graph file")
+        if version not in (1, VERSION):
+            raise RoadGraphError(f"Unsupported road graph version {version}")
+        view = memoryview(buffer)
+        offset = _pad(HEADER.size)
+
+        def section(fmt, count):
+            nonlocal offset
+            size = struct.calcsize(fmt) * count
+            column = view[offset:offset + size].cast(fmt)
+            offset = _pad(offset + size)
+            return column
+
+        self.lat = section('f', self.nodes)
+        self.lon = section('f', self.nodes)
+        self.offsets = section('I', self.nodes + 1)
+        self.targets = section('I', self.arcs)
+        self.weights = section('f', self.arcs)
+        self.landmark_dist = [section('f', self.nodes) for _ in range(self.landmarks)]
+        if version >= 2:
+            self.cell_keys = section('q', cells)
+            self.cell_starts = section('I', cells + 1)
+        else:
+            self.cell_keys = self.cell_starts = None
+        self._grid = None  # version 1 only: {cell: [node, ...]}, built on first use
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def cell_nodes(self, cell):
+        """The nodes inside geocell `cell`."""
+        if self.cell_keys is None:
+            if self._grid is None:
+                self._grid = {}
+                for node in range(self.nodes):
+                    self._grid.setdefault(geocells.encode(self.lat[node], self.lon[node]), []).append(node)
+            return self._grid.get(cell, ())
+        i = bisect.bisect_left(self.cell_keys, cell)
+        if i == len(self.cell_keys) or self.cell_keys[i] != cell:
+            return ()
+        return range(self.cell_starts[i], self.cell_starts[i + 1])
+
+    def nearest_node(self, location, max_km=SNAP_KM):
+        """The closest node to `location` within `max_km`, or None."""
+        cell = geocells.encode(*location)
+        best, best_km = None, max_km
+        for k in range(geocells.rings_for_radius(cell, max_km) + 1):
+            for neighbour in geocells.ring(cell, k):
+                for node in self.cell_nodes(neighbour):
+                    km = geocells.haversine_km(location, (self.lat[node], self.lon[node]))
+                    if km <= best_km:
+                        best, best_km = node, km
+        return best
+
+    def _lower_bound(self, node, target):
+        """ALT lower bound on metres from `node` to `target`."""
+        bound = 0.0
+        for dist in self.landmark_dist:
+            bound = max(bound, abs(dist[target] - dist[node]))
+        return bound
+
+    def shortest_m(self, source, target, max_m=math.inf):
+        """Road distance in metres, or inf if it exceeds `max_m` or is unreachable."""
+        if source == target:
+            return 0.0
+        if self._lower_bound(source, target) > max_m:
+            return math.inf
+        best = {source: 0.0}
+        queue = [(self._lower_bound(source, target), 0.0, source)]
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        while queue:
+            estimate, dist, node = heapq.heappop(queue)
+            if node == target:
+                return dist
+            if estimate > max_m:
+                return math.inf
+            if dist > best.get(node, math.inf):
+                continue
+            for arc in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[arc]
+                candidate = dist + weights[arc]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(queue, (candidate + self._lower_bound(neighbour, target), candidate, neighbour))
+        return math.inf
+
+
+class RoadDistance:
+    """Distance provider for find_best_match with snapping and per-node-pair caches."""
+
+    def __init__(self, graph, cache_size=100000, max_detour=4.0):
+        self.graph = graph
+        self.cache_size = cache_size
+        self.max_detour = max_detour
+        self._snapped = OrderedDict()  # {location: (node or None, km from location to node)}
+        self._road_m = OrderedDict()  # {(node, node): road metres, or inf beyond max_detour}
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def _snap(self, location):
+        location = tuple(location)
+        snapped = self._snapped.get(location)
+        if snapped is not None:
+            self._snapped.move_to_end(location)
+            return snapped
+        node = self.graph.nearest_node(location)
+        km = 0.0 if node is None else geocells.haversine_km(location, (self.graph.lat[node], self.graph.lon[node]))
+        return self._remember(self._snapped, location, (node, km))
+
+    def _between(self, source, target):
+        key = (source, target) if source <= target else (target, source)
+        road_m = self._road_m.get(key)
+        if road_m is not None:
+            self._road_m.move_to_end(key)
+            self.hits += 1
+            return road_m
+        self.misses += 1
+        graph = self.graph
+        node_km = geocells.haversine_km((graph.lat[source], graph.lon[source]), (graph.lat[target], graph.lon[target]))
+        road_m = graph.shortest_m(source, target, max_m=max(node_km, SNAP_KM) * 1000 * self.max_detour)
+        return self._remember(self._road_m, key, road_m)
+
+    def __call__(self, cart1, cart2, straight_km):
+        """Road distance in km between two carts, given their straight-line distance.
+
+        Each cart's location is snapped to its nearest road node; the result
+        is the walk to and from those nodes plus the road distance between
+        them, and never less than `straight_km`.
+        """
+        (source, source_km), (target, target_km) = self._snap(cart1['location']), self._snap(cart2['location'])
+        if source is None or target is None or source == target:
+            return straight_km  # outside the graph's coverage, or on the same stretch of road
+        road_km = source_km + self._between(source, target) / 1000 + target_km
+        return max(straight_km, road_km)
+
+
+# Offline conversion
+
+def read_osm(path):
+    """Nodes and undirected edges of the road ways in an OSM XML extract."""
+    coords, ways = {}, []
+    for _, element in ElementTree.iterparse(path, events=('end',)):
+        if element.tag == 'node':
+            coords[element.get('id')] = (float(element.get('lat')), float(element.get('lon')))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            if tags.get('highway') in ROAD_TYPES and tags.get('access') not in ('private', 'no'):
+                ways.append([nd.get('ref') for nd in element.iter('nd')])
+            element.clear()
+    index, nodes, edges = {}, [], []
+    for refs in ways:
+        refs = [ref for ref in refs if ref in coords]
+        for a, b in zip(refs, refs[1:]):
+            for ref in (a, b):
+                if ref not in index:
+                    index[ref] = len(nodes)
+                    nodes.append(coords[ref])
+            edges.append((index[a], index[b], geocells.haversine_km(coords[a], coords[b]) * 1000))
+    return nodes, edges
+
+
+def read_edge_csv(path):
+    """Nodes and edges from lines of lat1,lon1,lat2,lon2[,metres]."""
+    index, nodes, edges = {}, [], []
+
+    def node_id(lat, lon):
+        key = (round(lat, 6), round(lon, 6))
+        if key not in index:
+            index[key] = len(nodes)
+            nodes.append(key)
+        return index[key]
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split(',')
+            if len(parts) < 4 or parts[0].startswith('#'):
+                continue
+            try:
+                lat1, lon1, lat2, lon2 = map(float, parts[:4])
+            except ValueError:
+                continue  # header row
+            metres = float(parts[4]) if len(parts) > 4 and parts[4] else \
+                geocells.haversine_km((lat1, lon1), (lat2, lon2)) * 1000
+            edges.append((node_id(lat1, lon1), node_id(lat2, lon2), metres))
+    return nodes, edges
+
+
+def _dijkstra_all(offsets, targets, weights, source):
+    dist = [math.inf] * (len(offsets) - 1)
+    dist[source] = 0.0
+    queue = [(0.0, source)]
+    while queue:
+        d, node = heapq.heappop(queue)
+        if d > dist[node]:
+            continue
+        for arc in range(offsets[node], offsets[node + 1]):
+            candidate = d + weights[arc]
+            if candidate < dist[targets[arc]]:
+                dist[targets[arc]] = candidate
+                heapq.heappush(queue, (candidate, targets[arc]))
+    return dist
+
+
+def build(nodes, edges, path, landmarks=8, seed=0):
+    """Write the CSR graph with `landmarks` farthest-point landmarks to `path`."""
+    n = len(nodes)
+    # Renumber nodes in geocell order so each cell's nodes form one run
+    node_cells = [geocells.encode(lat, lon) for lat, lon in nodes]
+    order = sorted(range(n), key=node_cells.__getitem__)
+    rank = [0] * n
+    for new_id, old_id in enumerate(order):
+        rank[old_id] = new_id
+    nodes = [nodes[old_id] for old_id in order]
+    node_cells = [node_cells[old_id] for old_id in order]
+    edges = [(rank[u], rank[v], metres) for u, v, metres in edges]
+    cell_keys, cell_starts = array('q'), array('I')
+    for node, cell in enumerate(node_cells):
+        if not cell_keys or cell_keys[-1] != cell:
+            cell_keys.append(cell)
+            cell_starts.append(node)
+    cell_starts.append(n)
+
+    degree = [0] * (n + 1)
+    for u, v, _ in edges:
+        degree[u + 1] += 1
+        degree[v + 1] += 1
+    offsets = array('I', [0]) * (n + 1)
+    for i in range(n):
+        offsets[i + 1] = offsets[i] + degree[i + 1]
+    fill = list(offsets[:n])
+    targets = array('I', [0]) * offsets[n]
+    weights = array('f', [0.0]) * offsets[n]
+    for u, v, metres in edges:
+        for a, b in ((u, v), (v, u)):
+            targets[fill[a]] = b
+            weights[fill[a]] = metres
+            fill[a] += 1
+
+    # Farthest-point landmarks: each one is the node furthest from those already chosen
+    chosen, tables = [], []
+    nearest = [math.inf] * n
+    current = random.Random(seed).randrange(n) if n else 0
+    for _ in range(min(landmarks, n)):
+        dist = _dijkstra_all(offsets, targets, weights, current)
+        chosen.append(current)
+        # Unreachable nodes get 0 so the ALT bound stays admissible
+        tables.append(array('f', (d if d != math.inf else 0.0 for d in dist)))
+        nearest = [min(a, b) for a, b in zip(nearest, dist)]
+        current = max(range(n), key=lambda i: nearest[i] if nearest[i] != math.inf else -1)
+
+    with open(path, 'wb') as f:
+        def write(data):
+            raw = data.tobytes() if isinstance(data, array) else data
+            f.write(raw)
+            f.write(b'\0' * (_pad(len(raw)) - len(raw)))
+
+        write(HEADER.pack(MAGIC, VERSION, len(tables), n, offsets[n], len(cell_keys), 0))
+        write(array('f', (lat for lat, _ in nodes)))
+        write(array('f', (lon for _, lon in nodes)))
+        write(offsets)
+        write(targets)
+        write(weights)
+        for table in tables:
+            write(table)
+        write(cell_keys)
+        write(cell_starts)
+    return {'nodes': n, 'arcs': offsets[n], 'landmarks': len(tables), 'cells': len(cell_keys)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert an OSM XML extract or CSV edge list to a road graph.')
+    parser.add_argument('input', help='.osm XML extract or CSV of lat1,lon1,lat2,lon2[,metres]')
+    parser.add_argument('output')
+    parser.add_argument('--landmarks', type=int, default=8)
+    args = parser.parse_args(argv)
+    nodes, edges = read_osm(args.input) if args.input.endswith('.osm') else read_edge_csv(args.input)
+    if not nodes:
+        sys.exit(f"No road edges found in {args.input}")
+    print(build(nodes, edges, args.output, args.landmarks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Expanding-radius search policy and candidate scoring.
+
+A search starts narrow and widens on a time schedule. Each schedule step
+gives the radius to search and how far below the free-delivery threshold
+a combined cart may fall (as a fraction of the threshold) and still count
+as a match. Candidates are pulled from the geocell index ring by ring, so
+early ticks with a small radius only touch a few cells.
+
+find_best_match() ranks a bounded set of candidates within the radius -
+carts sharing an item/store LSH bucket, then the nearest few from the
+ring scan - by a blended score of distance, threshold fit, same store
+and item overlap.
+"""
+import logging
+
+import fingerprint
+import geocells
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# (seconds since search start, radius in km, min_for_free tolerance)
+DEFAULT_SCHEDULE = (
+    (0, 1.0, 0.0),
+    (120, 2.0, 0.0),
+    (300, 3.5, 0.0),
+    (600, 5.0, 0.0),
+    (1200, 5.0, 0.1),
+)
+
+
+def parse_schedule(spec):
+    """Parse a schedule like "0:1,120:2,600:5:0.1" into schedule tuples."""
+    schedule = []
+    for step in spec.split(','):
+        parts = [p.strip() for p in step.split(':')]
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid search schedule step: {step!r}")
+        tolerance = float(parts[2]) if len(parts) == 3 else 0.0
+        schedule.append((float(parts[0]), float(parts[1]), tolerance))
+    if not schedule:
+        raise ValueError("Search schedule is empty")
+    return tuple(sorted(schedule))
+
+
+class SearchPolicy:
+    """Maps search age to the radius and threshold tolerance to use."""
+
+    def __init__(self, schedule=DEFAULT_SCHEDULE):
+        self.schedule = tuple(sorted(schedule))
+
+    @property
+    def max_radius_km(self):
+        return max(radius for _, radius, _ in self.schedule)
+
+    def step(self, elapsed):
+        """Return (radius_km, tolerance) for a search that is `elapsed` seconds old."""
+        radius, tolerance = self.schedule[0][1], self.schedule[0][2]
+        for start, step_radius, step_tolerance in self.schedule:
+            if elapsed < start:
+                break
+            radius, tolerance = step_radius, step_tolerance
+        return radius, tolerance
+
+
+# Blended score weights
+SCORE_WEIGHTS = {
+    'distance': 0.4,
+    'fit': 0.2,
+    'store': 0.25,
+    'items': 0.15,
+}
+
+# Candidates taken from the ring scan before scoring
+MAX_SCORED = 32
+
+
+def is_compatible(searcher, cart, tolerance=0.0):
+    """Return the reason `cart` can't pair with `searcher`, or None if it can."""
+    if str(cart.get('app', '')).lower().strip() != str(searcher.get('app', '')).lower().strip():
+        return 'app'
+    combined_total = float(cart.get('cart_total', 0)) + float(searcher.get('cart_total', 0))
+    min_required = max(float(cart.get('min_for_free', 0)), float(searcher.get('min_for_free', 0)))
+    if combined_total < min_required * (1 - tolerance):
+        return 'total'
+    return None
+
+
+def find_match(searcher, carts, index, radius_km, tolerance=0.0, exclude=()):
+    """Find the nearest compatible cart for `searcher`.
+
+    `carts` maps user IDs to cart dicts and `index` is the CellIndex over
+    them. Returns (cart, ring, distance_km) or None.
+    """
+    user_id = searcher.get('user_id')
+    for ring, candidate_id in index.nearby(searcher['cell'], radius_km):
+        if candidate_id == user_id or candidate_id in exclude:
+            continue
+        cart = carts.get(candidate_id)
+        if cart is None:
+            continue
+        reason = is_compatible(searcher, cart, tolerance)
+        if reason:
+            logger.debug(f"Skipping {candidate_id} in ring {ring} - {reason}")
+            continue
+        distance_km = geocells.haversine_km(cart['location'], searcher['location'])
+        if distance_km > radius_km:
+            logger.debug(f"Skipping {candidate_id} in ring {ring} - too far: {distance_km:.2f}km")
+            continue
+        return cart, ring, distance_km
+    return None
+
+
+def score(searcher, cart, distance_km, radius_km):
+    """Blend distance, threshold fit, same store and item overlap into 0..1."""
+    combined_total = float(cart.get('cart_total', 0)) + float(searcher.get('cart_total', 0))
+    min_required = max(float(cart.get('min_for_free', 0)), float(searcher.get('min_for_free', 0)))
+    fit = min(1.0, combined_total / min_required) if min_required > 0 else 1.0
+    same_store = 1.0 if searcher.get('store_id') and searcher.get('store_id') == cart.get('store_id') else 0.0
+    return (
+        SCORE_WEIGHTS['distance'] * (1 - min(1.0, distance_km / radius_km) if radius_km > 0 else 1.0)
+        + SCORE_WEIGHTS['fit'] * fit
+        + SCORE_WEIGHTS['store'] * same_store
+        + SCORE_WEIGHTS['items'] * fingerprint.similarity(searcher.get('fingerprint'), cart.get('fingerprint'))
+    )
+
+
+def find_best_match(searcher, carts, index, radius_km, tolerance=0.0, exclude=(), lsh=None,
+                    max_scored=MAX_SCORED, warm=(), ranked=None, distance=None, nearest=None):
+    """Find the best-scoring compatible cart for `searcher`.
+
+    Scores at most `max_scored` candidates within `radius_km`: carts
+    sharing an LSH bucket with the searcher first, then the nearest from
+    the ring scan. `warm` candidate IDs (e.g. from a previous search) are
+    checked first; if any is still compatible the ring scan is skipped.
+    `nearest`, if given, lists candidate IDs already found near the
+    searcher (e.g. by a matcher worker) and replaces the ring scan; LSH
+    candidates are still scored ahead of it. If `ranked` is a list it is
+    filled with every compatible candidate ID, best first. `distance`,
+    if given, is called as distance(searcher, cart, straight_km) for
+    candidates within the radius as the crow flies, and its result (e.g.
+    road distance) replaces the straight-line distance. Returns
+    (cart, ring, distance_km, score) or None.
+    """
+    user_id = searcher.get('user_id')
+    scored = {}
+    skips = {'app': 0, 'total': 0, 'distance': 0}
+
+    def consider(candidate_id, ring):
+        if candidate_id == user_id or candidate_id in exclude or candidate_id in scored:
+            return
+        cart = carts.get(candidate_id)
+        if cart is None or cart.get('cell') is None:
+            return
+        reason = is_compatible(searcher, cart, tolerance)
+        if reason:
+            logger.debug(f"Skipping {candidate_id} in ring {ring} - {reason}")
+            skips[reason] += 1
+            return
+        distance_km = geocells.haversine_km(cart['location'], searcher['location'])
+        if distance_km <= radius_km and distance is not None:
+            distance_km = distance(searcher, cart, distance_km)
+        if distance_km > radius_km:
+            logger.debug(f"Skipping {candidate_id} in ring {ring} - too far: {distance_km:.2f}km")
+            skips['distance'] += 1
+            return
+        scored[candidate_id] = (cart, ring, distance_km, score(searcher, cart, distance_km, radius_km))
+
+    def consider_anywhere(candidate_id):
+        cart = carts.get(candidate_id)
+        if cart is not None and cart.get('cell') is not None:
+            consider(candidate_id, geocells.ring_distance(searcher['cell'], cart['cell']))
+
+    for candidate_id in warm:
+        consider_anywhere(candidate_id)
+
+    if not scored:
+        similar = lsh.candidates(searcher.get('fingerprint'), searcher.get('store_id')) if lsh is not None else ()
+        if similar:
+            # Only similar carts inside the radius, and they share the scoring budget
+            for ring, candidate_id in index.nearby(searcher['cell'], radius_km):
+                if candidate_id in similar:
+                    consider(candidate_id, ring)
+                    if len(scored) >= max_scored:
+                        break
+
+        if nearest is not None:
+            for candidate_id in nearest:
+                if len(scored) >= max_scored:
+                    break
+                consider_anywhere(candidate_id)
+        else:
+            for ring, candidate_id in index.nearby(searcher['cell'], radius_km):
+                if len(scored) >= max_scored:
+                    break
+                consider(candidate_id, ring)
+
+    for reason, n in skips.items():
+        if n:
+            tracing.count(f'skip_{reason}', n)
+    tracing.event('matcher', radius_km=radius_km, scored=len(scored),
+                  skip_app=skips['app'], skip_total=skips['total'], skip_distance=skips['distance'])
+    if not scored:
+        return None
+    best = sorted(scored.values(), key=lambda entry: entry[3], reverse=True)
+    if ranked is not None:
+        ranked[:] = [entry[0]['user_id'] for entry in best]
+    return best[0]
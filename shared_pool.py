@@ -0,0 +1,274 @@
+"""Cart pool hot columns in shared memory, scanned by matcher worker processes.
+
+The main process owns a multiprocessing.shared_memory block holding one
+row per slot: cell, lat, lon, app code, cart_total and min_for_free,
+plus a per-slot version. Slots freed by removed carts go on a free-list
+and are reused; a high-water mark bounds the slots in use.
+
+Rows are also chained per geocell: a table of bucket heads (by hashed
+cell) and a `next` column link every slot of a bucket, so a worker reads
+only the slots in the cells around a searcher instead of scanning the
+block.
+
+Writers bump a slot's version to odd, write the row, then bump it to
+even (a seqlock). Readers copy a row and keep it only if the version was
+even and unchanged across the copy, so a worker never acts on a
+half-written row and never takes a lock. Only the main process writes.
+A chain walk racing a cart that moves cell may miss that cart for one
+search; the main process still runs its own LSH lookup alongside.
+
+Worker processes (see matcher_worker) attach to the block read-only and
+answer "candidates for slot i within r km" with a short list of
+(distance, slot, version). The main process drops any entry whose slot
+version has moved on (the cart changed or the slot was reused) and maps
+slots back to user IDs. Views are memoryview casts over the block, so
+nothing is copied.
+"""
+import asyncio
+import heapq
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import geocells
+import matcher_worker
+
+logger = logging.getLogger(__name__)
+
+EMPTY = -1
+READ_RETRIES = 100
+
+# (name, struct format, bytes per item); every column is 8-byte aligned
+_COLUMNS = (('version', 'Q', 8), ('cell', 'q', 8), ('lat', 'd', 8), ('lon', 'd', 8),
+            ('total', 'd', 8), ('min', 'd', 8), ('app', 'q', 8), ('next', 'q', 8))
+_HEADER = 8  # high-water mark
+
+
+def _bucket_count(capacity):
+    """Power of two with about two slots per bucket."""
+    return 1 << max(10, (capacity // 2).bit_length())
+
+
+def _block_size(capacity):
+    return _HEADER + 8 * _bucket_count(capacity) + sum(size for _, _, size in _COLUMNS) * capacity
+
+
+class SharedCartColumns:
+    """Typed views over the shared block; owner-side slot management."""
+
+    def __init__(self, shm, capacity, owner):
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self._header = shm.buf[:_HEADER].cast('q')
+        buckets = _bucket_count(capacity)
+        self._shift = 64 - (buckets.bit_length() - 1)
+        self._heads = shm.buf[_HEADER:_HEADER + 8 * buckets].cast('q')  # {bucket: first slot}
+        offset = _HEADER + 8 * buckets
+        for name, fmt, size in _COLUMNS:
+            setattr(self, f'_{name}', shm.buf[offset:offset + size * capacity].cast(fmt))
+            offset += size * capacity
+        self._free = []  # owner only
+        self._prev = {}  # owner only: {slot: previous slot in its bucket chain, or EMPTY}
+
+    @classmethod
+    def create(cls, capacity):
+        shm = shared_memory.SharedMemory(create=True, size=_block_size(capacity))
+        columns = cls(shm, capacity, owner=True)
+        columns._header[0] = 0
+        for bucket in range(len(columns._heads)):
+            columns._heads[bucket] = EMPTY
+        for slot in range(capacity):
+            columns._version[slot] = 0
+            columns._app[slot] = EMPTY
+            columns._cell[slot] = EMPTY
+            columns._next[slot] = EMPTY
+        return columns
+
+    @classmethod
+    def attach(cls, name, capacity):
+        return cls(shared_memory.SharedMemory(name=name), capacity, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def high_water(self):
+        return self._header[0]
+
+    def version(self, slot):
+        return self._version[slot]
+
+    def _bucket(self, cell):
+        # Fibonacci hashing: neighbouring cells differ only in their low bits
+        return ((cell * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self._shift
+
+    # Owner side
+
+    def alloc(self):
+        """Reserve a slot, reusing freed ones first; None when full."""
+        if self._free:
+            return self._free.pop()
+        slot = self._header[0]
+        if slot >= self.capacity:
+            return None
+        self._header[0] = slot + 1
+        return slot
+
+    def _link(self, slot, cell):
+        bucket = self._bucket(cell)
+        head = self._heads[bucket]
+        self._next[slot] = head
+        self._prev[slot] = EMPTY
+        if head != EMPTY:
+            self._prev[head] = slot
+        self._heads[bucket] = slot
+
+    def _unlink(self, slot, cell):
+        prev, nxt = self._prev.pop(slot), self._next[slot]
+        if prev == EMPTY:
+            self._heads[self._bucket(cell)] = nxt
+        else:
+            self._next[prev] = nxt
+        if nxt != EMPTY:
+            self._prev[nxt] = prev
+
+    def write(self, slot, cell, lat, lon, app_code, total, minimum):
+        old_cell = self._cell[slot]
+        if old_cell != cell and old_cell != EMPTY:
+            self._unlink(slot, old_cell)
+        self._version[slot] += 1  # odd: write in progress
+        self._cell[slot] = cell
+        self._lat[slot] = lat
+        self._lon[slot] = lon
+        self._total[slot] = total
+        self._min[slot] = minimum
+        self._app[slot] = app_code
+        self._version[slot] += 1
+        if old_cell != cell:
+            self._link(slot, cell)
+
+    def free(self, slot):
+        cell = self._cell[slot]
+        if cell != EMPTY:
+            self._unlink(slot, cell)
+        self._version[slot] += 1
+        self._app[slot] = EMPTY
+        self._cell[slot] = EMPTY
+        self._version[slot] += 1
+        self._free.append(slot)
+
+    # Reader side
+
+    def read(self, slot):
+        """Return (version, (cell, lat, lon, app, total, min)) or None if empty or unstable."""
+        for _ in range(READ_RETRIES):
+            version = self._version[slot]
+            if version & 1:
+                continue
+            row = (self._cell[slot], self._lat[slot], self._lon[slot], self._app[slot],
+                   self._total[slot], self._min[slot])
+            if self._version[slot] == version:
+                return (version, row) if row[3] != EMPTY else None
+        return None
+
+    def candidates(self, slot, radius_km, tolerance=0.0, limit=32):
+        """Nearest compatible rows for the cart in `slot`, as (distance_km, slot, version)."""
+        searcher = self.read(slot)
+        if searcher is None:
+            return []
+        _, (cell, lat, lon, app, total, minimum) = searcher
+        found = []
+        cell_column, next_column = self._cell, self._next
+        for k in range(geocells.rings_for_radius(cell, radius_km) + 1):
+            for neighbour in geocells.ring(cell, k):
+                other = self._heads[self._bucket(neighbour)]
+                # Bounded in case a concurrent relink sends the walk round a loop
+                for _ in range(self.capacity):
+                    if other == EMPTY:
+                        break
+                    if other != slot and cell_column[other] == neighbour:
+                        entry = self.read(other)
+                        if entry is not None:
+                            version, (_, other_lat, other_lon, other_app, other_total, other_min) = entry
+                            if other_app == app and total + other_total >= max(minimum, other_min) * (1 - tolerance):
+                                distance_km = geocells.haversine_km((lat, lon), (other_lat, other_lon))
+                                if distance_km <= radius_km:
+                                    found.append((distance_km, other, version))
+                    other = next_column[other]
+        return heapq.nsmallest(limit, found)
+
+    def close(self):
+        for name in ['_header', '_heads'] + [f'_{column}' for column, _, _ in _COLUMNS]:
+            getattr(self, name).release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class MatcherPool:
+    """Mirrors the cart pool into shared columns and fans candidate scans out to workers."""
+
+    def __init__(self, capacity=200000, workers=2):
+        self.columns = SharedCartColumns.create(capacity)
+        self._slot_of = {}  # {user_id: slot}
+        self._user_at = {}  # {slot: user_id}
+        self._app_codes = {}
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=matcher_worker.attach,
+            initargs=(self.columns.name, capacity)
+        )
+        logger.info(f"Matcher pool: {workers} workers over {capacity} shared slots ({self.columns.name})")
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def _app_code(self, app):
+        key = str(app or '').lower().strip()
+        return self._app_codes.setdefault(key, len(self._app_codes))
+
+    def put(self, cart):
+        """Insert or update a cart's row."""
+        user_id = cart['user_id']
+        if cart.get('cell') is None:
+            self.remove(user_id)
+            return
+        slot = self._slot_of.get(user_id)
+        if slot is None:
+            slot = self.columns.alloc()
+            if slot is None:
+                logger.warning(f"Shared cart columns full; {user_id} is matched in-process only")
+                return
+            self._slot_of[user_id] = slot
+            self._user_at[slot] = user_id
+        lat, lon = cart['location']
+        self.columns.write(slot, cart['cell'], lat, lon, self._app_code(cart.get('app')),
+                           float(cart.get('cart_total', 0)), float(cart.get('min_for_free', 0)))
+
+    def remove(self, user_id):
+        slot = self._slot_of.pop(user_id, None)
+        if slot is not None:
+            del self._user_at[slot]
+            self.columns.free(slot)
+
+    async def candidates(self, user_id, radius_km, tolerance=0.0, limit=32):
+        """User IDs of the nearest compatible carts, found by a worker process.
+
+        None if the user's cart has no slot (the columns were full), so the
+        caller falls back to its own ring scan.
+        """
+        slot = self._slot_of.get(user_id)
+        if slot is None:
+            return None
+        rows = await asyncio.get_running_loop().run_in_executor(
+            self._executor, matcher_worker.find, slot, radius_km, tolerance, limit)
+        # Skip rows that changed or were reused while the worker was scanning
+        return [self._user_at[other] for _, other, version in rows
+                if other in self._user_at and self.columns.version(other) == version]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.columns.close()
@@ -0,0 +1,20 @@
+"""Offline matcher simulator.
+
+Replays a stream of cart arrivals through the bot's matching code
+(geocells, search_policy, fingerprint, fairness) on a virtual clock, so a
+full day runs in seconds and policies can be compared without touching
+production:
+
+    python -m sim --policy nearest,scored,fair --hours 24 --rate 2
+    python -m sim --events events.ndjson events.ndjson.1 --schedule 0:1,300:3
+
+Search ticks, first-tick delay and timeout mirror the bot's job settings
+and can be overridden. Policies are plugins (see sim.policies); an
+external one can be named as module:Class.
+"""
+from sim.arrivals import recorded, synthetic
+from sim.engine import Simulation, VirtualClock
+from sim.policies import POLICIES, Policy, load_policy, register_policy
+
+__all__ = ['Simulation', 'VirtualClock', 'Policy', 'POLICIES', 'register_policy', 'load_policy',
+           'synthetic', 'recorded']
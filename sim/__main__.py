@@ -0,0 +1,61 @@
+"""Command line entry point: python -m sim."""
+import argparse
+import json
+import logging
+import sys
+
+import road_graph
+from search_policy import SearchPolicy, parse_schedule
+from sim.arrivals import recorded, synthetic
+from sim.engine import Simulation
+from sim.policies import POLICIES, load_policy
+
+COLUMNS = ('policy', 'arrivals', 'match_rate', 'expired', 'p50_wait_s', 'p90_wait_s', 'reassigned', 'cpu_s',
+           'match_us_per_tick')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sim', description='Compare matcher policies offline.')
+    parser.add_argument('--policy', default=','.join(POLICIES),
+                        help=f"comma-separated policies ({', '.join(POLICIES)} or module:Class)")
+    parser.add_argument('--schedule', help='search schedule, e.g. 0:1,120:2,600:5:0.1')
+    parser.add_argument('--events', nargs='+', help='replay cart_created events from EventLog files')
+    parser.add_argument('--hours', type=float, default=24, help='length of a synthetic run')
+    parser.add_argument('--rate', type=float, default=1.0, help='synthetic arrivals per minute at profile weight 1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--interval', type=float, default=10.0, help='seconds between search ticks')
+    parser.add_argument('--first', type=float, default=5.0, help='delay before the first tick')
+    parser.add_argument('--timeout', type=float, default=1800.0, help='seconds before a search expires')
+    parser.add_argument('--road-graph', help='use road distances from a graph built by road_graph.py')
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    args = parser.parse_args(argv)
+
+    # The matcher logs every skipped candidate at debug level; keep the run quiet
+    logging.basicConfig(level=logging.WARNING)
+    search = SearchPolicy(parse_schedule(args.schedule)) if args.schedule else SearchPolicy()
+    if args.events:
+        arrivals = list(recorded(args.events))
+    else:
+        arrivals = list(synthetic(args.hours, args.rate, args.seed))
+
+    distance = road_graph.RoadDistance(road_graph.RoadGraph.load(args.road_graph)) if args.road_graph else None
+    reports = []
+    for name in args.policy.split(','):
+        simulation = Simulation(load_policy(name.strip(), search), arrivals,
+                                interval=args.interval, first=args.first, timeout=args.timeout,
+                                distance=distance)
+        reports.append(simulation.run())
+
+    if args.json:
+        for report in reports:
+            print(json.dumps(report))
+        return
+    rows = [[str(report.get(column)) for column in COLUMNS] for report in reports]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(COLUMNS)]
+    print('  '.join(column.ljust(width) for column, width in zip(COLUMNS, widths)))
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
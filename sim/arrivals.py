@@ -0,0 +1,83 @@
+"""Cart arrival streams for the simulator.
+
+An arrival is a dict with 't' (seconds from the start of the run) plus
+the cart fields the matcher reads: location, app, cart_total,
+min_for_free, and optionally items and store_id.
+"""
+import math
+import random
+
+import geocells
+from events import read_events
+
+# Relative order volume by hour of day: lunch and dinner peaks
+HOURLY_PROFILE = (
+    0.2, 0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.5, 0.7, 0.8, 0.9, 1.2,
+    1.8, 2.0, 1.4, 0.9, 0.8, 1.0, 1.4, 2.0, 2.4, 2.0, 1.2, 0.6,
+)
+
+DEFAULT_CENTERS = ((12.9716, 77.5946), (12.9352, 77.6245), (12.9698, 77.7500))  # Bengaluru
+
+# (app, share of orders, typical min_for_free)
+DEFAULT_APPS = (('Zepto', 0.5, 199), ('Swiggy', 0.3, 249), ('Zomato', 0.2, 299))
+
+ITEM_CATALOGUE = ('milk', 'bread', 'eggs', 'butter', 'curd', 'paneer', 'rice', 'atta', 'onion', 'tomato',
+                  'potato', 'banana', 'apple', 'chips', 'biscuits', 'coke', 'chocolate', 'ice cream',
+                  'coffee', 'tea')
+
+
+def _random_point(rng, center, radius_km):
+    distance = radius_km * math.sqrt(rng.random())
+    bearing = rng.random() * 2 * math.pi
+    lat = center[0] + (distance * math.cos(bearing)) / 111.32
+    lon = center[1] + (distance * math.sin(bearing)) / (111.32 * math.cos(math.radians(center[0])))
+    return geocells.coarsen(lat, lon)
+
+
+def synthetic(hours=24, rate_per_min=1.0, seed=0, centers=DEFAULT_CENTERS, spread_km=4.0, apps=DEFAULT_APPS):
+    """Poisson arrivals following HOURLY_PROFILE, clustered around `centers`.
+
+    `rate_per_min` is the mean arrival rate at a profile weight of 1.
+    Arrivals are generated by thinning a homogeneous process at the peak rate.
+    """
+    rng = random.Random(seed)
+    peak = rate_per_min * max(HOURLY_PROFILE) / 60
+    names, weights, minimums = zip(*apps)
+    t = 0.0
+    while True:
+        t += rng.expovariate(peak)
+        if t >= hours * 3600:
+            return
+        if rng.random() * max(HOURLY_PROFILE) > HOURLY_PROFILE[int(t // 3600) % 24]:
+            continue
+        i = rng.choices(range(len(names)), weights=weights)[0]
+        yield {
+            't': t,
+            'location': _random_point(rng, rng.choice(centers), spread_km),
+            'app': names[i],
+            'cart_total': round(rng.uniform(0.2, 0.9) * minimums[i]),
+            'min_for_free': minimums[i],
+            'items': rng.sample(ITEM_CATALOGUE, rng.randint(1, 6)),
+            'store_id': f"{names[i].lower()}-{rng.randint(1, 12)}",
+        }
+
+
+def recorded(paths):
+    """Arrivals from 'cart_created' events in EventLog files.
+
+    Events carry a geocell rather than coordinates, so carts are placed at
+    the cell centre. Times are rebased so the first arrival is at t=0.
+    """
+    events = sorted((e for e in read_events(paths) if e.get('e') == 'cart_created' and e.get('cell') is not None),
+                    key=lambda e: e['t'])
+    if not events:
+        return
+    start = events[0]['t']
+    for event in events:
+        yield {
+            't': event['t'] - start,
+            'location': geocells.center(event['cell']),
+            'app': event.get('app'),
+            'cart_total': float(event.get('total') or 0),
+            'min_for_free': float(event.get('min') or 0),
+        }
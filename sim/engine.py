@@ -0,0 +1,121 @@
+"""Discrete-event simulation of the search loop.
+
+Events (arrivals, search ticks, timeouts) sit in a heap ordered by
+virtual time; the clock jumps from one event to the next, so idle time
+costs nothing. Each searcher ticks every `interval` seconds after a
+`first` delay, like the bot's per-user search job, and gives up after
+`timeout` seconds.
+"""
+import heapq
+import itertools
+import time
+
+import fingerprint
+import geocells
+from fairness import IndexedHeap, TimeToMatch
+
+
+class VirtualClock:
+    """Simulated time in seconds; only the engine advances it."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+
+ARRIVE, TICK = 0, 1
+
+
+class Simulation:
+    """Runs one policy over one arrival stream."""
+
+    def __init__(self, policy, arrivals, interval=10.0, first=5.0, timeout=1800.0, distance=None):
+        self.policy = policy
+        self.distance = distance  # optional provider, e.g. road_graph.RoadDistance
+        self.interval = interval
+        self.first = first
+        self.timeout = timeout
+        self.clock = VirtualClock()
+        self.carts = {}
+        self.users = {}  # {user_id: {'search_start_time': float}}
+        self.cells = geocells.CellIndex()
+        self.buckets = fingerprint.LSHIndex()
+        self.waiting = IndexedHeap()
+        self.waits = TimeToMatch(samples=1 << 20)
+        self.reassigned = 0
+        self._events = []
+        self._seq = itertools.count()
+        for n, arrival in enumerate(arrivals):
+            self._push(arrival['t'], ARRIVE, (f"u{n}", arrival))
+
+    def _push(self, at, kind, payload):
+        heapq.heappush(self._events, (at, next(self._seq), kind, payload))
+
+    def _add(self, user_id, arrival):
+        cart = {key: value for key, value in arrival.items() if key != 't'}
+        cart['user_id'] = user_id
+        cart['cell'] = geocells.encode(*cart['location'])
+        if cart.get('items'):
+            cart['fingerprint'] = fingerprint.minhash(cart['items'])
+        self.carts[user_id] = cart
+        self.cells.add(cart['cell'], user_id)
+        self.buckets.add(user_id, cart.get('fingerprint'), cart.get('store_id'))
+        self.users[user_id] = {'search_start_time': self.clock.now}
+        self.waiting.push(user_id, self.clock.now)
+
+    def _remove(self, user_id):
+        cart = self.carts.pop(user_id)
+        self.cells.discard(cart['cell'], user_id)
+        self.buckets.discard(user_id, cart.get('fingerprint'), cart.get('store_id'))
+        self.waiting.remove(user_id)
+
+    def run(self):
+        """Process every event and return a report dict."""
+        arrivals = expired = ticks = 0
+        match_cpu = 0.0
+        cpu_start = time.process_time()
+        while self._events:
+            at, _, kind, payload = heapq.heappop(self._events)
+            self.clock.now = at
+            if kind == ARRIVE:
+                user_id, arrival = payload
+                arrivals += 1
+                self._add(user_id, arrival)
+                self._push(at + self.first, TICK, user_id)
+                continue
+
+            user_id = payload
+            if user_id not in self.carts:
+                continue  # matched or expired since this tick was scheduled
+            if at - self.users[user_id]['search_start_time'] > self.timeout:
+                self._remove(user_id)
+                expired += 1
+                continue
+            ticks += 1
+            start = time.process_time()
+            pair = self.policy.match(self, user_id)
+            match_cpu += time.process_time() - start
+            if pair:
+                for uid in pair:
+                    self.waits.record(at - self.users[uid]['search_start_time'])
+                    self._remove(uid)
+            if user_id in self.carts:
+                self._push(at + self.interval, TICK, user_id)
+
+        # Searchers still waiting when the stream ends count as unmatched
+        unmatched = len(self.carts) + expired
+        matched = arrivals - unmatched
+        summary = self.waits.summary()
+        return {
+            'policy': self.policy.name,
+            'arrivals': arrivals,
+            'matched': matched,
+            'match_rate': round(matched / arrivals, 3) if arrivals else None,
+            'expired': expired,
+            'p50_wait_s': summary['p50_s'],
+            'p90_wait_s': summary['p90_s'],
+            'reassigned': self.reassigned,
+            'ticks': ticks,
+            'cpu_s': round(time.process_time() - cpu_start, 3),
+            'match_us_per_tick': round(match_cpu / ticks * 1e6, 1) if ticks else None,
+            'simulated_h': round(self.clock.now / 3600, 2),
+        }
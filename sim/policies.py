@@ -0,0 +1,89 @@
+"""Pairing policies for the simulator.
+
+A policy decides, on one searcher's tick, who (if anyone) gets paired.
+match() returns a (user_id, partner_id) pair or None; the pair need not
+include the ticking user, which is how the fair policy hands a cart to
+an older searcher. The radius/tolerance schedule comes from a
+SearchPolicy, so schedules and pairing rules can be varied independently.
+
+Register a new policy with @register_policy, or pass module:Class to
+load_policy() / `python -m sim --policy`.
+"""
+import abc
+import importlib
+
+import fairness
+from search_policy import SearchPolicy, find_best_match, find_match
+
+POLICIES = {}
+
+
+def register_policy(cls):
+    POLICIES[cls.name] = cls
+    return cls
+
+
+def load_policy(name, search_policy=None):
+    """Instantiate a registered policy by name, or an external one given as module:Class."""
+    if ':' in name:
+        module_name, _, class_name = name.partition(':')
+        cls = getattr(importlib.import_module(module_name), class_name)
+    else:
+        cls = POLICIES[name]
+    return cls(search_policy or SearchPolicy())
+
+
+class Policy(abc.ABC):
+    """Base policy; subclasses implement match()."""
+
+    name = 'base'
+
+    def __init__(self, search_policy):
+        self.search = search_policy
+
+    @abc.abstractmethod
+    def match(self, sim, user_id):
+        """Return the (user_id, partner_id) pair to make on `user_id`'s tick, or None."""
+
+
+@register_policy
+class NearestPolicy(Policy):
+    """The first compatible cart in ring order - the original matcher."""
+
+    name = 'nearest'
+
+    def match(self, sim, user_id):
+        radius_km, tolerance = self.search.step(sim.clock.now - sim.users[user_id]['search_start_time'])
+        result = find_match(sim.carts[user_id], sim.carts, sim.cells, radius_km, tolerance, exclude=(user_id,))
+        return (user_id, result[0]['user_id']) if result else None
+
+
+@register_policy
+class ScoredPolicy(Policy):
+    """The best blended score among nearby and LSH candidates."""
+
+    name = 'scored'
+
+    def match(self, sim, user_id):
+        radius_km, tolerance = self.search.step(sim.clock.now - sim.users[user_id]['search_start_time'])
+        result = find_best_match(sim.carts[user_id], sim.carts, sim.cells, radius_km, tolerance,
+                                 exclude=(user_id,), lsh=sim.buckets, distance=sim.distance)
+        return (user_id, result[0]['user_id']) if result else None
+
+
+@register_policy
+class FairPolicy(ScoredPolicy):
+    """Scored matching where the oldest compatible searcher claims the cart."""
+
+    name = 'fair'
+
+    def match(self, sim, user_id):
+        pair = super().match(sim, user_id)
+        if pair is None:
+            return None
+        partner_id = pair[1]
+        claimant = fairness.oldest_claimant(sim.carts[partner_id], user_id, sim.carts, sim.cells, sim.waiting,
+                                            self.search, sim.clock.now, sim.users, distance=sim.distance)
+        if claimant != user_id:
+            sim.reassigned += 1
+        return claimant, partner_id
@@ -0,0 +1,180 @@
+"""Compact binary snapshots of the in-memory bot state.
+
+Layout (all integers little-endian):
+
+    magic  b'DSSN'
+    u16    format version
+    u16    marshal version of the writing interpreter
+    f64    bot clock (bot_data['current_time']) at dump time
+    u32    number of carts
+    ...    cart columns: cell (i64), lat, lon, cart_total, min_for_free (f64)
+    ...    item fingerprints: NUM_HASHES u32 per cart (MISSING_SIGNATURE first
+           when the cart has none)
+    ...    cart string columns: user_id, cart_id, pseudonym, app, store_id, items
+           (items are joined with ITEM_SEPARATOR)
+    ...    zlib-compressed marshal of {'users': ..., 'active_chats': ...}
+
+Every variable-length block is prefixed with its byte length (u32).
+Snapshots are written to a temp file and renamed into place, so a crash
+mid-write never leaves a truncated snapshot behind. Fingerprints are
+stored rather than recomputed on load: MinHash over every cart was most
+of the restore time.
+"""
+import marshal
+import math
+import os
+import struct
+import zlib
+from array import array
+
+import fingerprint
+
+MAGIC = b'DSSN'
+VERSION = 3
+
+ITEM_SEPARATOR = '\x1f'
+MISSING_SIGNATURE = 0xFFFFFFFF  # MinHash values are below 2**31
+
+_HEADER = struct.Struct('<4sHHdI')
+_LENGTH = struct.Struct('<I')
+
+_NUMERIC_COLUMNS = ('cell', 'lat', 'lon', 'cart_total', 'min_for_free')
+_STRING_COLUMNS = ('user_id', 'cart_id', 'pseudonym', 'app', 'store_id', 'items')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing fields or has an unknown format."""
+
+
+def _pack_block(data):
+    return _LENGTH.pack(len(data)) + data
+
+
+def _pack_strings(values):
+    return _pack_block('\x00'.join(values).encode('utf-8'))
+
+
+def encode(users, carts, active_chats, clock=0):
+    """Serialise the state into snapshot bytes."""
+    rows = list(carts.values())
+    columns = {
+        'cell': array('q'),
+        'lat': array('d'),
+        'lon': array('d'),
+        'cart_total': array('d'),
+        'min_for_free': array('d'),
+    }
+    strings = {name: [] for name in _STRING_COLUMNS}
+    signatures = array('I')
+    missing = [MISSING_SIGNATURE] * fingerprint.NUM_HASHES
+    for cart in rows:
+        location = cart.get('location') or (math.nan, math.nan)
+        cell = cart.get('cell')
+        columns['cell'].append(-1 if cell is None else cell)
+        columns['lat'].append(location[0])
+        columns['lon'].append(location[1])
+        columns['cart_total'].append(float(cart.get('cart_total', 0)))
+        columns['min_for_free'].append(float(cart.get('min_for_free', 0)))
+        signature = cart.get('fingerprint')
+        if signature is None and cart.get('items'):
+            signature = fingerprint.minhash(cart['items'])
+        signatures.extend(signature or missing)
+        for name in _STRING_COLUMNS[:-1]:
+            strings[name].append(str(cart.get(name) or '').replace('\x00', ''))
+        items = cart.get('items') or []
+        strings['items'].append(ITEM_SEPARATOR.join(items).replace('\x00', '') if isinstance(items, list) else '')
+
+    parts = [_HEADER.pack(MAGIC, VERSION, marshal.version, float(clock), len(rows))]
+    for name in _NUMERIC_COLUMNS:
+        parts.append(_pack_block(columns[name].tobytes()))
+    parts.append(_pack_block(signatures.tobytes()))
+    for name in _STRING_COLUMNS:
+        parts.append(_pack_strings(strings[name]))
+    state = marshal.dumps({'users': users, 'active_chats': active_chats})
+    parts.append(_pack_block(zlib.compress(state, 1)))
+    return b''.join(parts)
+
+
+def decode(data):
+    """Parse snapshot bytes into (users, carts, active_chats, clock)."""
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, marshal_version, clock, count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not a DeliveryShare snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+    if marshal_version != marshal.version:
+        raise SnapshotError(f"Snapshot was written with marshal version {marshal_version}")
+    offset = _HEADER.size
+
+    def read_block():
+        nonlocal offset
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        block = view[offset:offset + length]
+        if len(block) != length:
+            raise SnapshotError("Snapshot is truncated")
+        offset += length
+        return block
+
+    columns = {}
+    for name in _NUMERIC_COLUMNS:
+        column = array('q' if name == 'cell' else 'd')
+        column.frombytes(read_block())
+        if len(column) != count:
+            raise SnapshotError(f"Column '{name}' has {len(column)} rows, expected {count}")
+        columns[name] = column
+    signatures = array('I')
+    signatures.frombytes(read_block())
+    if len(signatures) != count * fingerprint.NUM_HASHES:
+        raise SnapshotError(f"Fingerprint column has {len(signatures)} values, expected "
+                            f"{count} x {fingerprint.NUM_HASHES}")
+    strings = {}
+    for name in _STRING_COLUMNS:
+        block = bytes(read_block()).decode('utf-8')
+        strings[name] = block.split('\x00') if count else []
+    state = marshal.loads(zlib.decompress(read_block()))
+
+    carts = {}
+    width = fingerprint.NUM_HASHES
+    rows = zip(strings['user_id'], strings['cart_id'], strings['pseudonym'], strings['app'],
+               strings['store_id'], strings['items'], columns['cell'], columns['lat'], columns['lon'],
+               columns['cart_total'], columns['min_for_free'])
+    for row, (user_id, cart_id, pseudonym, app, store_id, items, cell, lat, lon, total, minimum) in enumerate(rows):
+        start = row * width
+        carts[user_id] = {
+            'cart_id': cart_id,
+            'user_id': user_id,
+            'pseudonym': pseudonym,
+            'app': app,
+            'location': None if lat != lat else (lat, lon),  # NaN marks a missing location
+            'cell': None if cell < 0 else cell,
+            'cart_total': total,
+            'items': items.split(ITEM_SEPARATOR) if items else [],
+            'store_id': store_id or None,
+            'min_for_free': minimum,
+            'fingerprint': None if signatures[start] == MISSING_SIGNATURE
+            else tuple(signatures[start:start + width]),
+        }
+
+    return state['users'], carts, state['active_chats'], clock
+
+
+def save(path, users, carts, active_chats, clock=0):
+    """Atomically write a snapshot to `path`."""
+    data = encode(users, carts, active_chats, clock)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def load(path):
+    """Read a snapshot from `path`; see decode() for the return value."""
+    with open(path, 'rb') as f:
+        return decode(f.read())
@@ -0,0 +1,66 @@
+"""Optional fast runtime: uvloop event loop and orjson encoding and decoding.
+
+Enabled with FAST_RUNTIME=1. Each piece is used only if its package is
+importable; otherwise the stock asyncio loop and stdlib json are kept,
+so the bot runs the same with or without the extras installed
+(`pip install uvloop orjson`). Compare the modes with `python bench.py`.
+"""
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+ENABLED = os.getenv('FAST_RUNTIME') == '1'
+
+
+def fast_json_enabled():
+    return ENABLED and orjson is not None
+
+
+def loads(payload):
+    """Decode JSON from bytes or str with orjson when enabled."""
+    if fast_json_enabled():
+        return orjson.loads(payload)
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8', 'replace')
+    return json.loads(payload)
+
+
+def dumps(obj):
+    """Encode `obj` as a compact JSON str with orjson when enabled."""
+    if fast_json_enabled():
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, separators=(',', ':'), default=str)
+
+
+def run(main):
+    """asyncio.run(main) on uvloop when enabled and installed."""
+    if ENABLED and uvloop is not None:
+        return uvloop.run(main) if hasattr(uvloop, 'run') else _run_with_policy(main)
+    return asyncio.run(main)
+
+
+def _run_with_policy(main):
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
+
+
+def describe():
+    """Summary of the active runtime for startup logs and /admin."""
+    return {
+        'fast_runtime': ENABLED,
+        'event_loop': 'uvloop' if ENABLED and uvloop is not None else 'asyncio',
+        'json': 'orjson' if fast_json_enabled() else 'json',
+    }
@@ -0,0 +1,97 @@
+"""Shared fixtures.
+
+bot.py reads its configuration from the environment and builds its state
+at import time, so the environment is set up here before any test module
+imports it, and the `bot` fixture reloads it to start each test clean.
+"""
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STATE_DIR = tempfile.mkdtemp(prefix='deliveryshare-tests-')
+os.environ['TELEGRAM_BOT_TOKEN'] = '123456:TEST'
+os.environ['STATE_DIR'] = STATE_DIR
+os.environ['EVENTS_PATH'] = os.path.join(STATE_DIR, 'events.ndjson')
+os.chdir(STATE_DIR)  # bot.log is written to the working directory
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, CallbackContext, ExtBot  # noqa: E402
+
+
+class RecordingBot(ExtBot):
+    """Bot that records outgoing messages instead of calling the Bot API."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self._unfrozen():
+            self.sent = []
+            self.answers = []  # (callback_query_id, text, show_alert)
+            self.edited = []  # (chat_id, message_id, text)
+            self.fail_for = {}  # {chat_id: exception to raise on send}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.fail_for.get(str(chat_id))
+        if error is not None:
+            raise error
+        self.sent.append((str(chat_id), text))
+        return type('Message', (), {'message_id': len(self.sent), 'chat_id': chat_id})()
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.edited.append((str(chat_id), message_id, text))
+        return True
+
+    async def answer_callback_query(self, callback_query_id, text=None, show_alert=None, **kwargs):
+        self.answers.append((callback_query_id, text, show_alert))
+        return True
+
+
+@pytest.fixture
+def bot():
+    """A freshly imported bot module with empty state."""
+    import bot as module
+    return importlib.reload(module)
+
+
+@pytest.fixture
+def application(bot):
+    app = Application.builder().bot(RecordingBot(os.environ['TELEGRAM_BOT_TOKEN'])).build()
+    app.bot_data['current_time'] = 0
+    return app
+
+
+@pytest.fixture
+def context(application):
+    return CallbackContext(application)
+
+
+def add_searcher(bot, user_id, location, total=200.0, minimum=300.0, start=0, app='Zepto', items=None):
+    """Put a user into the searching state with a pooled cart, as handle_location does."""
+    bot.users[user_id] = {
+        'pseudonym': f'Shopper_{user_id}', 'chat_id': user_id, 'app': app, 'location': location,
+        'cell': bot.geocells.encode(*location), 'cart_total': total, 'min_for_free': minimum,
+        'items': items or [], 'search_start_time': start,
+    }
+    bot.set_step(user_id, 'searching')
+    bot.add_cart(bot.build_cart(user_id))
+    return bot.users[user_id]
+
+
+def make_update(telegram_bot, user_id, text=None, data=None, update_id=1, location=None):
+    """An inbound Update from `user_id`: text, a (lat, lon) `location`, or a button press if `data` is given."""
+    user = {'id': int(user_id), 'is_bot': False, 'first_name': 'Shopper'}
+    message = {'message_id': update_id, 'date': 1700000000, 'chat': {'id': int(user_id), 'type': 'private'},
+               'from': user, 'text': text}
+    if location is not None:
+        message['location'] = {'latitude': location[0], 'longitude': location[1]}
+    if data is not None:
+        payload = {'callback_query': {'id': str(update_id), 'from': user, 'chat_instance': '1',
+                                      'data': data, 'message': message}}
+    else:
+        payload = {'message': message}
+    return Update.de_json({'update_id': update_id, **payload}, telegram_bot)
@@ -0,0 +1,31 @@
+import asyncio
+
+from conftest import add_searcher
+
+
+def _get(bot, application, monkeypatch, **query):
+    monkeypatch.setattr(bot, 'OPS_TOKEN', 'secret')
+    handle = bot.admin_endpoint(application)
+    return asyncio.run(handle({'query': query, 'headers': {'x-ops-token': 'secret'}}))
+
+
+def test_oldest_lists_the_longest_waiting_searchers_first(bot, application, monkeypatch):
+    application.bot_data['current_time'] = 100
+    for n, start in enumerate([40, 10, 70]):
+        add_searcher(bot, str(101 + n), (12.9716, 77.5946), start=start)
+
+    status, result = _get(bot, application, monkeypatch, q='oldest', arg='2')
+
+    assert status == 200 and result['searching'] == 3
+    assert [(row['user'], row['waiting_s']) for row in result['oldest']] == [('102', 90), ('101', 60)]
+
+
+def test_oldest_count_is_validated_and_capped(bot, application, monkeypatch):
+    for n in range(bot.ADMIN_OLDEST_MAX + 5):
+        add_searcher(bot, str(1000 + n), (12.9716, 77.5946), start=n)
+
+    assert _get(bot, application, monkeypatch, q='oldest', arg='x')[0] == 400
+    assert len(_get(bot, application, monkeypatch, q='oldest', arg='1000000')[1]['oldest']) == bot.ADMIN_OLDEST_MAX
+    assert len(_get(bot, application, monkeypatch, q='oldest', arg='0')[1]['oldest']) == 1
+    assert len(_get(bot, application, monkeypatch, q='oldest')[1]['oldest']) == 10
+    assert 'error' in asyncio.run(bot.admin_query(application, 'oldest', 'x'))
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import pytest
+
+import cart_links
+from conftest import ROOT
+
+FIXTURES = os.path.join(ROOT, 'fixtures', 'cart_links.json')
+ZEPTO_URL = 'https://www.zeptonow.com/cart/share/demo-milk-bread'
+
+
+class CountingParser(cart_links.FixtureCartParser):
+    def __init__(self, path):
+        super().__init__(path)
+        self.calls = 0
+
+    async def parse(self, url, app):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return await super().parse(url, app)
+
+
+@pytest.mark.parametrize('text, expected', [
+    (f'my cart: {ZEPTO_URL}.', (ZEPTO_URL, 'Zepto')),
+    ('https://swig.gy/abc123', ('https://swig.gy/abc123', 'Swiggy')),
+    ('see https://example.com/x then https://zoma.to/c/9', ('https://zoma.to/c/9', 'Zomato')),
+    ('https://notzepto.com/cart', None),
+    ('250', None),
+])
+def test_find_cart_url(text, expected):
+    assert cart_links.find_cart_url(text) == expected
+
+
+def test_ingest_parses_fixture_and_caches():
+    parser = CountingParser(FIXTURES)
+    ingestor = cart_links.CartIngestor(parser)
+
+    async def run():
+        url, app = cart_links.find_cart_url(f'join my order {ZEPTO_URL}')
+        first, second = await asyncio.gather(ingestor.ingest(url, app), ingestor.ingest(url, app))
+        third = await ingestor.ingest(url, app)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third == {
+        'app': 'Zepto',
+        'items': ['amul taaza toned milk 1l', 'britannia whole wheat bread', 'farm fresh eggs 6'],
+        'cart_total': 212.0,
+        'store_id': 'BLR-KOR-04',
+    }
+    assert parser.calls == 1
+
+
+def test_unknown_link_is_cached_as_a_failure_briefly():
+    now = [0.0]
+    parser = CountingParser(FIXTURES)
+    ingestor = cart_links.CartIngestor(parser, cache=cart_links.TTLCache(clock=lambda: now[0]), failure_ttl=60)
+    url = 'https://www.zeptonow.com/cart/share/unknown'
+
+    assert asyncio.run(ingestor.ingest(url, 'Zepto')) is None
+    assert asyncio.run(ingestor.ingest(url, 'Zepto')) is None
+    assert parser.calls == 1
+    now[0] = 61
+    asyncio.run(ingestor.ingest(url, 'Zepto'))
+    assert parser.calls == 2
+
+
+def test_load_parser_rejects_non_parsers():
+    with pytest.raises(ValueError):
+        cart_links.load_parser('cart_links')
+    with pytest.raises(TypeError):
+        cart_links.load_parser('cart_links:TTLCache')
+
+
+def test_link_option_only_offered_with_a_parser(bot):
+    def labels():
+        return [row[0].callback_data for row in bot.cart_options_keyboard().inline_keyboard]
+
+    assert 'share_cart' not in labels()
+    bot.cart_ingestor = cart_links.CartIngestor(cart_links.FixtureCartParser(FIXTURES))
+    assert labels()[0] == 'share_cart'
+
+
+def test_parser_without_parse_fails_when_loaded():
+    class Unfinished(cart_links.CartParser):
+        pass
+
+    with pytest.raises(TypeError):
+        Unfinished()
@@ -0,0 +1,72 @@
+import asyncio
+
+from telegram.error import NetworkError
+
+from chat_buffer import DELIVERED, RETRY, ChatBuffer
+from conftest import add_searcher, make_update
+
+
+def test_channels_are_per_sender_and_discarded_per_pair():
+    buffer = ChatBuffer()
+    buffer.enqueue('b', 'a', 'from a', 0)
+    buffer.enqueue('b', 'c', 'from c', 0)
+    buffer.enqueue('a', 'b', 'to a', 0)
+
+    buffer.discard('a', 'b')
+
+    assert buffer.pending('b', 'a') == buffer.pending('a', 'b') == 0
+    assert buffer.pending('b', 'c') == 1
+    assert buffer.due(0) == [('c', 'b')]
+
+
+def test_discard_during_a_failing_send_does_not_resurrect_the_channel():
+    buffer = ChatBuffer()
+    buffer.enqueue('b', 'a', 'hello', 0)
+
+    async def send(text):
+        buffer.discard('a', 'b')  # the match ends while the send is in flight
+        raise NetworkError('connection reset')
+
+    outcome, _ = asyncio.run(buffer.flush(('a', 'b'), send, 0))
+
+    assert outcome == DELIVERED
+    assert len(buffer) == 0 and not buffer.due(float('inf'))
+
+
+def test_concurrent_flushes_send_each_message_once():
+    buffer = ChatBuffer()
+    for n in range(3):
+        buffer.enqueue('b', 'a', f'm{n}', 0)
+    sent = []
+
+    async def send(text):
+        await asyncio.sleep(0.01)
+        sent.append(text)
+
+    async def run():
+        return await asyncio.gather(buffer.flush(('a', 'b'), send, 0), buffer.flush(('a', 'b'), send, 0))
+
+    outcomes = asyncio.run(run())
+
+    assert sent == ['m0', 'm1', 'm2']
+    assert sorted(outcome for outcome, _ in outcomes) == [DELIVERED, RETRY]
+
+
+def test_ending_a_match_drops_messages_still_queued_for_the_partner(bot, application, context):
+    for user_id, location in (('101', (12.9716, 77.5946)), ('102', (12.9720, 77.5950))):
+        add_searcher(bot, user_id, location)
+    asyncio.run(bot.search_for_matches(context, '101'))
+    for user_id in ('101', '102'):
+        bot.users[user_id]['chat_active'] = True
+    bot.active_chats.update({'101': '102', '102': '101'})
+    application.bot.fail_for['102'] = NetworkError('connection reset')
+    asyncio.run(bot.handle_message(make_update(application.bot, '101', text='meet at gate 2'), context))
+    assert bot.chat_buffer.pending('102', '101') == 1
+
+    application.bot.fail_for.clear()  # the partner is reachable again
+
+    asyncio.run(bot.button_callback(make_update(application.bot, '101', data='end_match', update_id=2), context))
+    asyncio.run(bot.deliver_buffered(context))
+
+    assert len(bot.chat_buffer) == 0
+    assert not any('meet at gate 2' in text for _, text in application.bot.sent)
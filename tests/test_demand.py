@@ -0,0 +1,41 @@
+import geocells
+from demand import DemandStats
+
+HERE = geocells.encode(12.9716, 77.5946)
+NEXT_DOOR = geocells.encode(12.9760, 77.5946)
+DELHI = geocells.encode(28.6139, 77.2090)
+
+
+def test_open_carts_are_counted_per_app_within_the_radius():
+    demand = DemandStats()
+    demand.add(HERE, 'Zepto', 250)
+    demand.add(NEXT_DOOR, ' zepto ', 120)
+    demand.add(DELHI, 'Zepto', 300)
+    demand.add(HERE, 'Blinkit', 80)
+
+    assert demand.open_within(HERE, 'Zepto', 1.0) == 2
+    assert demand.open_within(HERE, 'Blinkit', 1.0) == 1
+    assert demand.open_within(HERE, 'Swiggy', 1.0) == 0
+    assert demand.totals_within(HERE, 'Zepto', 1.0)[1:3] == [1, 1]
+    assert demand.by_app() == {'zepto': 3, 'blinkit': 1}
+
+
+def test_removing_carts_keeps_the_counters_in_step():
+    demand = DemandStats()
+    demand.add(HERE, 'Zepto', 250)
+    demand.add(HERE, 'Zepto', 250)
+    demand.remove(HERE, 'Zepto', 250)
+    demand.remove(HERE, 'Zepto', 250)
+    demand.remove(HERE, 'Zepto', 250)  # already gone: ignored
+
+    assert demand.open_within(HERE, 'Zepto', 1.0) == 0
+    assert sum(demand.totals_within(HERE, 'Zepto', 1.0)) == 0
+
+
+def test_median_wait_comes_from_recent_matches_nearby():
+    demand = DemandStats()
+    assert demand.median_wait_within(HERE, 'Zepto', 2.0) is None
+    for wait in (30, 60, 600):
+        demand.record_match(HERE, 'Zepto', wait)
+    demand.record_match(DELHI, 'Zepto', 5)
+    assert demand.median_wait_within(HERE, 'Zepto', 2.0) == 60
@@ -0,0 +1,42 @@
+import asyncio
+
+import events
+from conftest import add_searcher, make_update
+
+BANGALORE = (12.9716, 77.5946)
+
+
+def _edit(bot, application, context, user_id, field, amount):
+    asyncio.run(bot.button_callback(make_update(application.bot, user_id, data=f'edit_{field}', update_id=1), context))
+    asyncio.run(bot.handle_message(make_update(application.bot, user_id, text=amount, update_id=2), context))
+
+
+def test_editing_the_total_keeps_the_queue_position_and_moves_the_demand_totals(bot, application, context):
+    add_searcher(bot, '101', BANGALORE, start=0)
+    add_searcher(bot, '102', BANGALORE, start=10, app='Blinkit')
+    add_searcher(bot, '103', (28.6139, 77.2090), start=20)
+    cell = bot.users['101']['cell']
+    assert bot.demand.totals_within(cell, 'Zepto', 1.0)[2] == 1
+
+    _edit(bot, application, context, '101', 'cart_total', '450')
+
+    assert bot.carts['101']['cart_total'] == 450.0
+    assert [user_id for _, user_id in bot.waiting.smallest(3)] == ['101', '102', '103']
+    assert bot.users['101']['search_start_time'] == 0 and bot.users['101']['step'] == 'searching'
+    histogram = bot.demand.totals_within(cell, 'Zepto', 1.0)
+    assert (histogram[2], histogram[4]) == (0, 1)
+    assert bot.demand.open_within(cell, 'Zepto', 1.0) == 1
+    assert application.bot.sent[-1][1].startswith('✅ Cart updated: ₹450.00')
+    stats = events.aggregate(bot.event_log._buffer)
+    assert sum(row['cart_edited'] for row in stats.values()) == 1
+
+
+def test_an_edit_that_closes_the_gap_matches_straight_away(bot, application, context):
+    add_searcher(bot, '101', BANGALORE, total=50.0)
+    add_searcher(bot, '102', (12.9720, 77.5950), total=50.0)
+    asyncio.run(bot.search_for_matches(context, '101'))
+    assert bot.users['101'].get('matched_with') is None
+
+    _edit(bot, application, context, '102', 'cart_total', '260')
+
+    assert bot.users['102']['matched_with'] == '101'
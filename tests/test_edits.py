@@ -0,0 +1,31 @@
+import asyncio
+import gc
+
+from edits import EditCoalescer
+
+
+class EditingBot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, **kwargs):
+        self.edits.append((chat_id, message_id, text))
+
+
+def test_deferred_edits_are_kept_alive_and_flushed():
+    bot = EditingBot()
+    coalescer = EditCoalescer(debounce=0.05)
+
+    async def run():
+        assert await coalescer.edit(bot, 1, 7, 'first')
+        assert not await coalescer.edit(bot, 1, 7, 'second')
+        assert not await coalescer.edit(bot, 1, 7, 'third')
+        gc.collect()  # a task only the event loop knew about could be collected here
+        assert len(coalescer._tasks) == 1
+        await coalescer.flush()
+
+    asyncio.run(run())
+
+    assert bot.edits == [('1', 7, 'first'), ('1', 7, 'third')]
+    assert not coalescer._tasks
+    assert coalescer.coalesced == 1
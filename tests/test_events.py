@@ -0,0 +1,67 @@
+import asyncio
+import os
+import threading
+import time
+
+import events
+import geocells
+
+CELL = geocells.encode(12.9716, 77.5946)
+
+
+def test_flushed_events_aggregate_per_cell_and_app(tmp_path):
+    log = events.EventLog(str(tmp_path / 'events.ndjson'))
+    log.emit('cart_created', cell=CELL, app='Zepto', total=200.0)
+    log.emit('cart_created', cell=CELL, app='Zepto', total=150.0)
+    log.emit('matched', cell=CELL, app='Zepto', wait=30)
+    log.emit('matched', cell=CELL, app='Zepto', wait=90)
+    log.emit('expired', cell=CELL, app='Blinkit', wait=900)
+    asyncio.run(log.flush())
+
+    stats = events.aggregate(events.read_events([log.path]))
+
+    (zepto,) = [row for (cell, app, _), row in stats.items() if app == 'Zepto']
+    (blinkit,) = [row for (cell, app, _), row in stats.items() if app == 'Blinkit']
+    assert (zepto['cart_created'], zepto['matched'], zepto['waits']) == (2, 2, [30, 90])
+    assert blinkit['expired'] == 1
+
+
+def test_full_file_is_rotated_before_appending(tmp_path):
+    log = events.EventLog(str(tmp_path / 'events.ndjson'), max_bytes=200, backups=2)
+    for n in range(3):
+        for _ in range(3):
+            log.emit('cart_created', cell=CELL, app='Zepto')
+        log.flush_sync()
+    assert sorted(os.listdir(tmp_path)) == ['events.ndjson', 'events.ndjson.1', 'events.ndjson.2']
+    assert len(list(events.read_events([log.path]))) == 3
+
+
+def test_shutdown_flush_waits_for_a_threaded_flush(tmp_path, monkeypatch):
+    log = events.EventLog(str(tmp_path / 'events.ndjson'))
+    entered, release = threading.Event(), threading.Event()
+    exists = os.path.exists
+
+    def stalled_exists(path):
+        # The first writer stalls while it owns the file
+        if path == log.path and not entered.is_set():
+            entered.set()
+            release.wait(5)
+        return exists(path)
+    monkeypatch.setattr(os.path, 'exists', stalled_exists)
+
+    async def overlap():
+        log.emit('cart_created', cell=CELL, app='Zepto', n=0)
+        pending = asyncio.create_task(log.flush())
+        await asyncio.to_thread(entered.wait, 5)
+        log.emit('matched', cell=CELL, app='Zepto', n=1)
+        shutdown = threading.Thread(target=log.flush_sync)
+        shutdown.start()
+        time.sleep(0.2)
+        blocked = shutdown.is_alive()
+        release.set()
+        await pending
+        shutdown.join(5)
+        return blocked
+
+    assert asyncio.run(overlap()) is True
+    assert [event['n'] for event in events.read_events([log.path])] == [0, 1]
@@ -0,0 +1,52 @@
+import asyncio
+
+from telegram.ext import CallbackContext
+
+import fairness
+from conftest import add_searcher
+
+NEAR = (12.9716, 77.5946)
+
+
+def _trio(bot):
+    # A has waited longest; B's tick finds C, whom A could take as well
+    add_searcher(bot, '1', NEAR, start=-600)
+    add_searcher(bot, '2', (12.9718, 77.5948), start=0)
+    add_searcher(bot, '3', (12.9720, 77.5950), start=-10)
+    bot.users['1']['excluded'] = ['2']
+    bot.users['2']['excluded'] = ['1']
+
+
+def test_reassigned_cart_leaves_the_ticking_user_searching(bot, application):
+    _trio(bot)
+    job = bot.schedule_search(application.job_queue, '2', '2')
+
+    asyncio.run(bot.search_for_matches_callback(CallbackContext.from_job(job, application)))
+
+    assert bot.users['1']['matched_with'] == '3'
+    assert bot.users['2']['step'] == 'searching'
+    assert not job.removed
+    assert application.job_queue.get_jobs_by_name('search_2') == (job,)
+    assert bot.time_to_match.reassigned == 1
+
+
+def test_redirect_reports_no_match_for_the_caller(bot, context):
+    _trio(bot)
+
+    assert asyncio.run(bot.search_for_matches(context, '2')) is False
+    assert bot.users['3']['matched_with'] == '1'
+
+
+def test_oldest_claimant_is_not_limited_to_the_best_scored_carts(bot):
+    # 40 equally old near-identical searchers would crowd a score-ranked list;
+    # the oldest compatible one is still found
+    add_searcher(bot, '500', NEAR, start=0)
+    add_searcher(bot, '501', NEAR, start=-5)
+    for n in range(40):
+        add_searcher(bot, str(600 + n), (12.9716 + n * 1e-5, 77.5946), start=-1)
+    add_searcher(bot, '999', (12.9730, 77.5960), total=150.0, start=-900)
+
+    claimant = fairness.oldest_claimant(bot.carts['501'], '500', bot.carts, bot.cart_cells, bot.waiting,
+                                        bot.search_policy, 0, bot.users)
+
+    assert claimant == '999'
@@ -0,0 +1,43 @@
+import geocells
+
+BANGALORE = (12.9716, 77.5946)
+
+
+def test_nearby_cells_share_a_parent_and_decode_back():
+    cell = geocells.encode(*BANGALORE)
+    lat, lon = geocells.center(cell)
+    assert abs(lat - BANGALORE[0]) < geocells.LAT_STEP and abs(lon - BANGALORE[1]) < geocells.LON_STEP
+    assert geocells.encode(lat, lon) == cell
+    row, col = geocells.decode(cell)
+    assert geocells.parent(cell) == geocells.parent((row << geocells.LON_BITS) | (col ^ 1))
+
+
+def test_rings_cover_each_cell_once():
+    cell = geocells.encode(*BANGALORE)
+    row, col = geocells.decode(cell)
+    seen = set()
+    for k in range(4):
+        ring = geocells.ring(cell, k)
+        assert len(ring) == (1 if k == 0 else 8 * k)
+        assert all(max(abs(r - row), abs(c - col)) == k for r, c in map(geocells.decode, ring))
+        assert not seen & set(ring)
+        seen.update(ring)
+
+
+def test_index_yields_nearest_ring_first_and_stops_at_the_radius():
+    index = geocells.CellIndex()
+    here = geocells.encode(*BANGALORE)
+    index.add(here, 'here')
+    index.add(geocells.ring(here, 2)[0], 'two_rings_out')
+    index.add(geocells.encode(28.6139, 77.2090), 'delhi')
+
+    assert list(index.nearby(here, 1.5)) == [(0, 'here'), (2, 'two_rings_out')]
+    index.discard(here, 'here')
+    assert index.cell_count() == 2
+    assert list(index.nearby(here, 0.1)) == []
+
+
+def test_coarsen_keeps_about_a_hundred_metres():
+    lat, lon = geocells.coarsen(12.971649, 77.594612)
+    assert (lat, lon) == (12.972, 77.595)
+    assert geocells.haversine_km((12.971649, 77.594612), (lat, lon)) < 0.11
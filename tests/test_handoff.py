@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conftest import ROOT, add_searcher, make_update
+
+# Each instance is a separate interpreter sharing only STATE_DIR, as two deploys would
+INSTANCE = r'''
+import asyncio, json, sys, time
+from telegram.error import NetworkError
+from telegram.ext import Application, CallbackContext, ExtBot
+import bot
+from update_processor import PriorityUpdateProcessor
+
+
+class QuietBot(ExtBot):
+    async def send_message(self, chat_id, text, **kwargs):
+        if str(chat_id) == 'offline':
+            raise NetworkError('connection reset')
+        return type('Message', (), {'message_id': 1, 'chat_id': chat_id})()
+
+
+def searcher(user_id, location):
+    bot.users[user_id] = {'pseudonym': user_id, 'chat_id': user_id, 'app': 'Zepto', 'location': location,
+                          'cell': bot.geocells.encode(*location), 'cart_total': 200.0, 'min_for_free': 300.0,
+                          'items': [], 'search_start_time': 0}
+    bot.set_step(user_id, 'searching')
+    bot.add_cart(bot.build_cart(user_id))
+
+
+async def old_instance(application):
+    await bot.instance_lease.acquire(timeout=1)
+    searcher('a', (12.9716, 77.5946))
+    searcher('b', (12.9720, 77.5950))
+    searcher('c', (28.6139, 77.2090))
+    await bot.search_for_matches(CallbackContext(application), 'a')
+    bot.active_chats.update({'online': 'offline', 'offline': 'online'})
+    bot.chat_buffer.enqueue('offline', 'online', 'see you at the gate', time.time())
+    print('ready', flush=True)
+    sys.stdin.readline()
+    await bot.drain(application)
+
+
+async def new_instance(application):
+    handed_off = await bot.instance_lease.acquire(timeout=30, poll_interval=0.05)
+    bot.restore_state(application)
+    bot.chat_buffer.load(bot.CHAT_SPILL_PATH, time.time())
+    print(json.dumps({
+        'handed_off': handed_off,
+        'matched': {uid: bot.users[uid].get('matched_with') for uid in ('a', 'b')},
+        'chats': bot.active_chats,
+        'searching': sorted(bot.users_by_step.get('searching', {})),
+        'wheel': len(bot.search_wheel),
+        'buffered': bot.chat_buffer.pending('offline', 'online'),
+    }), flush=True)
+
+
+application = Application.builder().bot(QuietBot(bot.TOKEN)).concurrent_updates(PriorityUpdateProcessor()).build()
+application.bot_data['current_time'] = 0
+asyncio.run(old_instance(application) if sys.argv[1] == 'old' else new_instance(application))
+'''
+
+
+def _spawn(role, state_dir):
+    env = {**os.environ, 'STATE_DIR': state_dir, 'EVENTS_PATH': os.path.join(state_dir, 'events.ndjson'),
+           'PYTHONPATH': ROOT}
+    return subprocess.Popen([sys.executable, '-c', INSTANCE, role], cwd=state_dir, env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+def test_two_instances_hand_over_without_losing_matches_or_chats(tmp_path):
+    state_dir = str(tmp_path)
+    old = _spawn('old', state_dir)
+    assert old.stdout.readline().strip() == 'ready'
+    new = _spawn('new', state_dir)
+    try:
+        time.sleep(1.0)
+        # The new instance waits on the lease while the old one still holds it
+        assert new.poll() is None
+        assert not os.path.exists(os.path.join(state_dir, 'state.snapshot'))
+        old.stdin.write('drain\n')
+        old.stdin.flush()
+        assert old.wait(timeout=30) == 0
+        out, _ = new.communicate(timeout=30)
+    finally:
+        for process in (old, new):
+            if process.poll() is None:
+                process.kill()
+    assert new.returncode == 0
+    state = json.loads(out)
+    assert state['handed_off'] is True
+    assert state['matched'] == {'a': 'b', 'b': 'a'}
+    assert state['chats'] == {'online': 'offline', 'offline': 'online'}
+    assert state['searching'] == ['c'] and state['wheel'] == 1
+    assert state['buffered'] == 1
+
+
+def test_drain_snapshots_and_releases_before_stopping_polling(bot, application, monkeypatch):
+    order = []
+
+    class Updater:
+        running = True
+
+        async def stop(self):
+            order.append(('stop_polling', bot.instance_lease.holder()))
+            self.running = False
+
+    application.updater = Updater()
+    application.update_processor.pending = application.update_processor.active = 0
+    monkeypatch.setattr(bot, 'save_state', lambda app: order.append(('snapshot', bot.instance_lease.holder())))
+    asyncio.run(bot.instance_lease.acquire(timeout=1))
+    add_searcher(bot, '101', (12.9716, 77.5946))
+
+    asyncio.run(bot.drain(application))
+
+    assert [step for step, _ in order] == ['snapshot', 'stop_polling']
+    assert order[0][1] is not None  # lease still held while snapshotting
+    assert order[1][1] is None  # released before polling stops
+
+    # Anything that slips in after the snapshot is turned away, not silently dropped
+    update = make_update(application.bot, '101', text='hello')
+    try:
+        asyncio.run(bot.reject_while_draining(update, None))
+    except bot.ApplicationHandlerStop:
+        pass
+    else:
+        raise AssertionError('update accepted after the snapshot')
@@ -0,0 +1,25 @@
+from notifier import StatusWheel
+
+
+def test_each_searcher_comes_due_once_per_revolution():
+    wheel = StatusWheel(slots=3)
+    wheel.add('a')
+    wheel.advance()
+    wheel.add('b')
+
+    due = [wheel.advance() for _ in range(6)]
+
+    assert due == [(), ('a',), ('b',), (), ('a',), ('b',)]
+
+
+def test_unchanged_status_text_is_skipped_until_rescheduled():
+    wheel = StatusWheel(slots=2)
+    wheel.add('a')
+    assert wheel.changed('a', 'Searching within 1 km')
+    assert not wheel.changed('a', 'Searching within 1 km')
+    assert wheel.changed('a', 'Searching within 2 km')
+
+    wheel.discard('a')
+    assert 'a' not in wheel and len(wheel) == 0
+    assert all(not wheel.advance() for _ in range(2))
+    assert wheel.changed('a', 'Searching within 2 km')
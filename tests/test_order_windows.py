@@ -0,0 +1,47 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import tracing
+from conftest import make_update
+from order_windows import DEFAULT_WINDOW, parse_window
+
+UTC = timezone.utc
+NOON = datetime(2026, 3, 2, 12, 0, tzinfo=UTC).timestamp()
+
+
+def _hours(window):
+    return [datetime.fromtimestamp(t, UTC).strftime('%H:%M') for t in window]
+
+
+def test_bare_numbers_are_not_windows():
+    for text in ('5', '200', '17', '5-6', '5 to 6'):
+        assert parse_window(text, UTC, now=NOON) is None, text
+
+
+def test_explicit_times_are_windows():
+    assert _hours(parse_window('5pm', UTC, now=NOON)) == ['17:00', '17:45']
+    assert _hours(parse_window('17:00', UTC, now=NOON)) == ['17:00', '17:45']
+    assert _hours(parse_window('7-8 pm', UTC, now=NOON)) == ['19:00', '20:00']
+    assert _hours(parse_window('7:30-8:15 pm', UTC, now=NOON)) == ['19:30', '20:15']
+
+
+def test_relative_times():
+    assert parse_window('in 30 min', UTC, now=NOON) == (NOON + 1800, NOON + 1800 + DEFAULT_WINDOW)
+    assert parse_window('in 2 hours', UTC, now=NOON)[0] == NOON + 7200
+    assert parse_window('in 90 hours', UTC, now=NOON) is None
+
+
+def test_scheduled_orders_in_overlapping_windows_are_paired(bot, application, context):
+    opens = int(time.time()) + 3600
+    for n, user_id in enumerate(('101', '102')):
+        bot.users[user_id] = {'step': 'location', 'pseudonym': f'Shopper_{user_id}', 'app': 'Zepto',
+                              'cart_total': 200.0, 'min_for_free': 300.0, 'items': [],
+                              'window': (opens + n * 600, opens + n * 600 + DEFAULT_WINDOW)}
+        trace_id = tracing.new_trace()
+        update = make_update(application.bot, user_id, location=(12.9716, 77.5946 + n * 0.001), update_id=n + 1)
+        asyncio.run(bot.handle_location(update, context))
+
+    assert bot.users['101']['matched_with'] == '102'
+    (created,) = [row for row in tracing.export(trace_id=trace_id) if row['span'] == 'cart_created']
+    assert created['user'] == '102' and created['window'] == DEFAULT_WINDOW
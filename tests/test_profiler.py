@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from profiler import MAX_SECONDS, SamplingProfiler
+
+
+def test_profile_duration_is_validated(bot, application):
+    for arg in ('soon', '-5', '0', 'nan'):
+        result = asyncio.run(bot.admin_query(application, 'profile', arg))
+        assert 'error' in result, arg
+    assert not bot.profiler.running
+
+
+def test_duration_is_clamped_and_stop_ends_the_run(tmp_path):
+    profiler = SamplingProfiler(out_dir=str(tmp_path))
+
+    async def run():
+        assert profiler.start(10 * MAX_SECONDS) == MAX_SECONDS
+        await asyncio.sleep(0.05)
+        profiler.stop()
+        return await asyncio.wait_for(profiler.wait(), timeout=5)
+
+    report = asyncio.run(run())
+    assert not profiler.running
+    assert report['seconds'] < 5
+    with pytest.raises(ValueError):
+        profiler.start('x')
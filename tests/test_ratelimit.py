@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+import ratelimit
+from conftest import make_update
+
+
+def test_buckets_refill_and_stay_bounded():
+    now = [0.0]
+    buckets = ratelimit.TokenBuckets(capacity=3, refill_per_second=1, max_keys=2, clock=lambda: now[0])
+    assert [buckets.consume('a') for _ in range(4)] == [True, True, True, False]
+    now[0] += 1
+    assert buckets.consume('a') and not buckets.consume('a')
+    buckets.consume('b')
+    buckets.consume('c')
+    assert len(buckets) == 2 and buckets.throttled == 2
+
+
+def test_costs_follow_the_shared_classifier(application):
+    chatting = {'42'}
+    telegram_bot = application.bot
+    assert ratelimit.classify(make_update(telegram_bot, 42, text='/start'), chatting.__contains__) == 'start'
+    assert ratelimit.classify(make_update(telegram_bot, 42, text='hi'), chatting.__contains__) == 'relay'
+    assert ratelimit.classify(make_update(telegram_bot, 7, text='hi'), chatting.__contains__) == 'message'
+    assert ratelimit.classify(make_update(telegram_bot, 42, data='app_zepto')) == 'app_select'
+
+
+def exhaust(bot, user_id):
+    bot.rate_limiter = ratelimit.TokenBuckets(capacity=1, refill_per_second=0)
+    bot.rate_limiter.consume(user_id, 1)
+
+
+def test_throttled_button_press_is_answered(bot, application, context):
+    exhaust(bot, 42)
+    update = make_update(application.bot, 42, data='stop_search')
+    with pytest.raises(ApplicationHandlerStop):
+        asyncio.run(bot.throttle_updates(update, context))
+    assert application.bot.answers == [('1', bot.SLOW_DOWN_TEXT, True)]
+
+
+def test_throttled_relay_tells_the_sender_once(bot, application, context):
+    bot.active_chats.update({'42': '43', '43': '42'})
+    exhaust(bot, 42)
+    for n in range(3):
+        with pytest.raises(ApplicationHandlerStop):
+            asyncio.run(bot.throttle_updates(make_update(application.bot, 42, text=f'msg {n}', update_id=n), context))
+    assert [chat for chat, _ in application.bot.sent] == ['42']
+    assert not any(chat == '43' for chat, _ in application.bot.sent)
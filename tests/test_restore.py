@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import snapshot
+from conftest import add_searcher
+
+
+def test_restore_rearms_searches_on_the_wheel(bot, application):
+    for n in range(1000):
+        add_searcher(bot, f'u{n}', (12.97 + n * 1e-4, 77.59), start=-n)
+    snapshot.save(bot.SNAPSHOT_PATH, bot.users, bot.carts, bot.active_chats, clock=0)
+    bot.users.clear()
+    bot.carts.clear()
+
+    bot.restore_state(application)
+
+    assert len(bot.users) == len(bot.carts) == 1000
+    # No per-user scheduler jobs: every restored search shares the wheel's tick job
+    assert not application.job_queue.jobs()
+    assert len(bot.search_wheel) == 1000
+    per_slot = [len(bot.search_wheel.advance()) for _ in range(bot.search_wheel.slots)]
+    assert max(per_slot) - min(per_slot) <= 1
+    assert bot.waiting.peek()[1] == 'u999'
+
+
+def test_wheel_tick_searches_and_drops_matched_users(bot, application, context):
+    add_searcher(bot, 'a', (12.9716, 77.5946))
+    add_searcher(bot, 'b', (12.9720, 77.5950))
+    for user_id in ('a', 'b'):
+        bot.search_wheel.add(user_id, ticks=1)
+
+    asyncio.run(bot.advance_search_wheel(context))
+
+    assert bot.users['a']['matched_with'] == 'b'
+    assert len(bot.search_wheel) == 0
+
+
+def test_restore_100k_sessions_is_fast(bot, application):
+    for n in range(100_000):
+        user_id = str(n)
+        location = (12.9 + (n % 300) * 1e-3, 77.5 + (n // 300) * 1e-3)
+        bot.users[user_id] = {'pseudonym': f'Shopper_{n}', 'chat_id': user_id, 'app': 'Zepto',
+                              'location': location, 'cell': bot.geocells.encode(*location),
+                              'cart_total': 100.0, 'min_for_free': 300.0, 'search_start_time': -n,
+                              'step': 'searching', 'items': ['milk', f'item{n % 50}']}
+        bot.carts[user_id] = {'cart_id': f'cart_{n}', 'user_id': user_id, 'pseudonym': f'Shopper_{n}',
+                              'app': 'Zepto', 'location': location, 'cell': bot.geocells.encode(*location),
+                              'cart_total': 100.0, 'min_for_free': 300.0, 'items': ['milk', f'item{n % 50}']}
+    snapshot.save(bot.SNAPSHOT_PATH, bot.users, bot.carts, bot.active_chats, clock=0)
+    bot.users.clear()
+    bot.carts.clear()
+
+    start = time.perf_counter()
+    bot.restore_state(application)
+    elapsed = time.perf_counter() - start
+
+    assert len(bot.search_wheel) == 100_000
+    # Measured at 1.3-1.8 s on a single-core CI box; one scheduler job per search took 15 s
+    assert elapsed < 3.0, f"restore took {elapsed:.2f}s"
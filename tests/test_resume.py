@@ -0,0 +1,37 @@
+import asyncio
+
+import events
+from conftest import add_searcher, make_update
+
+
+def test_left_partner_resumes_with_the_same_cart_and_skips_the_leaver(bot, application, context):
+    add_searcher(bot, '101', (12.9716, 77.5946), total=180.0)
+    add_searcher(bot, '102', (12.9720, 77.5950))
+    add_searcher(bot, '103', (12.9760, 77.5990))
+    asyncio.run(bot.search_for_matches(context, '101'))
+    assert bot.users['101']['matched_with'] == '102'
+
+    asyncio.run(bot.button_callback(make_update(application.bot, '102', data='end_match'), context))
+
+    assert bot.users['101']['step'] == 'idle'
+    assert any(chat == '101' and 'resume with the same cart' in text for chat, text in application.bot.sent)
+
+    asyncio.run(bot.button_callback(make_update(application.bot, '101', data='resume_search', update_id=2), context))
+
+    assert bot.users['101']['matched_with'] == '103'
+    assert bot.users['103']['matched_with'] == '101'
+    assert bot.users['101']['cart_total'] == 180.0
+    stats = events.aggregate(bot.event_log._buffer)
+    assert sum(row['resumed'] for row in stats.values()) == 1
+
+
+def test_the_user_who_left_cannot_resume(bot, application, context):
+    add_searcher(bot, '101', (12.9716, 77.5946))
+    add_searcher(bot, '102', (12.9720, 77.5950))
+    asyncio.run(bot.search_for_matches(context, '101'))
+    asyncio.run(bot.button_callback(make_update(application.bot, '102', data='end_match'), context))
+
+    asyncio.run(bot.button_callback(make_update(application.bot, '102', data='resume_search', update_id=2), context))
+
+    assert bot.users['102']['step'] == 'idle'
+    assert application.bot.edited[-1][2].startswith('This search can no longer be resumed')
@@ -0,0 +1,52 @@
+import math
+
+import geocells
+import road_graph
+
+SOUTH, NORTH = 12.970, 12.980  # two banks of a river, bridged only at the east end
+LONS = [77.590 + i * 0.002 for i in range(21)]
+
+
+def _river_graph(path):
+    nodes, edges = [], []
+    for lat in (SOUTH, NORTH):
+        start = len(nodes)
+        nodes.extend((lat, lon) for lon in LONS)
+        for i in range(len(LONS) - 1):
+            metres = geocells.haversine_km(nodes[start + i], nodes[start + i + 1]) * 1000
+            edges.append((start + i, start + i + 1, metres))
+    bridge = (len(LONS) - 1, 2 * len(LONS) - 1)
+    edges.append((*bridge, geocells.haversine_km(nodes[bridge[0]], nodes[bridge[1]]) * 1000))
+    road_graph.build(nodes, edges, str(path), landmarks=2)
+    return road_graph.RoadGraph.load(str(path))
+
+
+def _cart(location):
+    return {'location': location, 'cell': geocells.encode(*location)}
+
+
+def test_cell_index_is_read_from_the_file(tmp_path):
+    graph = _river_graph(tmp_path / 'river.graph')
+
+    assert graph._grid is None and len(graph.cell_keys) > 0
+    node = graph.nearest_node((SOUTH + 0.0002, LONS[5] + 0.0002))
+    assert (round(graph.lat[node], 3), round(graph.lon[node], 3)) == (SOUTH, round(LONS[5], 3))
+    assert graph.nearest_node((13.5, 78.5)) is None
+    assert graph._grid is None
+
+
+def test_detour_follows_the_carts_own_locations(tmp_path):
+    distance = road_graph.RoadDistance(_river_graph(tmp_path / 'river.graph'))
+
+    def road_km(lon):
+        south, north = _cart((SOUTH + 0.0002, lon)), _cart((NORTH - 0.0002, lon))
+        straight = geocells.haversine_km(south['location'], north['location'])
+        return straight, distance(south, north, straight)
+
+    straight, near_bridge = road_km(LONS[-1])
+    assert near_bridge < straight * 1.2
+    straight, far_from_bridge = road_km(LONS[0])
+    assert far_from_bridge == math.inf or far_from_bridge > straight * 3
+    # Two blocks west of the bridge: the short walk to it and back
+    straight, one_block_west = road_km(LONS[-3])
+    assert straight * 1.2 < one_block_west < straight * 2
@@ -0,0 +1,94 @@
+import pytest
+
+import fingerprint
+import geocells
+import search_policy
+
+HERE = (12.9716, 77.5946)
+
+
+def _cart(user_id, location, total=200.0, minimum=300.0, app='Zepto'):
+    return {'user_id': user_id, 'app': app, 'location': location, 'cell': geocells.encode(*location),
+            'cart_total': total, 'min_for_free': minimum}
+
+
+def test_schedule_widens_the_radius_and_tolerance_with_age():
+    policy = search_policy.SearchPolicy(search_policy.parse_schedule('600:5:0.1, 0:1, 120:2'))
+    assert policy.step(0) == (1.0, 0.0)
+    assert policy.step(119) == (1.0, 0.0)
+    assert policy.step(120) == (2.0, 0.0)
+    assert policy.step(3600) == (5.0, 0.1)
+    assert policy.max_radius_km == 5.0
+
+
+@pytest.mark.parametrize('spec', ['', '0', '0:1:0:5'])
+def test_malformed_schedules_are_rejected(spec):
+    with pytest.raises(ValueError):
+        search_policy.parse_schedule(spec)
+
+
+def test_find_match_only_reaches_carts_inside_the_current_radius():
+    me = _cart('me', HERE)
+    # ~3 km north of the searcher
+    far = _cart('far', (HERE[0] + 0.027, HERE[1]))
+    carts = {'far': far}
+    index = geocells.CellIndex()
+    index.add(far['cell'], 'far')
+
+    assert search_policy.find_match(me, carts, index, 1.0) is None
+    cart, ring, distance_km = search_policy.find_match(me, carts, index, 3.5)
+    assert cart is far and 2.9 < distance_km < 3.1
+
+
+def test_tolerance_lets_a_combined_cart_fall_short_of_the_threshold():
+    me = _cart('me', HERE, total=130.0)
+    short = _cart('short', (12.9720, 77.5950), total=140.0)
+    assert search_policy.is_compatible(me, short) == 'total'
+    assert search_policy.is_compatible(me, short, tolerance=0.1) is None
+    assert search_policy.is_compatible(me, _cart('blinkit', HERE, app='Blinkit')) == 'app'
+
+
+ITEMS = ['milk', 'bread', 'eggs']
+
+
+def _pool(locations):
+    carts, index, lsh = {}, geocells.CellIndex(), fingerprint.LSHIndex()
+    signature = fingerprint.minhash(ITEMS)
+    for user_id, location in locations.items():
+        carts[user_id] = {**_cart(user_id, location), 'store_id': 'store-1', 'fingerprint': signature}
+        index.add(carts[user_id]['cell'], user_id)
+        lsh.add(user_id, signature, 'store-1')
+    searcher = {**_cart('me', HERE), 'store_id': 'store-1', 'fingerprint': signature}
+    return searcher, carts, index, lsh
+
+
+def _count_checks(monkeypatch):
+    checked = []
+    is_compatible = search_policy.is_compatible
+
+    def counting(searcher, cart, tolerance=0.0):
+        checked.append(cart['user_id'])
+        return is_compatible(searcher, cart, tolerance)
+    monkeypatch.setattr(search_policy, 'is_compatible', counting)
+    return checked
+
+
+def test_lsh_candidates_outside_the_radius_are_never_checked(monkeypatch):
+    # The whole city shares the searcher's store bucket; only one cart is nearby
+    locations = {f'far{n}': (28.6 + n * 0.001, 77.2) for n in range(200)}
+    locations['near'] = (12.9720, 77.5950)
+    searcher, carts, index, lsh = _pool(locations)
+    checked = _count_checks(monkeypatch)
+
+    best = search_policy.find_best_match(searcher, carts, index, 1.0, lsh=lsh)
+
+    assert best[0]['user_id'] == 'near'
+    assert checked == ['near']
+
+
+def test_lsh_candidates_count_against_max_scored(monkeypatch):
+    searcher, carts, index, lsh = _pool({f'c{n}': (12.9716 + n * 0.0001, 77.5946) for n in range(40)})
+    checked = _count_checks(monkeypatch)
+
+    assert search_policy.find_best_match(searcher, carts, index, 1.0, lsh=lsh, max_scored=5) is not None
+    assert len(checked) == 5
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import fingerprint
+import geocells
+from conftest import ROOT
+from search_policy import find_best_match
+from shared_pool import MatcherPool, SharedCartColumns
+
+BANGALORE = (12.9716, 77.5946)
+DELHI = (28.6139, 77.2090)
+
+
+def _cart(user_id, location, total=200.0, minimum=300.0, app='Zepto', items=None):
+    return {'user_id': user_id, 'app': app, 'location': location, 'cell': geocells.encode(*location),
+            'cart_total': total, 'min_for_free': minimum,
+            'fingerprint': fingerprint.minhash(items) if items else None}
+
+
+class CountingColumns(SharedCartColumns):
+    reads = 0
+
+    def read(self, slot):
+        self.reads += 1
+        return super().read(slot)
+
+
+def test_candidates_read_only_nearby_cells():
+    columns = CountingColumns.create(capacity=2000)
+    try:
+        for slot in range(1500):
+            columns.alloc()
+            location = DELHI if slot >= 10 else (BANGALORE[0] + slot * 1e-4, BANGALORE[1])
+            columns.write(slot, geocells.encode(*location), *location, 0, 200.0, 300.0)
+        # A cart moving away and a freed slot drop out of the scan
+        columns.write(1, geocells.encode(*DELHI), *DELHI, 0, 200.0, 300.0)
+        columns.free(2)
+
+        columns.reads = 0
+        found = columns.candidates(0, radius_km=2.0)
+
+        assert sorted(slot for _, slot, _ in found) == [3, 4, 5, 6, 7, 8, 9]
+        assert columns.reads < 20  # the 1490 carts in Delhi are never read
+    finally:
+        columns.close()
+
+
+def test_matcher_pool_workers_find_nearby_carts():
+    pool = MatcherPool(capacity=100, workers=1)
+    try:
+        for n, location in enumerate([BANGALORE, (12.9720, 77.5950), (12.9725, 77.5955), DELHI]):
+            pool.put(_cart(str(n), location))
+        pool.remove('2')
+
+        found = asyncio.run(pool.candidates('0', radius_km=2.0))
+
+        assert found == ['1']
+        assert asyncio.run(pool.candidates('unknown', radius_km=2.0)) is None
+    finally:
+        pool.close()
+
+
+def test_worker_candidates_are_merged_with_lsh():
+    items = ['milk', 'bread', 'eggs', 'butter']
+    carts = {'me': _cart('me', BANGALORE, items=items), 'near': _cart('near', (12.9720, 77.5950)),
+             'twin': _cart('twin', (12.9800, 77.6000), items=items)}
+    cells, lsh = geocells.CellIndex(), fingerprint.LSHIndex()
+    for cart in carts.values():
+        cells.add(cart['cell'], cart['user_id'])
+        lsh.add(cart['user_id'], cart['fingerprint'])
+    ranked = []
+
+    find_best_match(carts['me'], carts, cells, 2.0, lsh=lsh, nearest=['near'], ranked=ranked)
+
+    assert set(ranked) == {'near', 'twin'}
+
+
+def test_importing_bot_as_worker_main_has_no_side_effects(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key != 'TELEGRAM_BOT_TOKEN'}
+    env.update(PYTHONPATH=ROOT, ROAD_GRAPH_PATH=str(tmp_path / 'missing.graph'), STATE_DIR=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, '-c', f"import runpy; runpy.run_path({os.path.join(ROOT, 'bot.py')!r}, run_name='__mp_main__')"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert not (tmp_path / 'bot.log').exists()
+    assert 'Road graph' not in result.stderr
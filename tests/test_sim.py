@@ -0,0 +1,37 @@
+import pytest
+
+from search_policy import SearchPolicy
+from sim import POLICIES, Policy, Simulation, load_policy, synthetic
+
+
+def _arrival(t, location, total=200.0):
+    return {'t': t, 'app': 'Zepto', 'location': location, 'cart_total': total, 'min_for_free': 300.0}
+
+
+def test_virtual_clock_pairs_carts_on_the_first_tick():
+    arrivals = [_arrival(0, (12.9716, 77.5946)), _arrival(58, (12.9720, 77.5950)),
+                _arrival(120, (28.6139, 77.2090))]
+
+    report = Simulation(load_policy('nearest'), arrivals, first=5, timeout=600).run()
+
+    assert (report['arrivals'], report['matched'], report['expired']) == (3, 2, 1)
+    # The second cart pairs on its first tick at t=63, so the first one waited 63 virtual seconds
+    assert report['p90_wait_s'] == 63
+    assert report['simulated_h'] < 1
+
+
+def test_every_policy_accounts_for_every_arrival():
+    arrivals = list(synthetic(hours=2, rate_per_min=2, seed=1))
+    for name in POLICIES:
+        report = Simulation(load_policy(name, SearchPolicy()), arrivals).run()
+        assert report['arrivals'] == len(arrivals)
+        assert report['matched'] + report['expired'] <= report['arrivals']
+        assert report['matched'] % 2 == 0
+
+
+def test_policy_without_match_fails_when_created():
+    class Unfinished(Policy):
+        name = 'unfinished'
+
+    with pytest.raises(TypeError):
+        Unfinished(SearchPolicy())
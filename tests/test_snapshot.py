@@ -0,0 +1,45 @@
+import pytest
+
+import fingerprint
+import snapshot
+from conftest import add_searcher
+
+
+def test_round_trip_keeps_carts_and_fingerprints(bot):
+    add_searcher(bot, 'a', (12.9716, 77.5946), items=['milk', 'bread'])
+    add_searcher(bot, 'b', (12.9720, 77.5950))
+    bot.active_chats.update({'a': 'b', 'b': 'a'})
+
+    users, carts, chats, clock = snapshot.decode(snapshot.encode(bot.users, bot.carts, bot.active_chats, clock=42))
+
+    assert clock == 42
+    assert chats == {'a': 'b', 'b': 'a'}
+    assert users == bot.users
+    assert carts['a']['fingerprint'] == fingerprint.minhash(['milk', 'bread'])
+    assert carts['b']['fingerprint'] is None
+    assert carts['a']['items'] == ['milk', 'bread']
+    assert carts['a']['location'] == bot.carts['a']['location']
+
+
+def test_restore_indexes_stored_fingerprints_without_rehashing(bot, application, monkeypatch):
+    add_searcher(bot, 'a', (12.9716, 77.5946), items=['milk', 'bread'])
+    add_searcher(bot, 'b', (12.9720, 77.5950), items=['milk', 'bread'])
+    signature = bot.carts['a']['fingerprint']
+    snapshot.save(bot.SNAPSHOT_PATH, bot.users, bot.carts, bot.active_chats)
+    bot.carts.clear()
+    bot.cart_buckets = fingerprint.LSHIndex()
+
+    def fail(items):
+        raise AssertionError("fingerprint recomputed on restore")
+    monkeypatch.setattr(bot.fingerprint, 'minhash', fail)
+    bot.restore_state(application)
+
+    assert bot.cart_buckets.candidates(signature) == {'a', 'b'}
+
+
+def test_rejects_other_versions_and_truncation(bot):
+    data = snapshot.encode({}, {}, {})
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.decode(data[:4] + b'\x00\x00' + data[6:])
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.decode(data[:10])
@@ -0,0 +1,36 @@
+import asyncio
+from collections import deque
+
+import tracing
+from conftest import make_update
+
+
+def _get(bot, monkeypatch, **query):
+    monkeypatch.setattr(bot, 'OPS_TOKEN', 'secret')
+    return bot.traces_endpoint({'query': query, 'headers': {'x-ops-token': 'secret'}})
+
+
+def test_traces_limit_is_validated_and_capped(bot, monkeypatch):
+    monkeypatch.setattr(tracing, 'spans', deque(maxlen=10))
+    for n in range(10):
+        with tracing.span('update', user=n):
+            pass
+
+    assert _get(bot, monkeypatch, limit='lots') == (400, 'limit must be an integer')
+    assert len(_get(bot, monkeypatch, limit='1000000')[1]['spans']) == 10
+    assert len(_get(bot, monkeypatch, limit='0')[1]['spans']) == 1
+    assert len(_get(bot, monkeypatch, limit='3')[1]['spans']) == 3
+
+
+def test_location_share_traces_the_step_change_and_the_new_cart(bot, application, context):
+    bot.users['101'] = {'step': 'location', 'pseudonym': 'Shopper_101', 'app': 'Zepto',
+                        'cart_total': 200.0, 'min_for_free': 300.0, 'items': []}
+    trace_id = tracing.new_trace()
+
+    asyncio.run(bot.handle_location(make_update(application.bot, '101', location=(12.9716, 77.5946)), context))
+
+    rows = tracing.export(trace_id=trace_id)
+    assert [row['step'] for row in rows if row['span'] == 'step'] == ['searching']
+    (created,) = [row for row in rows if row['span'] == 'cart_created']
+    assert created['user'] == '101' and created['total'] == 200.0
+    assert [event['e'] for event in bot.event_log._buffer] == ['cart_created']
@@ -0,0 +1,84 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+import speedups
+import transport
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Stand in for the HTTP layer: each call takes 50 ms and records its read timeout."""
+    calls = []
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, **kwargs):
+        calls.append((url.rsplit('/', 1)[-1], read_timeout))
+        await asyncio.sleep(0.05)
+        return 200, b'{"ok": true, "result": true}'
+    monkeypatch.setattr(HTTPXRequest, 'do_request', do_request)
+    return calls
+
+
+def test_long_polling_gets_its_own_untraced_pool(monkeypatch):
+    monkeypatch.setenv('BOT_POOL_SIZE', '32')
+    outbound, get_updates = transport.build_requests()
+    assert (outbound.pool_size, outbound.traced) == (32, True)
+    assert (get_updates.pool_size, get_updates.traced) == (2, False)
+    assert get_updates.endpoint_timeouts == {}
+
+
+def test_calls_wait_for_a_pool_slot_and_record_the_wait(calls):
+    request = transport.TracedRequest(connection_pool_size=1, pool_timeout=1.0)
+
+    async def send_two():
+        url = 'https://api.telegram.org/bot1:x/sendMessage'
+        await asyncio.gather(request.do_request(url, 'POST'), request.do_request(url, 'POST'))
+    asyncio.run(send_two())
+
+    waits = sorted(request.pool_waits)
+    assert waits[0] < 25 <= waits[1]
+    assert request.in_flight == 0
+    assert calls == [('sendMessage', 8.0), ('sendMessage', 8.0)]
+
+
+def test_calls_that_cannot_get_a_slot_time_out(calls):
+    request = transport.TracedRequest(connection_pool_size=1, pool_timeout=0.01)
+
+    async def send_two():
+        url = 'https://api.telegram.org/bot1:x/answerCallbackQuery'
+        return await asyncio.gather(request.do_request(url, 'POST'), request.do_request(url, 'POST'),
+                                    return_exceptions=True)
+    results = asyncio.run(send_two())
+
+    assert results[0] == (200, b'{"ok": true, "result": true}')
+    assert isinstance(results[1], TimedOut)
+    assert calls == [('answerCallbackQuery', 3.0)]
+
+
+def test_fast_runtime_encodes_requests_and_decodes_responses_with_the_fast_codec(monkeypatch):
+    if speedups.orjson is None:
+        pytest.skip('orjson is not installed')
+    monkeypatch.setattr(speedups, 'ENABLED', True)
+    decoded = []
+    monkeypatch.setattr(speedups, 'loads', lambda payload: decoded.append(payload) or speedups.orjson.loads(payload))
+    posted = []
+
+    def telegram_api(request):
+        posted.append({key: values[0] for key, values in parse_qs(request.content.decode()).items()})
+        result = {'message_id': 7, 'date': 1700000000, 'chat': {'id': 42, 'type': 'private'}, 'text': 'hi'}
+        return httpx.Response(200, json={'ok': True, 'result': result})
+
+    request = transport.TracedRequest(httpx_kwargs={'transport': httpx.MockTransport(telegram_api)})
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton('🛑 Stop', callback_data='stop_search')]])
+    message = asyncio.run(Bot('123456:TEST', request=request).send_message(42, 'hi', reply_markup=markup))
+
+    assert message.message_id == 7 and len(decoded) == 1
+    assert posted[0]['chat_id'] == '42' and posted[0]['text'] == 'hi'
+    # Compact separators: encoded by speedups, not by PTB's json.dumps
+    assert posted[0]['reply_markup'] == speedups.orjson.dumps(markup.to_dict()).decode()
+    assert posted[0]['reply_markup'].startswith('{"inline_keyboard":[[')
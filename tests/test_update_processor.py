@@ -0,0 +1,57 @@
+import asyncio
+
+from conftest import RecordingBot, make_update
+from update_processor import BUSY_TEXT, PriorityUpdateProcessor
+
+
+async def _run(processor, updates):
+    """Feed (update, name) pairs to `processor` while the first one holds its slot."""
+    order, gate = [], asyncio.Event()
+
+    async def handler(name, wait=False):
+        if wait:
+            await gate.wait()
+        order.append(name)
+
+    tasks = []
+    for n, (update, name) in enumerate(updates):
+        tasks.append(asyncio.create_task(processor.do_process_update(update, handler(name, wait=n == 0))))
+        await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_free_slots_go_to_the_most_urgent_update():
+    telegram_bot = RecordingBot('123456:TEST')
+    order = asyncio.run(_run(PriorityUpdateProcessor(workers=1), [
+        (make_update(telegram_bot, '1', text='slow', update_id=1), 'busy'),
+        (make_update(telegram_bot, '2', text='/start', update_id=2), 'start'),
+        (make_update(telegram_bot, '3', text='10', update_id=3), 'amount'),
+        (make_update(telegram_bot, '4', data='start_chat', update_id=4), 'button'),
+    ]))
+    assert order == ['busy', 'button', 'amount', 'start']
+
+
+def test_one_user_is_served_in_arrival_order():
+    telegram_bot = RecordingBot('123456:TEST')
+    order = asyncio.run(_run(PriorityUpdateProcessor(workers=4), [
+        (make_update(telegram_bot, '1', text='/start', update_id=1), 'start'),
+        (make_update(telegram_bot, '1', data='app_zepto', update_id=2), 'app'),
+        (make_update(telegram_bot, '2', text='hello', update_id=3), 'other user'),
+    ]))
+    assert order == ['other user', 'start', 'app']
+
+
+def test_new_sessions_are_shed_with_a_busy_reply_when_the_queue_is_full():
+    telegram_bot = RecordingBot('123456:TEST')
+    processor = PriorityUpdateProcessor(workers=1, max_pending=1)
+    order = asyncio.run(_run(processor, [
+        (make_update(telegram_bot, '1', text='slow', update_id=1), 'busy'),
+        (make_update(telegram_bot, '2', text='/start', update_id=2), 'queued'),
+        (make_update(telegram_bot, '3', text='/start', update_id=3), 'shed'),
+        (make_update(telegram_bot, '4', data='start_chat', update_id=4), 'button'),
+    ]))
+    assert order == ['busy', 'button', 'queued']
+    assert processor.shed_count == 1
+    assert telegram_bot.sent == [('3', BUSY_TEXT)]
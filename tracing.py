@@ -0,0 +1,92 @@
+"""Lightweight span tracing for the conversation funnel.
+
+A trace ID is started for each incoming update and carried in a
+contextvar through everything that update awaits. Search job ticks
+resume the trace that started the search, so one ID links the location
+share, every matcher pass and the final match or expiry.
+
+Spans are plain tuples appended to a fixed-size ring buffer, and skip
+reasons are kept as global counters, so tracing is cheap enough to leave
+on. The buffer is exported on demand (the /trace admin command and the
+/traces HTTP endpoint).
+"""
+import contextvars
+import itertools
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar('trace_id', default=None)
+_ids = itertools.count(1)
+_prefix = f"{os.getpid():x}"
+
+# (trace_id, name, start wall time, duration ms, attrs)
+spans = deque(maxlen=int(os.getenv('TRACE_BUFFER', '5000')))
+counters = Counter()
+
+
+def new_trace():
+    """Start a new trace in the current context and return its ID."""
+    trace_id = f"{_prefix}-{next(_ids):x}"
+    _current_trace.set(trace_id)
+    return trace_id
+
+
+def resume(trace_id):
+    """Continue an existing trace (e.g. from a job) in the current context."""
+    _current_trace.set(trace_id)
+
+
+def current():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Record the duration of a block as a span of the current trace."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs['error'] = type(e).__name__
+        raise
+    finally:
+        spans.append((_current_trace.get(), name, time.time(), (time.perf_counter() - start) * 1000, attrs))
+
+
+def event(name, **attrs):
+    """Record a zero-duration span."""
+    spans.append((_current_trace.get(), name, time.time(), 0.0, attrs))
+
+
+def count(key, n=1):
+    counters[key] += n
+
+
+def export(trace_id=None, user_id=None, limit=200):
+    """Return recent spans as dicts, optionally for one trace or user.
+
+    Filtering by user returns every span of any trace that touched them.
+    """
+    selected = list(spans)
+    if user_id is not None:
+        user_id = str(user_id)
+        traces = {s[0] for s in selected if str(s[4].get('user')) == user_id}
+        selected = [s for s in selected if s[0] in traces]
+    if trace_id is not None:
+        selected = [s for s in selected if s[0] == trace_id]
+    return [
+        {'trace': t, 'span': name, 'at': at, 'ms': round(ms, 2), **attrs}
+        for t, name, at, ms, attrs in selected[-limit:]
+    ]
+
+
+def format_spans(rows):
+    """Render exported spans as compact text lines."""
+    lines = []
+    for row in rows:
+        attrs = ' '.join(f"{k}={v}" for k, v in row.items() if k not in ('trace', 'span', 'at', 'ms'))
+        stamp = time.strftime('%H:%M:%S', time.gmtime(row['at']))
+        lines.append(f"{stamp} {row['trace']} {row['span']} {row['ms']}ms {attrs}".rstrip())
+    return '\n'.join(lines)
@@ -0,0 +1,176 @@
+"""Bot API transport.
+
+TracedRequest is the HTTPXRequest used for Bot API calls. Each call is
+recorded as a 'send' span on the current trace with its endpoint and
+HTTP status, and 429 responses are counted.
+
+Long polling and outbound calls get separate TracedRequest instances
+(see build_requests), so a getUpdates call parked for its poll timeout
+never holds a connection a send_message needs. Each instance gates calls
+on a semaphore sized like its connection pool; the time spent waiting
+for a slot is the pool wait, kept for percentiles and added to the span.
+Calls that don't pass their own timeouts get per-endpoint defaults, so
+answerCallbackQuery gives up sooner than sendMessage. When the fast
+runtime is on (see speedups), request parameters such as reply_markup
+are encoded and responses decoded with orjson.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+import speedups
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Per-endpoint read timeouts (seconds) used when the caller doesn't set one
+ENDPOINT_TIMEOUTS = {
+    'answerCallbackQuery': 3.0,
+    'editMessageText': 5.0,
+    'editMessageReplyMarkup': 5.0,
+    'sendMessage': 8.0,
+    'deleteWebhook': 10.0,
+}
+
+
+def http2_available():
+    return importlib.util.find_spec('h2') is not None
+
+
+class FastRequestData:
+    """A RequestData whose non-string parameters are JSON-encoded with speedups.dumps.
+
+    HTTPXRequest only reads json_parameters and multipart_data, and
+    parameters() already holds the JSON-ready values PTB would encode.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, request_data):
+        self._data = request_data
+
+    @property
+    def multipart_data(self):
+        return self._data.multipart_data
+
+    @property
+    def json_parameters(self):
+        return {name: value if isinstance(value, str) else speedups.dumps(value)
+                for name, value in self._data.parameters.items()}
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest that records every call as a tracing span and measures pool waits."""
+
+    def __init__(self, connection_pool_size=256, pool_timeout=1.0, endpoint_timeouts=None,
+                 keepalive_expiry=None, traced=True, **kwargs):
+        if keepalive_expiry is not None:
+            kwargs['httpx_kwargs'] = {
+                'limits': httpx.Limits(max_connections=connection_pool_size,
+                                       max_keepalive_connections=connection_pool_size,
+                                       keepalive_expiry=keepalive_expiry),
+                **(kwargs.get('httpx_kwargs') or {}),
+            }
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.pool_size = connection_pool_size
+        self.pool_timeout = pool_timeout
+        self.endpoint_timeouts = ENDPOINT_TIMEOUTS if endpoint_timeouts is None else endpoint_timeouts
+        self.traced = traced
+        self.in_flight = 0
+        self.pool_waits = deque(maxlen=4096)  # ms spent waiting for a connection slot
+        self._slots = asyncio.Semaphore(connection_pool_size)
+
+    @staticmethod
+    def parse_json_payload(payload):
+        """Decode a Bot API response, with orjson under FAST_RUNTIME."""
+        if speedups.fast_json_enabled():
+            try:
+                return speedups.loads(payload)
+            except ValueError:
+                pass  # let the stock parser handle (or report) odd payloads
+        return HTTPXRequest.parse_json_payload(payload)
+
+    def pool_wait_percentile(self, percentile):
+        """Pool wait (ms) at `percentile` over recent calls, or None."""
+        if not self.pool_waits:
+            return None
+        ordered = sorted(self.pool_waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    async def do_request(self, url, method, request_data=None, read_timeout=HTTPXRequest.DEFAULT_NONE,
+                         write_timeout=HTTPXRequest.DEFAULT_NONE, connect_timeout=HTTPXRequest.DEFAULT_NONE,
+                         pool_timeout=HTTPXRequest.DEFAULT_NONE):
+        endpoint = url.rsplit('/', 1)[-1]
+        if read_timeout is self.DEFAULT_NONE and endpoint in self.endpoint_timeouts:
+            read_timeout = self.endpoint_timeouts[endpoint]
+        wait_limit = self.pool_timeout if pool_timeout is self.DEFAULT_NONE else pool_timeout
+
+        with tracing.span('send', endpoint=endpoint) if self.traced else nullcontext({}) as attrs:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), wait_limit)
+            except asyncio.TimeoutError:
+                tracing.count('send_pool_timeout')
+                raise TimedOut(f"Pool timeout: all {self.pool_size} connections are busy") from None
+            waited = (time.perf_counter() - start) * 1000
+            self.pool_waits.append(waited)
+            attrs['pool_wait_ms'] = round(waited, 2)
+            self.in_flight += 1
+            if request_data is not None and not request_data.contains_files and speedups.fast_json_enabled():
+                request_data = FastRequestData(request_data)
+            try:
+                code, payload = await super().do_request(
+                    url, method, request_data=request_data, read_timeout=read_timeout,
+                    write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+                )
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+            attrs['status'] = code
+            if code == 429:
+                tracing.count('send_429')
+            return code, payload
+
+
+def build_requests():
+    """Return (outbound, get_updates) request objects configured from the environment.
+
+    BOT_POOL_SIZE sizes the outbound pool, BOT_POOL_TIMEOUT bounds how long
+    a call may wait for a slot, BOT_KEEPALIVE keeps idle connections open
+    between bursts and BOT_HTTP2=1 switches to HTTP/2 when h2 is installed.
+    """
+    http_version = '1.1'
+    if os.getenv('BOT_HTTP2') == '1':
+        if http2_available():
+            http_version = '2'
+        else:
+            logger.warning("BOT_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+    keepalive = float(os.getenv('BOT_KEEPALIVE', '60'))
+    outbound = TracedRequest(
+        connection_pool_size=int(os.getenv('BOT_POOL_SIZE', '128')),
+        pool_timeout=float(os.getenv('BOT_POOL_TIMEOUT', '5')),
+        read_timeout=8.0,
+        write_timeout=8.0,
+        connect_timeout=5.0,
+        keepalive_expiry=keepalive,
+        http_version=http_version,
+    )
+    # Not traced: a span per long poll would crowd real sends out of the buffer.
+    # One getUpdates call is in flight at a time; the second slot covers the overlap on restart
+    get_updates = TracedRequest(
+        connection_pool_size=2,
+        pool_timeout=5.0,
+        endpoint_timeouts={},
+        traced=False,
+        keepalive_expiry=keepalive,
+        http_version=http_version,
+    )
+    return outbound, get_updates
@@ -0,0 +1,212 @@
+"""Bounded, priority-aware update processing.
+
+Replaces `concurrent_updates(True)`, which lets any number of handler
+coroutines run at once. Updates run on a fixed number of worker slots,
+one at a time per user and in arrival order, with free slots handed to
+the most urgent waiting update first:
+
+* HIGH   - callback queries and messages relayed in an active chat
+* NORMAL - everything else (cart amounts, /end, /help, ...)
+* LOW    - new sessions: /start and shared locations
+
+When too many updates are waiting, new LOW (and eventually NORMAL)
+updates are shed with a short "busy" reply instead of queueing forever.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+BUSY_TEXT = "⏳ The bot is busy right now. Please try again in a few seconds."
+
+
+def classify_action(update, is_chatting=None):
+    """Name what an update does: start, location, app_select, callback, relay or message.
+
+    Shared by the worker pool (for priority) and the rate limiter (for cost).
+    """
+    if not isinstance(update, Update):
+        return 'message'
+    query = update.callback_query
+    if query:
+        return 'app_select' if (query.data or '').startswith('app_') else 'callback'
+    message = update.message
+    if message is None:
+        return 'message'
+    if message.location:
+        return 'location'
+    text = message.text or ''
+    if text.startswith('/start'):
+        return 'start'
+    user = update.effective_user
+    if user and is_chatting and not text.startswith('/') and is_chatting(str(user.id)):
+        return 'relay'
+    return 'message'
+
+
+ACTION_PRIORITIES = {
+    'callback': PRIORITY_HIGH,
+    'app_select': PRIORITY_HIGH,
+    'relay': PRIORITY_HIGH,
+    'message': PRIORITY_NORMAL,
+    'location': PRIORITY_LOW,
+    'start': PRIORITY_LOW,
+}
+
+
+def classify(update, is_chatting=None):
+    """Return the priority class of an update."""
+    return ACTION_PRIORITIES[classify_action(update, is_chatting)]
+
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates on `workers` slots with per-user ordering and load shedding."""
+
+    # Admission into do_process_update is left effectively unbounded so
+    # that shedding decisions are made here rather than by the semaphore.
+    ADMISSION_LIMIT = 1 << 20
+
+    def __init__(self, workers=16, max_pending=256, is_chatting=None):
+        super().__init__(max_concurrent_updates=self.ADMISSION_LIMIT)
+        if workers < 1:
+            raise ValueError("`workers` must be a positive integer!")
+        self.workers = workers
+        self.max_pending = max_pending
+        self._is_chatting = is_chatting
+        self._active = 0
+        self._pending = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._user_locks = {}  # {user_id: [asyncio.Lock, refcount]}
+        self.shed_count = 0
+        self.latencies = deque(maxlen=4096)  # recent handler durations in ms
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def active(self):
+        return self._active
+
+    def latency_percentile(self, percentile):
+        """Handler latency (ms) at `percentile` over recent updates, or None."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    def _should_shed(self, priority):
+        if priority == PRIORITY_LOW:
+            return self._pending >= self.max_pending
+        if priority == PRIORITY_NORMAL:
+            return self._pending >= 2 * self.max_pending
+        return False
+
+    async def _shed(self, update, coroutine):
+        coroutine.close()
+        self.shed_count += 1
+        logger.warning(f"Shedding update {getattr(update, 'update_id', '?')}: {self._pending} updates pending")
+        try:
+            if isinstance(update, Update) and update.effective_message:
+                await update.effective_message.reply_text(BUSY_TEXT)
+        except Exception as e:
+            logger.error(f"Error sending busy reply: {e}")
+
+    async def _acquire_slot(self, priority):
+        if self._active < self.workers and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may already have been handed to us; pass it on
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot over directly; _active stays the same
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def _user_lock(self, key):
+        entry = self._user_locks.get(key)
+        if entry is None:
+            entry = self._user_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _drop_user_lock(self, key):
+        entry = self._user_locks.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._user_locks[key]
+
+    async def do_process_update(self, update, coroutine) -> None:
+        priority = classify(update, self._is_chatting)
+        if self._should_shed(priority):
+            await self._shed(update, coroutine)
+            return
+
+        user = update.effective_user if isinstance(update, Update) else None
+        key = user.id if user else None
+        lock = self._user_lock(key) if key is not None else None
+        self._pending += 1
+        started = False
+        queued_at = time.perf_counter()
+        try:
+            if lock is not None:
+                await lock.acquire()
+            try:
+                await self._acquire_slot(priority)
+                self._pending -= 1
+                started = True
+                # Handlers awaited below share this context, so they see the trace ID
+                tracing.new_trace()
+                wait_ms = round((time.perf_counter() - queued_at) * 1000, 2)
+                started_at = time.perf_counter()
+                try:
+                    with tracing.span('update', user=key, priority=priority, wait_ms=wait_ms):
+                        await coroutine
+                finally:
+                    self.latencies.append((time.perf_counter() - started_at) * 1000)
+                    self._release_slot()
+            finally:
+                if lock is not None:
+                    lock.release()
+        finally:
+            if not started:
+                self._pending -= 1
+                coroutine.close()
+            if key is not None:
+                self._drop_user_lock(key)